@@ -0,0 +1,70 @@
+"""
+比较 :class:`~fastNLP.models.BiaffineParser` 中几种树解码算法在随机分数上每个batch的平均耗时::
+
+    python benchmarks/mst_benchmark.py --device cuda:0 --batch-size 64 --max-len 60
+
+mst 为原来逐句调用 ``_mst`` 的解码; mst_parallel 在 ``--num-workers`` 个进程中并行调用 ``_mst``;
+eisner 在整个batch上用tensor运算解码, 只输出projective的树。
+"""
+import argparse
+import os
+import time
+
+import torch
+
+from fastNLP.models.biaffine_parser import GraphParser
+
+
+def prepare_batches(num_batches, batch_size, max_len, device):
+    batches = []
+    for _ in range(num_batches):
+        seq_len = torch.randint(2, max_len + 1, (batch_size,), device=device)
+        seq_len[0] = max_len
+        mask = (torch.arange(max_len, device=device)[None, :] < seq_len[:, None]).long()
+        scores = torch.randn(batch_size, max_len, max_len, device=device)
+        batches.append((scores, mask))
+    return batches
+
+
+def run(decode, batches, device):
+    decode(*batches[0])  # 预热, 同时创建进程池
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+    start = time.time()
+    for scores, mask in batches:
+        decode(scores, mask)
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+    return (time.time() - start) / len(batches)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--device', default='cuda:0' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--num-batches', type=int, default=20)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--max-len', type=int, default=60)
+    parser.add_argument('--num-workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    batches = prepare_batches(args.num_batches, args.batch_size, args.max_len, device)
+
+    decoders = [
+        ('mst', GraphParser.mst_decoder),
+        ('mst_parallel(num_workers={})'.format(args.num_workers),
+         lambda scores, mask: GraphParser.mst_decoder(scores, mask, num_workers=args.num_workers)),
+        ('eisner', GraphParser.eisner_decoder),
+    ]
+    base = None
+    for name, decode in decoders:
+        cost = run(decode, batches, device)
+        if base is None:
+            base = cost
+            print("{}: {:.2f} ms/batch".format(name, cost * 1000))
+        else:
+            print("{}: {:.2f} ms/batch, {:.2f}x speedup".format(name, cost * 1000, base / cost))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+比较 :class:`~fastNLP.AutoPadder` 与逐行赋值的padding方式在一个batch上的平均耗时::
+
+    python benchmarks/padder_benchmark.py --batch-size 128 --max-len 50 --repeat 20
+
+分别测试由list、numpy.ndarray、torch.Tensor组成的一维(词)以及二维(字符)的输入。
+"""
+import argparse
+import time
+
+import numpy as np
+import torch
+
+from fastNLP import AutoPadder
+
+
+def loop_pad(contents, pad_val, dtype, dim):
+    # 逐行赋值的padding方式
+    max_len = max(map(len, contents))
+    if dim == 1:
+        shape = (len(contents), max_len)
+    else:
+        shape = (len(contents), max_len, max([max([len(word) for word in sent]) for sent in contents]))
+    if isinstance(dtype, torch.dtype):
+        array = torch.full(shape, fill_value=pad_val, dtype=dtype)
+        to_row = torch.as_tensor
+    else:
+        array = np.full(shape, pad_val, dtype=dtype)
+        to_row = lambda row: row
+    for i, content_i in enumerate(contents):
+        if dim == 1:
+            array[i, :len(content_i)] = to_row(content_i)
+        else:
+            for j, content_ii in enumerate(content_i):
+                array[i, j, :len(content_ii)] = to_row(content_ii)
+    return array
+
+
+def timeit(func, repeat):
+    start = time.time()
+    for _ in range(repeat):
+        result = func()
+    return result, (time.time() - start) / repeat
+
+
+def compare(name, contents, dtype, dim, repeat):
+    padder = AutoPadder(pad_val=-1)
+    expected, loop_time = timeit(lambda: loop_pad(contents, -1, dtype, dim), repeat)
+    padded, vectorized_time = timeit(lambda: padder(contents, None, dtype, dim), repeat)
+    assert padded.tolist() == expected.tolist()
+    print("{}: loop {:.2f} ms, AutoPadder {:.2f} ms, {:.2f}x speedup".format(
+        name, loop_time * 1000, vectorized_time * 1000, loop_time / vectorized_time))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch-size', type=int, default=128)
+    parser.add_argument('--max-len', type=int, default=50)
+    parser.add_argument('--max-word-len', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    words = [np.random.randint(1, 100, size=np.random.randint(1, args.max_len)).tolist()
+             for _ in range(args.batch_size)]
+    chars = [[np.random.randint(1, 27, size=np.random.randint(1, args.max_word_len)).tolist() for _ in word]
+             for word in words]
+    compare("dim-1 list", words, int, 1, args.repeat)
+    compare("dim-1 ndarray", [np.array(word) for word in words], np.int64, 1, args.repeat)
+    compare("dim-1 tensor", [torch.tensor(word) for word in words], torch.int64, 1, args.repeat)
+    compare("dim-2 list", chars, int, 2, args.repeat)
+    compare("dim-2 tensor", [[torch.tensor(c) for c in word] for word in chars], torch.int64, 2,
+            max(1, args.repeat // 10))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+比较使用与不使用 :class:`~fastNLP.PrefetchIter` 时每个训练step的平均耗时::
+
+    python benchmarks/prefetch_benchmark.py --device cuda:0 --num-prefetch 2
+
+有gpu时 PrefetchIter 会在后台线程中完成 collate、pin memory 以及到gpu的异步拷贝；在cpu上只有 collate 与计算重叠。
+"""
+import argparse
+import time
+
+import numpy as np
+import torch
+from torch import nn
+
+from fastNLP import DataSet, DataSetIter, PrefetchIter, RandomSampler
+
+
+def prepare_dataset(num_samples, max_len, vocab_size):
+    seq_lens = np.random.randint(max_len // 4, max_len, size=num_samples)
+    words = [np.random.randint(1, vocab_size, size=seq_len).tolist() for seq_len in seq_lens]
+    data_set = DataSet({'words': words, 'seq_len': seq_lens.tolist(),
+                        'target': np.random.randint(2, size=num_samples).tolist()})
+    data_set.set_input('words', 'seq_len')
+    data_set.set_target('target')
+    return data_set
+
+
+class Model(nn.Module):
+    def __init__(self, vocab_size, hidden_size):
+        super().__init__()
+        self.embed = nn.Embedding(vocab_size, hidden_size)
+        self.lstm = nn.LSTM(hidden_size, hidden_size, batch_first=True)
+        self.fc = nn.Linear(hidden_size, 2)
+
+    def forward(self, words, seq_len):
+        output, _ = self.lstm(self.embed(words))
+        return self.fc(output.max(dim=1)[0])
+
+
+def run(data_iter, model, optimizer, device, num_steps):
+    step = 0
+    start = None
+    while step < num_steps:
+        for batch_x, batch_y in data_iter:
+            if step == 1:  # 第一个step包含cudnn等的初始化，不计入
+                if device.type == 'cuda':
+                    torch.cuda.synchronize(device)
+                start = time.time()
+            for batch in (batch_x, batch_y):
+                for key, value in batch.items():
+                    batch[key] = value.to(device, non_blocking=True)
+            loss = nn.functional.cross_entropy(model(**batch_x), batch_y['target'])
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            step += 1
+            if step == num_steps:
+                break
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+    return (time.time() - start) / (num_steps - 1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--device', default='cuda:0' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--num-samples', type=int, default=20000)
+    parser.add_argument('--max-len', type=int, default=256)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--hidden-size', type=int, default=256)
+    parser.add_argument('--num-steps', type=int, default=200)
+    parser.add_argument('--num-prefetch', type=int, default=2)
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    vocab_size = 10000
+    data_set = prepare_dataset(args.num_samples, args.max_len, vocab_size)
+    model = Model(vocab_size, args.hidden_size).to(device)
+    optimizer = torch.optim.Adam(model.parameters())
+    pin_memory = device.type == 'cuda'
+
+    data_iter = DataSetIter(data_set, batch_size=args.batch_size, sampler=RandomSampler(), pin_memory=pin_memory)
+    base = run(data_iter, model, optimizer, device, args.num_steps)
+    print("without prefetch: {:.2f} ms/step".format(base * 1000))
+
+    data_iter = PrefetchIter(DataSetIter(data_set, batch_size=args.batch_size, sampler=RandomSampler()),
+                             num_prefetch=args.num_prefetch, device=device)
+    prefetch = run(data_iter, model, optimizer, device, args.num_steps)
+    print("with prefetch(num_prefetch={}): {:.2f} ms/step, {:.1%} less step time".format(
+        args.num_prefetch, prefetch * 1000, 1 - prefetch / base))
+
+
+if __name__ == '__main__':
+    main()
@@ -16,12 +16,15 @@ __all__ = [
     "DataSetIter",
     "BatchIter",
     "TorchLoaderIter",
+    "OnlineDataIter",
+    "PrefetchIter",
 
     "Vocabulary",
     "DataSet",
     "Const",
     
     "Trainer",
+    "DistTrainer",
     "Tester",
     
     "Callback",
@@ -30,6 +33,7 @@ __all__ = [
     "TensorboardCallback",
     "LRScheduler",
     "ControlC",
+    "ProfilerCallback",
     
     "Padder",
     "AutoPadder",
@@ -47,6 +51,10 @@ __all__ = [
     "SequentialSampler",
     "BucketSampler",
     "RandomSampler",
+    "SortedSampler",
+    "ConstTokenNumSampler",
+    "DistributedSampler",
+    "DistributedBatchSampler",
     
     "LossFunc",
     "CrossEntropyLoss",
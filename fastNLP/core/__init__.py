@@ -14,8 +14,9 @@ core 模块里实现了 fastNLP 的核心框架，常用的功能都可以从 fa
     介绍core 的子模块的分工，好像必要性不大
     
 """
-from .batch import DataSetIter, BatchIter, TorchLoaderIter
-from .callback import Callback, GradientClipCallback, EarlyStopCallback, TensorboardCallback, LRScheduler, ControlC
+from .batch import DataSetIter, BatchIter, TorchLoaderIter, OnlineDataIter, PrefetchIter
+from .callback import Callback, GradientClipCallback, EarlyStopCallback, TensorboardCallback, LRScheduler, ControlC, \
+    ProfilerCallback
 from .const import Const
 from .dataset import DataSet
 from .field import FieldArray, Padder, AutoPadder, EngChar2DPadder
@@ -23,8 +24,10 @@ from .instance import Instance
 from .losses import LossFunc, CrossEntropyLoss, L1Loss, BCELoss, NLLLoss, LossInForward
 from .metrics import AccuracyMetric, SpanFPreRecMetric, ExtractiveQAMetric
 from .optimizer import Optimizer, SGD, Adam
-from .sampler import SequentialSampler, BucketSampler, RandomSampler, Sampler
+from .sampler import SequentialSampler, BucketSampler, RandomSampler, SortedSampler, Sampler, ConstTokenNumSampler, \
+    DistributedSampler, DistributedBatchSampler
 from .tester import Tester
 from .trainer import Trainer
+from .dist_trainer import DistTrainer
 from .utils import cache_results, seq_len_to_mask
 from .vocabulary import Vocabulary
@@ -5,10 +5,14 @@ batch 模块实现了 fastNLP 所需的 Batch 类。
 __all__ = [
     "DataSetIter",
     "TorchLoaderIter",
+    "OnlineDataIter",
+    "PrefetchIter",
 ]
 
 import atexit
-from queue import Empty, Full
+import threading
+from itertools import islice
+from queue import Empty, Full, Queue
 
 import numpy as np
 import torch
@@ -16,8 +20,9 @@ import torch.multiprocessing as mp
 import torch.utils.data
 from numbers import Number
 
-from .sampler import SequentialSampler
+from .sampler import SequentialSampler, DistributedSampler
 from .dataset import DataSet
+from .instance import Instance
 
 _python_is_exit = False
 
@@ -41,8 +46,9 @@ class DataSetGetter:
     def __getitem__(self, idx: int):
         # mapping idx to sampled idx
         idx = self.idx_list[idx]
-        inputs = {n:f.get(idx) for n, f in self.inputs.items()}
-        targets = {n:f.get(idx) for n, f in self.targets.items()}
+        # columnar的field在collate_fn中直接从buffer取出整个batch
+        inputs = {n:f.get(idx) for n, f in self.inputs.items() if not f.columnar}
+        targets = {n:f.get(idx) for n, f in self.targets.items() if not f.columnar}
         return idx, inputs, targets
 
     def __len__(self):
@@ -63,6 +69,8 @@ class DataSetGetter:
         def pad_batch(batch_dict, field_array):
             for n, vlist in batch_dict.items():
                 f = field_array[n]
+                if f.columnar:
+                    vlist = f.content.take(indices)
                 if f.padder is None:
                     batch_dict[n] = np.array(vlist)
                 else:
@@ -96,9 +104,29 @@ class SamplerAdapter(torch.utils.data.Sampler):
     def __init__(self, sampler, dataset):
         self.sampler = sampler
         self.dataset = dataset
+        self.indices = None  # 当前epoch的完整顺序，用于保存checkpoint
+        self._resume = None
 
     def __iter__(self):
-        return iter(self.sampler(self.dataset))
+        if self._resume is None:
+            self.indices = self.sampler(self.dataset)
+            start = 0
+        else:
+            (self.indices, start), self._resume = self._resume, None
+        return iter(self.indices[start:])
+
+    def resume(self, indices, start):
+        """下一次迭代时使用indices作为顺序，并从第start个开始"""
+        self._resume = (list(indices), start)
+
+
+class BatchSamplerAdapter(SamplerAdapter):
+    def __init__(self, batch_sampler, dataset):
+        super().__init__(batch_sampler, dataset)
+        self.batch_sampler = batch_sampler
+
+    def __len__(self):
+        return self.batch_sampler.get_num_batches(self.dataset)
 
 
 class BatchIter:
@@ -107,10 +135,29 @@ class BatchIter:
         self.num_batches = None
         self.cur_batch_indices = None
         self.batch_size = None
+        self._num_skip_batches = 0
 
     def init_iter(self):
         pass
 
+    def get_epoch_indices(self):
+        """
+        返回当前epoch取数据的顺序，用于在checkpoint中保存。不支持时返回None
+
+        :return: list, None
+        """
+        return None
+
+    def resume_epoch(self, indices, num_consumed_batches):
+        """
+        使下一次迭代从某个epoch的中间开始，用于从checkpoint恢复训练。
+
+        :param list indices: 由 :meth:`get_epoch_indices` 得到的该epoch的顺序
+        :param int num_consumed_batches: 该epoch已经训练过的batch数量，下一次迭代会跳过这些batch
+        """
+        # 无法恢复顺序时，只能在下一次迭代时读取并丢弃已经训练过的batch
+        self._num_skip_batches = num_consumed_batches
+
     @staticmethod
     def get_num_batches(num_samples, batch_size, drop_last):
         num_batches = num_samples // batch_size
@@ -120,7 +167,11 @@ class BatchIter:
 
     def __iter__(self):
         self.init_iter()
-        for indices, batch_x, batch_y in self.dataiter:
+        batches = iter(self.dataiter)
+        if self._num_skip_batches > 0:
+            batches = islice(batches, self._num_skip_batches, None)
+            self._num_skip_batches = 0
+        for indices, batch_x, batch_y in batches:
             self.cur_batch_indices = indices
             yield batch_x, batch_y
 
@@ -160,22 +211,55 @@ class DataSetIter(BatchIter):
     :param bool drop_last: 如果最后一个batch没有batch_size这么多sample，就扔掉最后一个
     :param timeout:
     :param worker_init_fn: 在每个worker启动时调用该函数，会传入一个值，该值是worker的index。
+    :param batch_sampler: 直接产生每个batch下标的sampler，比如 :class:`~fastNLP.ConstTokenNumSampler` 。传入时
+        batch_size, sampler与drop_last无效。
     """
     def __init__(self, dataset, batch_size=1, sampler=None, as_numpy=False,
                  num_workers=0, pin_memory=False, drop_last=False,
-                 timeout=0, worker_init_fn=None):
+                 timeout=0, worker_init_fn=None, batch_sampler=None):
         super().__init__()
         assert isinstance(dataset, DataSet)
-        sampler = SamplerAdapter(sampler=sampler or SequentialSampler(), dataset=dataset)
+        num_samples = len(dataset)
+        if batch_sampler is not None:
+            batch_sampler = BatchSamplerAdapter(batch_sampler=batch_sampler, dataset=dataset)
+            sampler = None
+        else:
+            if isinstance(sampler, DistributedSampler):  # 每个进程只会取到一部分样本
+                num_samples = sampler.get_num_samples(num_samples)
+            sampler = SamplerAdapter(sampler=sampler or SequentialSampler(), dataset=dataset)
         dataset = DataSetGetter(dataset, as_numpy)
         collate_fn = dataset.collate_fn if hasattr(dataset, 'collate_fn') else None
-        self.dataiter = torch.utils.data.DataLoader(
-            dataset=dataset, batch_size=batch_size, sampler=sampler,
-            collate_fn=collate_fn, num_workers=num_workers,
-            pin_memory=pin_memory, drop_last=drop_last,
-            timeout=timeout, worker_init_fn=worker_init_fn)
-        self.num_batches = self.get_num_batches(len(dataset), batch_size, drop_last)
-        self.batch_size = batch_size
+        if batch_sampler is not None:
+            self.dataiter = torch.utils.data.DataLoader(
+                dataset=dataset, batch_sampler=batch_sampler,
+                collate_fn=collate_fn, num_workers=num_workers,
+                pin_memory=pin_memory, timeout=timeout, worker_init_fn=worker_init_fn)
+            self.num_batches = len(batch_sampler)
+            self.batch_size = None
+        else:
+            self.dataiter = torch.utils.data.DataLoader(
+                dataset=dataset, batch_size=batch_size, sampler=sampler,
+                collate_fn=collate_fn, num_workers=num_workers,
+                pin_memory=pin_memory, drop_last=drop_last,
+                timeout=timeout, worker_init_fn=worker_init_fn)
+            self.num_batches = self.get_num_batches(num_samples, batch_size, drop_last)
+            self.batch_size = batch_size
+        self._sampler_adapter = batch_sampler if batch_sampler is not None else sampler
+
+    def get_epoch_indices(self):
+        indices = self._sampler_adapter.indices
+        if indices is None:
+            return None
+        if self.batch_size is None:  # 使用batch_sampler时为每个batch的下标组成的list
+            return [np.asarray(batch).tolist() for batch in indices]
+        return np.asarray(indices).tolist()
+
+    def resume_epoch(self, indices, num_consumed_batches):
+        if self.batch_size is None:
+            start = num_consumed_batches
+        else:
+            start = num_consumed_batches * self.batch_size
+        self._sampler_adapter.resume(indices, start)
 
 
 class TorchLoaderIter(BatchIter):
@@ -187,17 +271,256 @@ class TorchLoaderIter(BatchIter):
         self.batch_size = dataset.batch_size
 
 
-class OnlineDataGettter:
-    # TODO
-    pass
+class OnlineDataGettter(torch.utils.data.IterableDataset):
+    """
+    从生成器中逐个读取 :class:`~fastNLP.Instance` ，经过打乱缓冲区后每 ``batch_size`` 个组成一个小的
+    :class:`~fastNLP.DataSet` ，然后复用 :class:`DataSetGetter` 的 collate_fn 进行 padding。
+    多个 worker 时，第 k 个 worker 只处理数据流中下标模 num_workers 为 k 的 instance。
+    """
+    def __init__(self, dataset, batch_size, buffer_size, shuffle, drop_last, as_numpy,
+                 input_fields, target_fields, padders, vocabs, transform):
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.buffer_size = buffer_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.as_numpy = as_numpy
+        self.input_fields = list(input_fields)
+        self.target_fields = list(target_fields)
+        self.padders = padders
+        self.vocabs = vocabs
+        self.transform = transform
+
+    def _iter_instances(self):
+        source = enumerate(self.dataset() if callable(self.dataset) else self.dataset)
+        worker_info = torch.utils.data.get_worker_info()
+        if worker_info is not None and worker_info.num_workers > 1:
+            source = islice(source, worker_info.id, None, worker_info.num_workers)
+        for idx, ins in source:
+            if isinstance(ins, dict):
+                ins = Instance(**ins)
+            if self.transform is not None:
+                ins = self.transform(ins)
+                if ins is None:  # transform返回None表示丢弃该instance
+                    continue
+            yield idx, ins
+
+    def _shuffle(self, instances):
+        buffer = []
+        for ins in instances:
+            if len(buffer) < self.buffer_size:
+                buffer.append(ins)
+                continue
+            idx = np.random.randint(len(buffer))
+            yield buffer[idx]
+            buffer[idx] = ins
+        np.random.shuffle(buffer)
+        yield from buffer
+
+    def _make_batch(self, indices, instances):
+        dataset = DataSet(instances)
+        for field_name, vocab in self.vocabs.items():
+            vocab.index_dataset(dataset, field_name=field_name)
+        dataset.set_input(*self.input_fields)
+        dataset.set_target(*self.target_fields)
+        for field_name, padder in self.padders.items():
+            dataset.set_padder(field_name, padder)
+        getter = DataSetGetter(dataset, self.as_numpy)
+        _, batch_x, batch_y = getter.collate_fn([getter[i] for i in range(len(dataset))])
+        return indices, batch_x, batch_y
+
+    def __iter__(self):
+        instances = self._iter_instances()
+        if self.shuffle and self.buffer_size > 1:
+            instances = self._shuffle(instances)
+        indices, batch = [], []
+        for idx, ins in instances:
+            indices.append(idx)
+            batch.append(ins)
+            if len(batch) == self.batch_size:
+                yield self._make_batch(indices, batch)
+                indices, batch = [], []
+        if len(batch) > 0 and not self.drop_last:
+            yield self._make_batch(indices, batch)
+
+
+def _online_collate_fn(batch):
+    # OnlineDataGettter已经组好了batch
+    return batch
 
 
 class OnlineDataIter(BatchIter):
-    # TODO
-    def __init__(self, dataset, batch_size=1, buffer_size=10000, sampler=None, as_numpy=False,
+    """
+    别名：:class:`fastNLP.OnlineDataIter` :class:`fastNLP.core.batch.OnlineDataIter`
+
+    OnlineDataIter 以流式的方式从生成器中读取数据并组成 batch，整个过程中不会构建包含全部数据的 :class:`~fastNLP.DataSet` ，
+    适用于无法全部读入内存的大规模数据。可以直接作为 :class:`~fastNLP.Trainer` 的 ``train_data`` 使用::
+
+        loader = CSVLoader(headers=['raw_words', 'target'], sep='\t')
+        data_iter = OnlineDataIter(lambda: loader.load_iter('path/to/train.tsv'), batch_size=32,
+                                   transform=tokenize, vocabs={'words': vocab, 'target': target_vocab},
+                                   input_fields=['words', 'seq_len'], target_fields=['target'])
+        trainer = Trainer(train_data=data_iter, model=model, ...)
+
+    由于事先不知道数据的数量, ``len(data_iter)`` 为 ``None`` (除非传入了 ``num_batches`` )。
+
+    :param dataset: 产生 :class:`~fastNLP.Instance` 或 dict 的可迭代对象。如果需要迭代多个epoch，请传入一个每次调用都返回
+        新的生成器的函数，比如 ``lambda: loader.load_iter(path)`` 。
+    :param int batch_size: 取出的batch大小
+    :param int buffer_size: 打乱数据时使用的缓冲区大小，缓冲区越大打乱得越充分，但占用的内存也越多
+    :param bool shuffle: 是否在缓冲区内打乱数据
+    :param bool as_numpy: 若为 ``True`` , 输出batch为 numpy.array. 否则为 :class:`torch.Tensor`.
+    :param int num_workers: 使用多少个进程来预处理数据。每个进程都会调用一次 ``dataset`` ，并只保留属于自己的那部分instance。
+    :param bool pin_memory: 是否将产生的tensor使用pin memory, 可能会加快速度。
+    :param bool drop_last: 如果最后一个batch没有batch_size这么多sample，就扔掉最后一个
+    :param timeout:
+    :param worker_init_fn: 在每个worker启动时调用该函数，会传入一个值，该值是worker的index。
+    :param input_fields: 需要作为input的field名称
+    :param target_fields: 需要作为target的field名称
+    :param dict padders: field_name到 :class:`~fastNLP.Padder` 的映射，未指定的field使用默认的 :class:`~fastNLP.AutoPadder`
+    :param dict vocabs: field_name到 :class:`~fastNLP.Vocabulary` 的映射，组成batch时会使用对应的vocab将该field转为index
+    :param callable transform: 在每个instance进入缓冲区之前调用，传入 :class:`~fastNLP.Instance` ，返回处理后的
+        :class:`~fastNLP.Instance` ；返回 ``None`` 则丢弃该instance
+    :param int num_batches: 每个epoch的batch数量，如果已知可以传入，用于显示进度。
+    """
+    def __init__(self, dataset, batch_size=1, buffer_size=10000, shuffle=True, as_numpy=False,
                  num_workers=0, pin_memory=False, drop_last=False,
-                 timeout=0, worker_init_fn=None, **kwargs):
+                 timeout=0, worker_init_fn=None, input_fields=(), target_fields=(),
+                 padders=None, vocabs=None, transform=None, num_batches=None):
         super().__init__()
+        dataset = OnlineDataGettter(dataset, batch_size=batch_size, buffer_size=buffer_size, shuffle=shuffle,
+                                    drop_last=drop_last, as_numpy=as_numpy, input_fields=input_fields,
+                                    target_fields=target_fields, padders=padders or {}, vocabs=vocabs or {},
+                                    transform=transform)
+        self.dataiter = torch.utils.data.DataLoader(
+            dataset=dataset, batch_size=None, collate_fn=_online_collate_fn,
+            num_workers=num_workers, pin_memory=pin_memory,
+            timeout=timeout, worker_init_fn=worker_init_fn)
+        self.num_batches = num_batches
+        self.batch_size = batch_size
+
+
+_PREFETCH_END = object()
+
+
+def _pin_and_move(batch, device, non_blocking):
+    for key, value in batch.items():
+        if isinstance(value, torch.Tensor):
+            if non_blocking and not value.is_pinned():
+                value = value.pin_memory()
+            batch[key] = value.to(device, non_blocking=non_blocking)
+
+
+class PrefetchIter(BatchIter):
+    """
+    别名：:class:`fastNLP.PrefetchIter` :class:`fastNLP.core.batch.PrefetchIter`
+
+    PrefetchIter 包裹一个 :class:`BatchIter` ，在后台线程中提前取出之后的 ``num_prefetch`` 个 batch，使得 pad、
+    collate 以及数据搬运与当前 step 的计算重叠::
+
+        data_iter = PrefetchIter(DataSetIter(data_set, batch_size=32), num_prefetch=2, device='cuda:0')
+        for batch_x, batch_y in data_iter:
+            # batch_x, batch_y 中的tensor已经在cuda:0上
+            ...
+
+    当 ``device`` 为gpu时，后台线程会将tensor放入pin memory，并在单独的cuda stream上以 ``non_blocking=True`` 的方式
+    拷贝到 ``device`` 中，主线程取出batch时只需等待对应的拷贝完成；当 ``device`` 为None或cpu时，只在后台线程中提前进行
+    collate。 :class:`~fastNLP.Trainer` 与 :class:`~fastNLP.Tester` 的 ``num_prefetch`` 参数大于0时会自动使用该类。
+
+    :param batch_iter: 被包裹的 :class:`BatchIter` ，比如 :class:`DataSetIter`
+    :param int num_prefetch: 最多提前准备多少个batch
+    :param str,torch.device,None device: 将batch中的tensor提前搬运到哪个设备上。为None时不搬运。
+    """
+    def __init__(self, batch_iter, num_prefetch=2, device=None):
+        super().__init__()
+        if not isinstance(batch_iter, BatchIter):
+            raise TypeError("batch_iter should be fastNLP.BatchIter, got {}.".format(type(batch_iter)))
+        if num_prefetch < 1:
+            raise ValueError("num_prefetch must be no less than 1.")
+        self.batch_iter = batch_iter
+        self.num_prefetch = int(num_prefetch)
+        self.device = torch.device(device) if device is not None else None
+        self.num_batches = batch_iter.num_batches
+        self.batch_size = batch_iter.batch_size
+
+    @property
+    def dataset(self):
+        return self.batch_iter.dataset
+
+    def get_epoch_indices(self):
+        return self.batch_iter.get_epoch_indices()
+
+    def resume_epoch(self, indices, num_consumed_batches):
+        self.batch_iter.resume_epoch(indices, num_consumed_batches)
+
+    def _use_cuda(self):
+        return self.device is not None and self.device.type == 'cuda' and torch.cuda.is_available()
+
+    def _produce(self, batch_queue, stop_event):
+        def put(item):
+            while not stop_event.is_set():
+                try:
+                    batch_queue.put(item, timeout=0.1)
+                    return True
+                except Full:
+                    continue
+            return False
+
+        try:
+            stream = None
+            if self._use_cuda():
+                torch.cuda.set_device(self.device)
+                stream = torch.cuda.Stream(self.device)
+            for batch_x, batch_y in self.batch_iter:
+                indices = self.batch_iter.get_batch_indices()
+                event = None
+                if stream is not None:
+                    with torch.cuda.stream(stream):
+                        _pin_and_move(batch_x, self.device, non_blocking=True)
+                        _pin_and_move(batch_y, self.device, non_blocking=True)
+                    event = torch.cuda.Event()
+                    event.record(stream)
+                elif self.device is not None:
+                    _pin_and_move(batch_x, self.device, non_blocking=False)
+                    _pin_and_move(batch_y, self.device, non_blocking=False)
+                if not put((indices, batch_x, batch_y, event)):
+                    return
+            put(_PREFETCH_END)
+        except BaseException as e:
+            put(e)
+
+    def __iter__(self):
+        batch_queue = Queue(maxsize=self.num_prefetch)
+        stop_event = threading.Event()
+        thread = threading.Thread(target=self._produce, args=(batch_queue, stop_event), daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = batch_queue.get()
+                if item is _PREFETCH_END:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                indices, batch_x, batch_y, event = item
+                if event is not None:
+                    current_stream = torch.cuda.current_stream(self.device)
+                    current_stream.wait_event(event)
+                    # 这些tensor是在后台stream上分配的，需要告知caching allocator它们也会在当前stream上被使用
+                    for batch in (batch_x, batch_y):
+                        for value in batch.values():
+                            if isinstance(value, torch.Tensor) and value.is_cuda:
+                                value.record_stream(current_stream)
+                self.cur_batch_indices = indices
+                yield batch_x, batch_y
+        finally:
+            # 提前退出(比如break或者出现异常)时，通知后台线程停止
+            stop_event.set()
+            while thread.is_alive():
+                try:
+                    batch_queue.get(timeout=0.1)
+                except Empty:
+                    pass
+            thread.join()
 
 
 def _to_tensor(batch, field_dtype):
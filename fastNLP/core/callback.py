@@ -57,17 +57,22 @@ __all__ = [
     "FitlogCallback",
     "LRScheduler",
     "ControlC",
+    "ProfilerCallback",
     
     "CallbackException",
     "EarlyStopError"
 ]
 
+import json
 import os
+import time
 
 import torch
 from copy import deepcopy
 import sys
 from .utils import _save_model
+from .utils import _get_model_device
+from .utils import _ModelSnapshot
 
 try:
     from tensorboardX import SummaryWriter
@@ -143,6 +148,22 @@ class Callback(object):
         """正在被Trainer训练的模型"""
         return self._trainer.model
     
+    @property
+    def valid_model(self):
+        """得到最近一次验证结果的模型。通常即为self.model; 在Trainer的async_validation为True时是验证所使用的cpu上的快照，
+        self.model此时已经又训练了若干个step"""
+        return self._trainer.valid_model
+    
+    @property
+    def valid_epoch(self):
+        """最近一次验证在哪个epoch开始"""
+        return self._trainer.valid_epoch
+    
+    @property
+    def valid_step(self):
+        """最近一次验证在哪个step开始"""
+        return self._trainer.valid_step
+    
     @property
     def pbar(self):
         """如果在Callback中需要打印内容，请使用self.pbar.write(str)。否则可能出现命令行显示效果不太好的问题。在
@@ -270,6 +291,23 @@ class Callback(object):
         """
         pass
 
+    def state_dict(self):
+        """
+        返回该Callback需要保存在checkpoint中的状态，从checkpoint恢复训练时会传给 :meth:`load_state_dict` 。
+        有状态的Callback(比如计数器、lr_scheduler)需要覆盖这两个方法。
+
+        :return: dict
+        """
+        return {}
+
+    def load_state_dict(self, state):
+        """
+        恢复由 :meth:`state_dict` 返回的状态
+
+        :param dict state:
+        """
+        pass
+
 
 def _transfer(func):
     """装饰器，将对CallbackManager的调用转发到各个Callback子类.
@@ -365,12 +403,23 @@ class CallbackManager(Callback):
     def on_exception(self, exception):
         pass
 
+    def state_dict(self):
+        return [callback.state_dict() for callback in self.callbacks]
+
+    def load_state_dict(self, state):
+        if len(state) != len(self.callbacks):
+            raise RuntimeError("The checkpoint has states of {} callbacks, but got {} callbacks.".format(
+                len(state), len(self.callbacks)))
+        for callback, callback_state in zip(self.callbacks, state):
+            callback.load_state_dict(callback_state)
+
 
 class GradientClipCallback(Callback):
     """
     别名：:class:`fastNLP.GradientClipCallback` :class:`fastNLP.core.callback.GradientClipCallback`
 
-    每次backward前，将parameter的gradient clip到某个范围。
+    每次backward前，将parameter的gradient clip到某个范围。如果Trainer使用了fp16的GradScaler，会先将gradient unscale
+    再进行clip。
 
     :param None,torch.Tensor,List[torch.Tensor] parameters: 一般通过model.parameters()获得。
         如果为None则默认对Trainer的model中所有参数进行clip
@@ -402,6 +451,9 @@ class GradientClipCallback(Callback):
     
     def on_backward_end(self):
         if self.step%self.update_every==0:
+            grad_scaler = getattr(self.trainer, 'grad_scaler', None)
+            if grad_scaler is not None:
+                grad_scaler.unscale_(self.optimizer)
             if self.parameters is None:
                 self.clip_fun(self.model.parameters(), self.clip_value)
             else:
@@ -431,6 +483,12 @@ class EarlyStopCallback(Callback):
                 self.wait += 1
         else:
             self.wait = 0
+
+    def state_dict(self):
+        return {'wait': self.wait}
+
+    def load_state_dict(self, state):
+        self.wait = state['wait']
     
     def on_exception(self, exception):
         if isinstance(exception, EarlyStopError):
@@ -554,6 +612,12 @@ class LRScheduler(Callback):
     def on_epoch_end(self):
         self.scheduler.step(self.epoch)
 
+    def state_dict(self):
+        return {'scheduler': self.scheduler.state_dict()}
+
+    def load_state_dict(self, state):
+        self.scheduler.load_state_dict(state['scheduler'])
+
 
 class ControlC(Callback):
     """
@@ -801,6 +865,8 @@ class SaveModelCallback(Callback):
     :param int top: 保存dev表现top多少模型。-1为保存所有模型。
     :param bool only_param: 是否只保存模型d饿权重。
     :param save_on_exception: 发生exception时，是否保存一份发生exception的模型。模型名称为epoch:x_step:x_Exception:{exception_name}.
+
+    模型先被复制到cpu上一份预先分配好的快照中，再在后台线程中写入磁盘，不会阻塞训练。
     """
     def __init__(self, save_dir, top=3, only_param=False, save_on_exception=False):
         super().__init__()
@@ -816,10 +882,14 @@ class SaveModelCallback(Callback):
 
         self.only_param = only_param
         self.save_on_exception = save_on_exception
+        self._snapshot = _ModelSnapshot()
 
     def on_train_begin(self):
         self.save_dir = os.path.join(self.save_dir, self.trainer.start_time)
 
+    def on_train_end(self):
+        self._snapshot.wait()
+
     def on_valid_end(self, eval_result, metric_key, optimizer, is_better_eval):
         metric_value = list(eval_result.values())[0][metric_key]
         self._save_this_model(metric_value)
@@ -844,15 +914,19 @@ class SaveModelCallback(Callback):
         return save_pair, delete_pair
 
     def _save_this_model(self, metric_value):
-        name = "epoch:{}_step:{}_{}:{:.6f}.pt".format(self.epoch, self.step, self.trainer.metric_key, metric_value)
+        # 保存得到该验证结果的模型, 后台验证时与正在训练的self.model不同
+        name = "epoch:{}_step:{}_{}:{:.6f}.pt".format(self.valid_epoch, self.valid_step, self.trainer.metric_key,
+                                                       metric_value)
         save_pair, delete_pair = self._insert_into_ordered_save_models((metric_value, name))
         if save_pair:
             try:
-                _save_model(self.model, model_name=name, save_dir=self.save_dir, only_param=self.only_param)
+                self._snapshot.update(self.valid_model)
+                self._snapshot.save(os.path.join(self.save_dir, name), only_param=self.only_param)
             except Exception as e:
                 print(f"The following exception:{e} happens when save model to {self.save_dir}.")
         if delete_pair:
             try:
+                self._snapshot.wait()
                 delete_model_path = os.path.join(self.save_dir, delete_pair[1])
                 if os.path.exists(delete_model_path):
                     os.remove(delete_model_path)
@@ -862,9 +936,228 @@ class SaveModelCallback(Callback):
     def on_exception(self, exception):
         if self.save_on_exception:
             name = "epoch:{}_step:{}_Exception:{}.pt".format(self.epoch, self.step, exception.__class__.__name__)
+            self._snapshot.wait()
             _save_model(self.model, model_name=name, save_dir=self.save_dir, only_param=self.only_param)
 
 
+class ProfilerCallback(Callback):
+    """
+    别名：:class:`fastNLP.ProfilerCallback` :class:`fastNLP.core.callback.ProfilerCallback`
+
+    记录训练时每个step各阶段的耗时、吞吐量、padding效率以及显存(内存)峰值，用于定位训练的瓶颈。训练结束时打印汇总表格，
+    汇总结果也可以通过 :attr:`summary` 获取。各阶段由callback的调用时机划分:
+
+    - data: 上一个batch结束到on_batch_begin，包括取batch、pad以及搬运到device
+    - forward: on_batch_begin到on_loss_begin，包括_build_args以及模型的forward
+    - loss: on_loss_begin到on_backward_begin
+    - backward: on_backward_begin到on_backward_end
+    - step: on_backward_end到on_step_end，即参数更新
+    - other: on_step_end到on_batch_end，包括打印loss以及其它callback
+    - valid: on_valid_begin到on_valid_end，不计入step的耗时
+
+    其它callback在同一时机的耗时会计入相邻的阶段。tokens/sec与padding效率需要batch_x(或batch_y)中包含seq_len_field，
+    padding后的token数为batch_size乘以batch_x中二维及以上tensor的最大长度。
+
+    :param str seq_len_field: 表示句子长度的field的名称，不存在时不统计token相关的指标。
+    :param str,None log_path: 每个step的记录以jsonl的格式逐行写入该文件。
+    :param str,None trace_path: 各阶段的时间线以Chrome trace的格式保存到该文件，可以在chrome://tracing或Perfetto中查看。
+    :param tuple(int,int),None torch_profiler_steps: (start, end)，从第start个step的forward开始到第end个step结束(均包含)，
+        使用torch.profiler记录算子级别的耗时。
+    :param str,None torch_trace_path: torch.profiler的结果以Chrome trace的格式保存的路径，默认为
+        'torch_trace_{trainer.start_time}.json'。
+    :param bool synchronize: 模型在gpu上时，是否在每个阶段结束时调用torch.cuda.synchronize()。gpu上的计算是异步的，
+        不同步时该阶段的时间会被计入之后第一个需要同步的阶段(一般是loss的计算)，同步会使训练稍微变慢。
+    """
+    _phase_names = ('data', 'forward', 'loss', 'backward', 'step', 'other')
+
+    def __init__(self, seq_len_field='seq_len', log_path=None, trace_path=None, torch_profiler_steps=None,
+                 torch_trace_path=None, synchronize=True):
+        super().__init__()
+        if torch_profiler_steps is not None:
+            if len(torch_profiler_steps) != 2 or not 0 < torch_profiler_steps[0] <= torch_profiler_steps[1]:
+                raise ValueError("torch_profiler_steps should be (start, end) with 0 < start <= end, got {}.".format(
+                    torch_profiler_steps))
+        self.seq_len_field = seq_len_field
+        self.log_path = log_path
+        self.trace_path = trace_path
+        self.torch_profiler_steps = torch_profiler_steps
+        self.torch_trace_path = torch_trace_path
+        self.synchronize = synchronize
+
+        self.records = []
+        self.summary = None
+        self._use_cuda = False
+        self._phase = None
+        self._mark = None
+        self._start = None
+        self._times = {}
+        self._valid_time = 0
+        self._batch_info = None
+        self._events = []
+        self._log_file = None
+        self._torch_profiler = None
+
+    def _now(self):
+        if self._use_cuda and self.synchronize:
+            torch.cuda.synchronize()
+        return time.perf_counter()
+
+    def _enter(self, phase):
+        # 结束当前的阶段，并开始phase
+        now = self._now()
+        if self._phase is not None:
+            duration = now - self._mark
+            if self._phase == 'valid':
+                self._valid_time += duration
+            else:
+                self._times[self._phase] = self._times.get(self._phase, 0) + duration
+            if self.trace_path is not None:
+                self._events.append({'name': self._phase, 'ph': 'X', 'pid': os.getpid(), 'tid': 0,
+                                     'ts': (self._mark - self._start) * 1e6, 'dur': duration * 1e6,
+                                     'args': {'step': self.step}})
+        self._phase, self._mark = phase, now
+
+    def _peak_memory(self):
+        # 单位为MB
+        if self._use_cuda:
+            return torch.cuda.max_memory_allocated() / 2 ** 20
+        try:
+            import resource
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10  # linux下ru_maxrss的单位为KB
+        except ImportError:
+            return None
+
+    def on_train_begin(self):
+        device = _get_model_device(self.model)
+        self._use_cuda = device is not None and device.type == 'cuda'
+        self._start = self._now()
+        if self.log_path is not None:
+            self._log_file = open(self.log_path, 'w', encoding='utf-8')
+
+    def on_epoch_begin(self):
+        self._phase = None
+        self._times = {}
+        self._enter('data')
+
+    def on_batch_begin(self, batch_x, batch_y, indices):
+        self._enter('forward')
+        if self.torch_profiler_steps is not None and self.step == self.torch_profiler_steps[0]:
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if self._use_cuda:
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self._torch_profiler = torch.profiler.profile(activities=activities, record_shapes=True)
+            self._torch_profiler.__enter__()
+
+        tensors = [value for value in list(batch_x.values()) + list(batch_y.values()) if isinstance(value, torch.Tensor)]
+        batch_size = tensors[0].size(0) if tensors else len(indices)
+        seq_len = batch_x.get(self.seq_len_field, batch_y.get(self.seq_len_field))
+        tokens = padded_tokens = None
+        if isinstance(seq_len, torch.Tensor):
+            tokens = int(seq_len.sum())
+            max_len = max([value.size(1) for value in batch_x.values()
+                           if isinstance(value, torch.Tensor) and value.dim() > 1], default=int(seq_len.max()))
+            padded_tokens = batch_size * max_len
+        self._batch_info = {'batch_size': batch_size, 'tokens': tokens, 'padded_tokens': padded_tokens}
+        # 计算token数会引入同步，不计入forward
+        self._mark = self._now()
+
+    def on_loss_begin(self, batch_y, predict_y):
+        self._enter('loss')
+
+    def on_backward_begin(self, loss):
+        self._enter('backward')
+
+    def on_backward_end(self):
+        self._enter('step')
+
+    def on_step_end(self):
+        self._enter('other')
+
+    def on_batch_end(self):
+        self._enter('data')
+        times = {phase: self._times.get(phase, 0) for phase in self._phase_names}
+        self._times = {}
+        record = {'step': self.step, 'epoch': self.epoch}
+        record.update(times)
+        record['time'] = sum(times.values())
+        record.update(self._batch_info)
+        record['peak_memory'] = self._peak_memory()
+        self.records.append(record)
+        if self._log_file is not None:
+            self._log_file.write(json.dumps(record) + '\n')
+        if self._torch_profiler is not None and self.step == self.torch_profiler_steps[1]:
+            self._stop_torch_profiler()
+        self._mark = self._now()
+
+    def on_valid_begin(self):
+        self._enter('valid')
+
+    def on_valid_end(self, eval_result, metric_key, optimizer, is_better_eval):
+        self._enter('data')
+
+    def on_train_end(self):
+        self._finish()
+        self.summary = self._summarize()
+        print(self._format_summary(self.summary))
+
+    def on_exception(self, exception):
+        self._finish()
+
+    def _stop_torch_profiler(self):
+        self._torch_profiler.__exit__(None, None, None)
+        path = self.torch_trace_path
+        if path is None:
+            path = 'torch_trace_{}.json'.format(self.trainer.start_time)
+        self._torch_profiler.export_chrome_trace(path)
+        self._torch_profiler = None
+
+    def _finish(self):
+        if self._torch_profiler is not None:
+            self._stop_torch_profiler()
+        if self._log_file is not None:
+            self._log_file.close()
+            self._log_file = None
+        if self.trace_path is not None:
+            with open(self.trace_path, 'w', encoding='utf-8') as f:
+                json.dump({'traceEvents': self._events, 'displayTimeUnit': 'ms'}, f)
+
+    def _summarize(self):
+        n_steps = len(self.records)
+        total_time = sum(record['time'] for record in self.records)
+        summary = {'steps': n_steps, 'time': total_time, 'valid_time': self._valid_time}
+        for phase in self._phase_names:
+            summary[phase] = sum(record[phase] for record in self.records)
+        samples = sum(record['batch_size'] for record in self.records)
+        summary['samples_per_sec'] = samples / total_time if total_time > 0 else None
+        token_records = [record for record in self.records if record['tokens'] is not None]
+        if token_records:
+            tokens = sum(record['tokens'] for record in token_records)
+            padded_tokens = sum(record['padded_tokens'] for record in token_records)
+            token_time = sum(record['time'] for record in token_records)
+            summary['tokens_per_sec'] = tokens / token_time if token_time > 0 else None
+            summary['padding_efficiency'] = tokens / padded_tokens if padded_tokens > 0 else None
+        else:
+            summary['tokens_per_sec'] = summary['padding_efficiency'] = None
+        summary['peak_memory'] = max([record['peak_memory'] for record in self.records
+                                      if record['peak_memory'] is not None], default=None)
+        return summary
+
+    def _format_summary(self, summary):
+        lines = ["Profile of {} steps:".format(summary['steps']),
+                 "{:<10}{:>12}{:>14}{:>8}".format('phase', 'total(s)', 'per step(ms)', '%')]
+        for phase in self._phase_names + ('valid',):
+            total = summary['valid_time'] if phase == 'valid' else summary[phase]
+            per_step = total / summary['steps'] * 1000 if summary['steps'] > 0 else 0
+            percent = total / summary['time'] * 100 if summary['time'] > 0 else 0
+            lines.append("{:<10}{:>12.3f}{:>14.2f}{:>8.1f}".format(phase, total, per_step, percent))
+        for key, name, fmt in (('samples_per_sec', 'samples/sec', '{:.1f}'), ('tokens_per_sec', 'tokens/sec', '{:.1f}'),
+                               ('padding_efficiency', 'padding efficiency', '{:.2%}'),
+                               ('peak_memory', 'peak memory(MB)', '{:.1f}')):
+            if summary[key] is not None:
+                lines.append("{}: {}".format(name, fmt.format(summary[key])))
+        return '\n'.join(lines)
+
+
 class CallbackException(BaseException):
     """
    当需要通过callback跳出训练的时候可以通过抛出CallbackException并在on_exception中捕获这个值。
@@ -107,6 +107,8 @@
             words = sentence.split()
             return words
         dataset.apply(get_words, new_field_name='words')
+        # 数据量很大时，可以使用多个进程并行处理，结果的顺序与串行时相同
+        dataset.apply(get_words, new_field_name='words', num_proc=8)
 
 2.4 删除DataSet的内容
 
@@ -270,6 +272,23 @@
         #  也可以设置pad的value
         dataset.set_pad_val('chars', -1)
 
+3.3 DataSet与列式存储
+
+    默认情况下，每个field的内容都保存为Python的list，每个int或float都是一个单独的Python对象，在数据量很大时会占用大量内存。
+    对于数值类型的field(比如index之后的words, chars, seq_len等)，可以通过 :meth:`~fastNLP.DataSet.set_columnar` 将其
+    转换为列式存储：所有内容放在一块连续的numpy buffer中，长度不一的field额外使用offsets记录每个sample的边界。取batch时将
+    直接在buffer上进行gather与pad。
+
+    Example::
+
+        from fastNLP import DataSet
+        dataset = DataSet({'words': [[1, 2, 3], [4, 5], [6]], 'seq_len': [3, 2, 1]})
+        dataset.set_input('words', 'seq_len')
+        dataset.set_columnar('words', 'seq_len')
+        dataset.words.get([0, 2])
+        >> array([[1, 2, 3],
+                  [6, 0, 0]])
+
 
 """
 __all__ = [
@@ -277,11 +296,19 @@ __all__ = [
 ]
 
 import _pickle as pickle
+import importlib
+import json
+import multiprocessing as mp
+import os
+import shutil
 import warnings
+from functools import partial
+from itertools import chain
 
 import numpy as np
 
 from .field import AutoPadder
+from .field import ColumnarContent
 from .field import FieldArray
 from .instance import Instance
 from .utils import _get_func_signature
@@ -327,7 +354,7 @@ class DataSet(object):
         
         return iter_func()
     
-    def _inner_iter(self):
+    def _inner_iter(self, start=0, end=None):
         class Iter_ptr:
             def __init__(self, dataset, idx):
                 self.dataset = dataset
@@ -343,7 +370,7 @@ class DataSet(object):
                 return self.dataset[self.idx].__repr__()
         
         def inner_iter_func():
-            for idx in range(len(self)):
+            for idx in range(start, len(self) if end is None else end):
                 yield Iter_ptr(self, idx)
         
         return inner_iter_func()
@@ -615,6 +642,26 @@ class DataSet(object):
             else:
                 raise KeyError("{} is not a valid field name.".format(name))
     
+    def set_columnar(self, *field_names, flag=True):
+        """
+        将field设置为列式(columnar)存储。数值类型的field的内容将被存放在连续的numpy buffer中(长度不一的field使用values加
+        offsets的方式存储)，可以大幅减少内存占用，并且取batch与pad时不需要为每个元素生成Python对象::
+
+            dataset.set_columnar('words', 'seq_len')  # 将words和seq_len这两个field转换为列式存储
+            dataset.set_columnar('words', flag=False)  # 将words转换回list存储
+
+        列式存储的field是只读的，append或修改元素之前需要先将flag设置为False。
+
+        :param str field_names: field的名称
+        :param bool flag: 将field_name的columnar状态设置为flag
+        """
+        assert isinstance(flag, bool), "Only bool type supported."
+        for name in field_names:
+            if name in self.field_arrays:
+                self.field_arrays[name].columnar = flag
+            else:
+                raise KeyError("{} is not a valid field name.".format(name))
+    
     def set_padder(self, field_name, padder):
         """
         为field_name设置padder::
@@ -657,7 +704,7 @@ class DataSet(object):
         """
         return [name for name, field in self.field_arrays.items() if field.is_target]
     
-    def apply_field(self, func, field_name, new_field_name=None, **kwargs):
+    def apply_field(self, func, field_name, new_field_name=None, num_proc=0, chunk_size=None, **kwargs):
         """
         将DataSet中的每个instance中的名为 `field_name` 的field传给func，并获取它的返回值。
 
@@ -665,6 +712,9 @@ class DataSet(object):
         :param str field_name: 传入func的是哪个field。
         :param None,str new_field_name: 将func返回的内容放入到 `new_field_name` 这个field中，如果名称与已有的field相同，则覆
             盖之前的field。如果为None则不创建新的field。
+        :param int num_proc: 使用多少个进程处理。小于等于1时在当前进程中处理；否则将DataSet按顺序切分为若干段，交给进程池
+            处理后再按原顺序拼接。多进程时func中对外部对象的修改不会反映到当前进程中。
+        :param int chunk_size: 多进程时每一段包含的instance数量，为None时平均分为 `num_proc` 段。
         :param optional kwargs: 支持输入is_input,is_target,ignore_type
 
             1. is_input: bool, 如果为True则将名为 `new_field_name` 的field设置为input
@@ -678,15 +728,7 @@ class DataSet(object):
         assert len(self) != 0, "Null DataSet cannot use apply_field()."
         if field_name not in self:
             raise KeyError("DataSet has no field named `{}`.".format(field_name))
-        results = []
-        idx = -1
-        try:
-            for idx, ins in enumerate(self._inner_iter()):
-                results.append(func(ins[field_name]))
-        except Exception as e:
-            if idx != -1:
-                print("Exception happens at the `{}`th instance.".format(idx))
-            raise e
+        results = self._apply(func, field_name, num_proc=num_proc, chunk_size=chunk_size)
         if not (new_field_name is None) and len(list(filter(lambda x: x is not None, results))) == 0:  # all None
             raise ValueError("{} always return None.".format(_get_func_signature(func=func)))
         
@@ -695,6 +737,39 @@ class DataSet(object):
         
         return results
     
+    def _apply(self, func, field_name, num_proc=0, chunk_size=None):
+        """
+        apply()与apply_field()的公共部分。field_name为None时传入func的是instance，否则是该field的内容。
+
+        :return: list(Any), func的返回值
+        """
+        results = self._map_ranges(partial(_apply_range, func=func, field_name=field_name),
+                                   num_proc=num_proc, chunk_size=chunk_size)
+        return list(chain.from_iterable(results))
+    
+    def _map_ranges(self, func, num_proc=0, chunk_size=None):
+        """
+        将DataSet按顺序切分为若干段，对每一段调用func(dataset, start, end)，并按顺序返回每一段的结果。
+
+        :param callable func: 处理[start, end)范围内instance的函数
+        :param int num_proc: 大于1时使用进程池处理
+        :param int chunk_size: 每一段的instance数量，为None时平均分为 `num_proc` 段
+        :return: list, 每一段的func返回值
+        """
+        if num_proc is None or num_proc <= 1 or len(self) <= 1:
+            return [func(self, 0, len(self))]
+        if chunk_size is None:
+            chunk_size = (len(self) + num_proc - 1) // num_proc
+        ranges = [(start, min(start + chunk_size, len(self))) for start in range(0, len(self), chunk_size)]
+        # fork时子进程直接继承DataSet和func，不需要pickle，因此也支持lambda
+        if 'fork' in mp.get_all_start_methods():
+            ctx = mp.get_context('fork')
+        else:
+            ctx = mp.get_context()
+        with ctx.Pool(min(num_proc, len(ranges)), initializer=_init_range_worker,
+                      initargs=(self, func)) as pool:
+            return pool.starmap(_range_worker, ranges)
+    
     def _add_apply_field(self, results, new_field_name, kwargs):
         """
         将results作为加入到新的field中，field名称为new_field_name
@@ -727,13 +802,16 @@ class DataSet(object):
                            is_target=extra_param.get("is_target", None),
                            ignore_type=extra_param.get("ignore_type", False))
     
-    def apply(self, func, new_field_name=None, **kwargs):
+    def apply(self, func, new_field_name=None, num_proc=0, chunk_size=None, **kwargs):
         """
         将DataSet中每个instance传入到func中，并获取它的返回值.
 
         :param callable func: 参数是DataSet中的Instance
         :param None,str new_field_name: 将func返回的内容放入到new_field_name这个field中，如果名称与已有的field相同，则覆
             盖之前的field。如果为None则不创建新的field。
+        :param int num_proc: 使用多少个进程处理。小于等于1时在当前进程中处理；否则将DataSet按顺序切分为若干段，交给进程池
+            处理后再按原顺序拼接。多进程时func中对外部对象的修改不会反映到当前进程中。
+        :param int chunk_size: 多进程时每一段包含的instance数量，为None时平均分为 `num_proc` 段。
         :param optional kwargs: 支持输入is_input,is_target,ignore_type
 
             1. is_input: bool, 如果为True则将 `new_field_name` 的field设置为input
@@ -745,16 +823,7 @@ class DataSet(object):
         :return: list(Any), 里面的元素为func的返回值，所以list长度为DataSet的长度
         """
         assert len(self) != 0, "Null DataSet cannot use apply()."
-        idx = -1
-        try:
-            results = []
-            for idx, ins in enumerate(self._inner_iter()):
-                results.append(func(ins))
-        except Exception as e:
-            if idx != -1:
-                print("Exception happens at the `{}`th instance.".format(idx))
-            raise e
-        # results = [func(ins) for ins in self._inner_iter()]
+        results = self._apply(func, None, num_proc=num_proc, chunk_size=chunk_size)
         if not (new_field_name is None) and len(list(filter(lambda x: x is not None, results))) == 0:  # all None
             raise ValueError("{} always return None.".format(_get_func_signature(func=func)))
         
@@ -871,24 +940,224 @@ class DataSet(object):
                     _dict[header].append(content)
         return cls(_dict)
     
-    def save(self, path):
+    def save(self, path, binary=False):
         """
         保存DataSet.
 
         :param str path: 将DataSet存在哪个路径
+        :param bool binary: 为False时将整个DataSet pickle到path这个文件中；为True时将path作为一个文件夹，数值类型的field
+            以列式存储的方式分别保存为.npy文件(values与offsets)，其它field使用pickle保存，field的is_input, is_target, padder
+            等信息保存在其中的dataset.json中。二进制格式可以通过 :meth:`DataSet.load` 的mmap参数以内存映射的方式读取。
         """
-        with open(path, 'wb') as f:
-            pickle.dump(self, f)
+        if binary:
+            _save_binary(self, path)
+        else:
+            with open(path, 'wb') as f:
+                pickle.dump(self, f)
     
     @staticmethod
-    def load(path):
+    def load(path, mmap=False):
         """
-        从保存的DataSet pickle文件的路径中读取DataSet
+        从保存的DataSet pickle文件或二进制格式的文件夹中读取DataSet
 
         :param str path: 从哪里读取DataSet
+        :param bool mmap: 仅对二进制格式有效。为True时使用np.memmap打开.npy文件，读取几乎不花费时间，数据只有在被访问时才会
+            读入内存，且使用多个进程(比如DataSetIter的num_workers)时各进程共享同一份内存。此时对应的field都为列式存储
+            (只读)。为False时将数据全部读入内存，并恢复为保存时的存储方式。
         :return: 一个 :class:`~fastNLP.DataSet` 类型的对象
         """
+        if os.path.isdir(path):
+            return _load_binary(path, mmap=mmap)
         with open(path, 'rb') as f:
             d = pickle.load(f)
             assert isinstance(d, DataSet), "The object is not DataSet, but {}.".format(type(d))
         return d
+
+
+def _apply_range(dataset, start, end, func, field_name):
+    """对dataset中[start, end)范围内的instance调用func, 出错时打印出错的instance的下标"""
+    results = []
+    idx = -1
+    try:
+        for idx, ins in enumerate(dataset._inner_iter(start, end), start):
+            results.append(func(ins) if field_name is None else func(ins[field_name]))
+    except Exception as e:
+        if idx != -1:
+            print("Exception happens at the `{}`th instance.".format(idx))
+        raise e
+    return results
+
+
+_range_worker_context = None
+
+
+def _init_range_worker(dataset, func):
+    global _range_worker_context
+    _range_worker_context = (dataset, func)
+
+
+def _range_worker(start, end):
+    dataset, func = _range_worker_context
+    return func(dataset, start, end)
+
+
+_BINARY_HEADER = 'dataset.json'
+_BINARY_VERSION = 1
+
+
+def _dtype_to_str(dtype):
+    if dtype in (int, float, bool):
+        return dtype.__name__
+    return 'numpy.' + np.dtype(dtype).name
+
+
+def _str_to_dtype(name):
+    if name.startswith('numpy.'):
+        return np.dtype(name[len('numpy.'):]).type
+    return {'int': int, 'float': float, 'bool': bool}[name]
+
+
+def _field_to_columnar(field):
+    """
+    尝试将field的内容转换为 :class:`~fastNLP.core.field.ColumnarContent` ，无法转换(比如str类型的field)时返回None
+
+    :param FieldArray field:
+    :return: ColumnarContent或None
+    """
+    if field.columnar:
+        return field.content
+    if field.ignore_type:
+        return None
+    try:
+        if field.dtype is not None:
+            ele_dtype, dim = field.dtype, field._cell_ndim
+        else:
+            ele_dtype, dim = field._get_dtype_and_ndim()
+        return ColumnarContent.from_list(field.content, ele_dtype, dim)
+    except (SetInputOrTargetException, TypeError, ValueError):
+        return None
+
+
+def _save_binary(dataset, path):
+    """
+    将dataset以二进制格式保存到path文件夹下。先写入同级的临时文件夹，完成之后再替换path，因此path中原有的内容(比如以
+    mmap方式读取的dataset正在使用的文件)在写入的过程中不会被修改，中途出错时path也保持原样。
+
+    :param DataSet dataset:
+    :param str path:
+    """
+    path = os.path.abspath(path)
+    tmp_path = path + '.tmp{}'.format(os.getpid())
+    old_path = path + '.old{}'.format(os.getpid())
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+    try:
+        _write_binary(dataset, tmp_path)
+        if os.path.isdir(path):  # os.replace不能覆盖非空的文件夹, 先将原来的文件夹移走
+            os.replace(path, old_path)
+            try:
+                os.replace(tmp_path, path)
+            except OSError:
+                os.replace(old_path, path)
+                raise
+            shutil.rmtree(old_path, ignore_errors=True)  # 已经mmap的文件在被删除之后仍然可以读取
+        else:
+            os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            shutil.rmtree(tmp_path)
+
+
+def _write_binary(dataset, path):
+    """
+    将dataset写入已经存在的path文件夹。第i个field的内容保存为{i}.data.npy与{i}.offsets{level}.npy(或{i}.pkl)，
+    如果padder无法用json表示，则pickle到{i}.padder.pkl中。
+
+    :param DataSet dataset:
+    :param str path:
+    """
+    fields = []
+    for idx, (name, field) in enumerate(dataset.field_arrays.items()):
+        prefix = os.path.join(path, str(idx))
+        meta = {'name': name, 'is_input': field.is_input, 'is_target': field.is_target,
+                'ignore_type': field.ignore_type, 'columnar': field.columnar}
+        if field.padder is None:
+            meta['padder'] = None
+        else:
+            padder_meta = {'module': type(field.padder).__module__, 'class': type(field.padder).__qualname__,
+                           'state': field.padder.__dict__}
+            try:
+                json.dumps(padder_meta)
+            except TypeError:
+                with open(prefix + '.padder.pkl', 'wb') as f:
+                    pickle.dump(field.padder, f)
+                padder_meta = {'pickle': True}
+            meta['padder'] = padder_meta
+
+        content = _field_to_columnar(field)
+        if content is not None:
+            meta.update({'format': 'npy', 'dtype': _dtype_to_str(content.ele_dtype), 'dim': content.dim,
+                         'num_offsets': len(content.offsets)})
+            np.save(prefix + '.data.npy', content.data)
+            for level, offsets in enumerate(content.offsets):
+                np.save(prefix + '.offsets{}.npy'.format(level), offsets)
+        else:
+            meta['format'] = 'pickle'
+            with open(prefix + '.pkl', 'wb') as f:
+                pickle.dump(field.content, f)
+        fields.append(meta)
+
+    with open(os.path.join(path, _BINARY_HEADER), 'w', encoding='utf-8') as f:
+        json.dump({'version': _BINARY_VERSION, 'length': len(dataset), 'fields': fields}, f, indent=2,
+                  ensure_ascii=False)
+
+
+def _load_binary(path, mmap=False):
+    """
+    读取 :func:`_save_binary` 保存的DataSet
+
+    :param str path:
+    :param bool mmap: 是否使用np.memmap读取.npy文件
+    :return: DataSet
+    """
+    header_path = os.path.join(path, _BINARY_HEADER)
+    if not os.path.exists(header_path):
+        raise FileNotFoundError("{} is not a DataSet saved in binary format, {} not found.".format(path, _BINARY_HEADER))
+    with open(header_path, 'r', encoding='utf-8') as f:
+        header = json.load(f)
+    if header['version'] != _BINARY_VERSION:
+        raise RuntimeError("Unsupported binary DataSet version:{}.".format(header['version']))
+
+    mmap_mode = 'r' if mmap else None
+    dataset = DataSet()
+    for idx, meta in enumerate(header['fields']):
+        prefix = os.path.join(path, str(idx))
+        padder_meta = meta['padder']
+        if padder_meta is None:
+            padder = None
+        elif padder_meta.get('pickle', False):
+            with open(prefix + '.padder.pkl', 'rb') as f:
+                padder = pickle.load(f)
+        else:
+            padder_cls = getattr(importlib.import_module(padder_meta['module']), padder_meta['class'])
+            padder = padder_cls.__new__(padder_cls)
+            padder.__dict__.update(padder_meta['state'])
+
+        if meta['format'] == 'npy':
+            data = np.load(prefix + '.data.npy', mmap_mode=mmap_mode)
+            offsets = [np.load(prefix + '.offsets{}.npy'.format(level), mmap_mode=mmap_mode)
+                       for level in range(meta['num_offsets'])]
+            content = ColumnarContent(data, offsets, _str_to_dtype(meta['dtype']), meta['dim'])
+            if not mmap and not meta['columnar']:
+                content = content.tolist()
+        else:
+            with open(prefix + '.pkl', 'rb') as f:
+                content = pickle.load(f)
+        field = FieldArray(meta['name'], content, is_input=meta['is_input'], is_target=meta['is_target'],
+                           ignore_type=meta['ignore_type'])
+        if meta['format'] == 'npy':  # tolist()之后np.float32等会变为python的类型，需要恢复保存时的dtype
+            field.dtype, field._cell_ndim = _str_to_dtype(meta['dtype']), meta['dim']
+        field.set_padder(padder)
+        dataset.field_arrays[meta['name']] = field
+    return dataset
@@ -0,0 +1,164 @@
+"""
+dist_trainer 模块实现了基于 torch.distributed 的多进程数据并行训练类 :class:`~fastNLP.DistTrainer` 。
+
+与 :class:`~fastNLP.Trainer` 使用 :class:`torch.nn.DataParallel` 不同，DistTrainer 的每个进程各自持有一份模型，只负责
+一部分数据，反向传播时通过 :class:`torch.nn.parallel.DistributedDataParallel` 对梯度做all-reduce，不受GIL的限制，
+也不需要每一步都复制模型。使用 ``gloo`` backend 时可以在只有cpu的机器上运行。
+
+需要通过 ``torch.distributed.launch`` (或者 ``torchrun`` )等方式为每个进程启动同一个脚本::
+
+    # python -m torch.distributed.launch --nproc_per_node=2 train.py
+    from fastNLP import DistTrainer
+
+    trainer = DistTrainer(train_data, model, optimizer=optimizer, loss=loss, batch_size_per_rank=32,
+                          dev_data=dev_data, metrics=AccuracyMetric(), backend='gloo',
+                          callbacks_all=[GradientClipCallback()], callbacks_master=[TensorboardCallback()])
+    trainer.train()
+
+"""
+__all__ = [
+    "DistTrainer"
+]
+
+import contextlib
+import os
+
+import torch.distributed as dist
+import torch.nn as nn
+
+from .batch import DataSetIter
+from .dataset import DataSet
+from .metrics import _prepare_metrics
+from .sampler import Sampler, RandomSampler, ConstTokenNumSampler
+from .sampler import DistributedSampler, DistributedBatchSampler
+from .tester import Tester
+from .trainer import Trainer
+from .utils import _get_model_device
+from .utils import _move_model_to_device
+
+
+class DistTrainer(Trainer):
+    """
+    别名：:class:`fastNLP.DistTrainer` :class:`fastNLP.core.dist_trainer.DistTrainer`
+
+    分布式数据并行的Trainer，每个进程中都需要使用相同的参数初始化一个DistTrainer并调用train()。
+
+    * 训练数据通过 :class:`~fastNLP.DistributedSampler` (或 :class:`~fastNLP.DistributedBatchSampler` )分到各个进程中，
+      各个进程每个epoch的step数量相同；
+    * 梯度在各个进程之间求平均，update_every大于1时，只在真正更新参数的那一步进行同步；
+    * 只有rank 0的进程会保存模型(save_path)、显示进度与验证结果，并运行callbacks_master中的callback；
+    * 验证时每个进程验证dev_data的一部分，然后将各个进程的Metric统计量合并，所以各个进程得到的验证结果(以及early stop等
+      依赖验证结果的决定)是一致的。
+
+    :param train_data: 训练集， :class:`~fastNLP.DataSet` 类型。
+    :param nn.modules model: 待训练的模型，会被 :class:`torch.nn.parallel.DistributedDataParallel` 包裹。
+    :param optimizer: `torch.optim.Optimizer` 优化器。如果为None，则使用默认的Adam(model.parameters(), lr=4e-3)
+    :param loss: 使用的 :class:`~fastNLP.core.losses.LossBase` 对象。当为None时，默认使用 :class:`~fastNLP.LossInForward`
+    :param int batch_size_per_rank: 每个进程中一个batch的大小，总的batch大小为batch_size_per_rank * world_size。
+    :param sampler: :class:`~fastNLP.Sampler` 或 :class:`~fastNLP.ConstTokenNumSampler` ，会被自动包裹为分布式的版本。
+        为None时使用 :class:`~fastNLP.RandomSampler` 。
+    :param bool drop_last: 如果最后一个batch没有正好为batch_size_per_rank这么多数据，就扔掉最后一个batch
+    :param int update_every: 多少步更新一次梯度
+    :param int num_workers: 每个进程中使用多少个进程来进行数据pad处理
+    :param int n_epochs: 需要优化迭代多少次
+    :param int print_every: 多少次反向传播更新tqdm显示的loss(只显示rank 0的loss)
+    :param dev_data: 用于做验证的DataSet， :class:`~fastNLP.DataSet` 类型
+    :param metrics: 验证的评估函数，需要声明 ``_state_names`` 才能得到准确的合并结果，参见
+        :class:`~fastNLP.core.metrics.MetricBase`
+    :param str,None metric_key: 同 :class:`~fastNLP.Trainer`
+    :param int validate_every: 多少个step在验证集上验证一次; 如果为-1，则每个epoch结束验证一次
+    :param str,None save_path: 将模型保存路径，只有rank 0会保存
+    :param bool use_tqdm: rank 0是否使用tqdm来显示训练进度
+    :param str,int,torch.device device: 当前进程使用的device。为None时模型保持在原来的device上。使用nccl时一般为
+        local_rank对应的gpu
+    :param int num_prefetch: 同 :class:`~fastNLP.Trainer`
+    :param str,None precision: 同 :class:`~fastNLP.Trainer`
+    :param list(callbacks) callbacks_all: 在所有进程中都运行的callback
+    :param list(callbacks) callbacks_master: 只在rank 0中运行的callback，比如保存模型、打印信息的callback
+    :param str backend: torch.distributed尚未初始化时，使用该backend初始化，支持'gloo', 'nccl'等
+    :param str init_method: torch.distributed尚未初始化时使用，为None时从环境变量(MASTER_ADDR, MASTER_PORT等)读取
+    :param int rank: torch.distributed尚未初始化时使用，为None时从环境变量RANK读取
+    :param int world_size: torch.distributed尚未初始化时使用，为None时从环境变量WORLD_SIZE读取
+    """
+
+    def __init__(self, train_data, model, optimizer=None, loss=None,
+                 batch_size_per_rank=32, sampler=None, drop_last=False, update_every=1,
+                 num_workers=0, n_epochs=10, print_every=5,
+                 dev_data=None, metrics=None, metric_key=None,
+                 validate_every=-1, save_path=None, use_tqdm=True, device=None, num_prefetch=0,
+                 precision=None, callbacks_all=None, callbacks_master=None,
+                 backend='gloo', init_method=None, rank=None, world_size=None):
+        if not dist.is_available():
+            raise RuntimeError("torch.distributed is not available.")
+        if not dist.is_initialized():
+            dist.init_process_group(backend=backend, init_method=init_method,
+                                    rank=-1 if rank is None else rank,
+                                    world_size=-1 if world_size is None else world_size)
+        self.rank = dist.get_rank()
+        self.world_size = dist.get_world_size()
+
+        if not isinstance(train_data, DataSet):
+            raise TypeError(f"The type of train_data must be fastNLP.DataSet, got {type(train_data)}.")
+        if not isinstance(model, nn.Module):
+            raise TypeError(f"The type of model must be torch.nn.Module, got {type(model)}.")
+        if (not metrics) and dev_data is not None:
+            raise ValueError("No metric for dev_data evaluation.")
+        if metrics and (dev_data is None):
+            raise ValueError("No dev_data for evaluations, pass dev_data or set metrics to None. ")
+
+        model = _move_model_to_device(model, device=device)
+        model_device = _get_model_device(model)
+        use_cuda = model_device is not None and model_device.type == 'cuda'
+        model = nn.parallel.DistributedDataParallel(model, device_ids=[model_device] if use_cuda else None)
+
+        if sampler is None:
+            sampler = RandomSampler()
+        if isinstance(sampler, ConstTokenNumSampler):
+            data_iterator = DataSetIter(dataset=train_data, num_workers=num_workers, pin_memory=use_cuda,
+                                        batch_sampler=DistributedBatchSampler(sampler))
+        elif isinstance(sampler, Sampler):
+            data_iterator = DataSetIter(dataset=train_data, batch_size=batch_size_per_rank, num_workers=num_workers,
+                                        pin_memory=use_cuda, sampler=DistributedSampler(sampler), drop_last=drop_last)
+        else:
+            raise ValueError("The type of sampler should be fastNLP.BaseSampler, got {}.".format(type(sampler)))
+
+        callbacks = list(callbacks_all or [])
+        if self.is_master:
+            callbacks.extend(callbacks_master or [])
+
+        super().__init__(train_data=data_iterator, model=model, optimizer=optimizer, loss=loss,
+                         batch_size=batch_size_per_rank, update_every=update_every, n_epochs=n_epochs,
+                         print_every=print_every, metric_key=metric_key, validate_every=validate_every,
+                         save_path=save_path if self.is_master else None, use_tqdm=use_tqdm and self.is_master,
+                         device=None, num_prefetch=num_prefetch, precision=precision, callbacks=callbacks,
+                         check_code_level=-1)
+        self.train_data = train_data
+        self.dev_data = dev_data
+        self.metrics = _prepare_metrics(metrics)
+        if self.dev_data is not None:
+            self.tester = Tester(model=self.model, data=self.dev_data, metrics=self.metrics,
+                                 batch_size=batch_size_per_rank, num_prefetch=num_prefetch,
+                                 device=None, verbose=0, use_dist=True)
+
+    @property
+    def is_master(self):
+        """当前进程是否是rank 0"""
+        return self.rank == 0
+
+    def train(self, load_best_model=True, on_exception='auto'):
+        """
+        使用该函数使DistTrainer开始训练，所有进程都需要调用。参数与返回值同 :meth:`fastNLP.Trainer.train` 。
+        非rank 0的进程不会输出信息。
+        """
+        if self.is_master:
+            return super().train(load_best_model=load_best_model, on_exception=on_exception)
+        with open(os.devnull, 'w') as f, contextlib.redirect_stdout(f):
+            return super().train(load_best_model=load_best_model, on_exception=on_exception)
+
+    def _grad_backward(self, loss):
+        # 累积梯度的step不需要在进程之间同步梯度
+        if self.step % self.update_every != 0:
+            with self.model.no_sync():
+                super()._grad_backward(loss)
+        else:
+            super()._grad_backward(loss)
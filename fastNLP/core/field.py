@@ -7,6 +7,7 @@ from typing import Any
 from abc import abstractmethod
 from copy import deepcopy
 from collections import Counter
+from itertools import chain
 
 class SetInputOrTargetException(Exception):
     def __init__(self, msg, index=None, field_name=None):
@@ -27,11 +28,12 @@ class FieldArray:
         if len(content)==0:
             raise RuntimeError("Empty fieldarray is not allowed.")
         _content = content
-        try:
-            _content = list(_content)
-        except BaseException as e:
-            print(f"Cannot convert content(of type:{type(content)}) into list.")
-            raise e
+        if not isinstance(_content, ColumnarContent):
+            try:
+                _content = list(_content)
+            except BaseException as e:
+                print(f"Cannot convert content(of type:{type(content)}) into list.")
+                raise e
         self.name = name
         self.content = _content
         self._ignore_type = ignore_type
@@ -101,6 +103,31 @@ class FieldArray:
             self._cell_ndim = None
         self._is_target = value
 
+    @property
+    def columnar(self):
+        return isinstance(self.content, ColumnarContent)
+
+    @columnar.setter
+    def columnar(self, value):
+        """
+        当 field_array.columnar = True / False 时被调用。为True时将content转换为 :class:`ColumnarContent` ，为False时转换回list
+        """
+        if value is True and not self.columnar:
+            if self._ignore_type:
+                raise RuntimeError(f"Field:{self.name} with ignore_type=True cannot be stored in columnar format.")
+            if self.dtype is not None:
+                ele_dtype, dim = self.dtype, self._cell_ndim
+            else:
+                try:
+                    ele_dtype, dim = self._get_dtype_and_ndim()
+                except SetInputOrTargetException as e:
+                    print(f"Field:{self.name} cannot be stored in columnar format, exception happens at the "
+                          f"{e.index} value.")
+                    raise e
+            self.content = ColumnarContent.from_list(self.content, ele_dtype, dim)
+        elif value is False and self.columnar:
+            self.content = self.content.tolist()
+
     def _check_dtype_and_ndim(self):
         """
         检查当前content所有的element是否是同一个类型，且是否每个元素具有相同的维度。通过的话，设置_cell_ndim与_ele_type属性；没有
@@ -108,6 +135,17 @@ class FieldArray:
 
         :return:
         """
+        if self.columnar:  # 转换为columnar时已经检查过了
+            self.dtype, self._cell_ndim = self.content.ele_dtype, self.content.dim
+        else:
+            self.dtype, self._cell_ndim = self._get_dtype_and_ndim()
+
+    def _get_dtype_and_ndim(self):
+        """
+        返回content中element的类型与维度，如果不一致则报错。
+
+        :return: (type, dim)
+        """
         cell_0 = self.content[0]
         index = 0
         try:
@@ -121,8 +159,7 @@ class FieldArray:
                 if dim_0!=dim_i:
                     raise SetInputOrTargetException("Dimension:{} in index {} is different from the first element with "
                                                     "dimension:{}.".format(dim_i, index, dim_0))
-            self._cell_ndim = dim_0
-            self.dtype = type_0
+            return type_0, dim_0
         except SetInputOrTargetException as e:
             e.index = index
             raise e
@@ -132,6 +169,9 @@ class FieldArray:
         :param val: 把该val append到fieldarray。
         :return:
         """
+        if self.columnar:
+            raise RuntimeError(f"Cannot append to field:{self.name} stored in columnar format, set columnar to "
+                               f"False first.")
         if (self._is_target or self._is_input) and self._ignore_type is False:
             type_, dim_ = _get_ele_type_and_dim(val)
             if self.dtype!=type_:
@@ -149,6 +189,9 @@ class FieldArray:
 
     def __setitem__(self, idx, val):
         assert isinstance(idx, int)
+        if self.columnar:
+            raise RuntimeError(f"Cannot modify field:{self.name} stored in columnar format, set columnar to "
+                               f"False first.")
         if (self._is_target or self._is_input) and self.ignore_type is False:  # 需要检测类型
             type_, dim_ = _get_ele_type_and_dim(val)
             if self.dtype!=type_:
@@ -172,13 +215,18 @@ class FieldArray:
         if self.is_input is False and self.is_target is False:
             raise RuntimeError("Please specify either is_input or is_target to True for {}".format(self.name))
 
-        contents = [self.content[i] for i in indices]
+        if self.columnar:
+            contents = self.content.take(indices)
+        else:
+            contents = [self.content[i] for i in indices]
         if self.padder is None or pad is False:
             return np.array(contents)
         else:
             return self.pad(contents)
 
     def pad(self, contents):
+        if isinstance(contents, ColumnarContent) and not isinstance(self.padder, (AutoPadder, EngChar2DPadder)):
+            contents = contents.tolist()  # 其它Padder只接受list形式的输入
         return self.padder(contents, field_name=self.name, field_ele_dtype=self.dtype, dim=self._cell_ndim)
 
     def set_padder(self, padder):
@@ -440,6 +488,188 @@ def _is_iterable(value):
         return False
 
 
+class ColumnarContent:
+    """
+    FieldArray的列式(columnar)存储。将一个数值类型field的全部内容存放在一块连续的numpy buffer中，而不是为每个元素保存一个
+    Python对象。
+
+    1 0维field(比如seq_len, label)或3维field(每个sample形状都相同)，直接保存为一个形状为(N, ...)的ndarray。
+
+    2 1维或2维(character)的field长度不一，保存为一个一维的values buffer，以及若干层offsets。offsets[0]的长度为N+1，第i个
+        sample对应下一层的[offsets[0][i], offsets[0][i+1])区间；2维field还有offsets[1]，指向每个word在values中的区间。
+
+    ColumnarContent是只读的。通过 :meth:`~fastNLP.FieldArray.get` 取出多个sample时会直接在buffer上进行gather，不会为每个
+    元素生成Python对象。
+
+    :param np.ndarray data: 1,2维field为展平后的values; 0,3维field为整个field的ndarray
+    :param list offsets: List[np.ndarray]，由外到内的各层offsets。0,3维field为空list。
+    :param ele_dtype: 最内层元素的类型，与 :attr:`~fastNLP.FieldArray.dtype` 一致
+    :param int dim: field的维度
+    """
+
+    def __init__(self, data, offsets, ele_dtype, dim):
+        self.data = data
+        self.offsets = offsets
+        self.ele_dtype = ele_dtype
+        self.dim = dim
+
+    @classmethod
+    def from_list(cls, content, ele_dtype, dim):
+        """
+        将list形式的field内容转换为ColumnarContent。
+
+        :param list content: field的内容
+        :param ele_dtype: 最内层元素的类型，必须为数值类型
+        :param int dim: field的维度，不能超过3
+        :return: ColumnarContent
+        """
+        if not _is_numeric_dtype(ele_dtype):
+            raise TypeError(f"Only numeric field can be stored in columnar format, not {ele_dtype}.")
+        dtype = np.dtype(ele_dtype)
+        if dim == 0:
+            return cls(np.asarray(content, dtype=dtype), [], ele_dtype, dim)
+        elif dim == 1:
+            lengths = np.fromiter(map(len, content), dtype=np.int64, count=len(content))
+            offsets = _lengths_to_offsets(lengths)
+            data = _flatten_rows(content, dtype, offsets[-1])
+            return cls(data, [offsets], ele_dtype, dim)
+        elif dim == 2:
+            sent_lengths = np.fromiter(map(len, content), dtype=np.int64, count=len(content))
+            sent_offsets = _lengths_to_offsets(sent_lengths)
+            words = list(chain.from_iterable(content))
+            word_lengths = np.fromiter(map(len, words), dtype=np.int64, count=len(words))
+            word_offsets = _lengths_to_offsets(word_lengths)
+            data = _flatten_rows(words, dtype, word_offsets[-1])
+            return cls(data, [sent_offsets, word_offsets], ele_dtype, dim)
+        elif dim == 3:
+            data = np.asarray(content, dtype=dtype)
+            if data.ndim != 4:
+                raise ValueError("Field with 3 dimensions can be stored in columnar format only when every sample "
+                                 "has the same shape.")
+            return cls(data, [], ele_dtype, dim)
+        else:
+            raise ValueError(f"Field with {dim} dimensions cannot be stored in columnar format.")
+
+    @property
+    def is_ragged(self):
+        return len(self.offsets) > 0
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + sum(offsets.nbytes for offsets in self.offsets)
+
+    def __len__(self):
+        if self.is_ragged:
+            return len(self.offsets[0]) - 1
+        return len(self.data)
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return self.take(range(len(self))[idx])
+        if not self.is_ragged:
+            return self.data[idx]
+        if idx < 0:
+            idx += len(self)
+        start, end = self.offsets[0][idx], self.offsets[0][idx + 1]
+        if self.dim == 1:
+            return self.data[start:end]
+        word_offsets = self.offsets[1]
+        return [self.data[word_offsets[w]:word_offsets[w + 1]] for w in range(start, end)]
+
+    def take(self, indices):
+        """
+        取出indices对应的sample，组成一个新的ColumnarContent。所有的操作都在buffer上向量化地完成。
+
+        :param List[int] indices:
+        :return: ColumnarContent
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        if not self.is_ragged:
+            return ColumnarContent(self.data[indices], [], self.ele_dtype, self.dim)
+        new_offsets = []
+        positions = indices
+        for offsets in self.offsets:
+            positions, level_offsets = _gather_ranges(offsets[positions], offsets[positions + 1])
+            new_offsets.append(level_offsets)
+        return ColumnarContent(self.data[positions], new_offsets, self.ele_dtype, self.dim)
+
+    def lengths(self):
+        """
+        每个sample第一维的长度，只对1,2维field有效。
+
+        :return: np.ndarray
+        """
+        if not self.is_ragged:
+            raise RuntimeError("Only ragged field has lengths.")
+        return np.diff(self.offsets[0])
+
+    def tolist(self):
+        """
+        转换回嵌套list的形式。
+
+        :return: list
+        """
+        if not self.is_ragged:
+            return self.data.tolist()
+        values = self.data.tolist()
+        for offsets in reversed(self.offsets):
+            offsets = offsets.tolist()
+            values = [values[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+        return values
+
+    def __array__(self, dtype=None):
+        if not self.is_ragged:
+            return self.data if dtype is None else self.data.astype(dtype)
+        array = np.empty(len(self), dtype=object)
+        for idx, value in enumerate(self):
+            array[idx] = value
+        return array
+
+
+def _is_numeric_dtype(ele_dtype):
+    return isinstance(ele_dtype, type) and (issubclass(ele_dtype, np.number) or issubclass(ele_dtype, Number))
+
+
+def _lengths_to_offsets(lengths):
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return offsets
+
+
+def _flatten_rows(rows, dtype, total):
+    """
+    将rows首尾相接为一个一维的array。
+
+    :param list rows: 每个元素为一维的list或ndarray
+    :param dtype: 返回的array的类型
+    :param int total: 所有row的长度之和
+    :return: np.ndarray
+    """
+    if total == 0:
+        return np.zeros(0, dtype=dtype)
+    if isinstance(rows[0], np.ndarray):
+        return np.concatenate(rows).astype(dtype, copy=False)
+    return np.fromiter(chain.from_iterable(rows), dtype=dtype, count=total)
+
+
+def _gather_ranges(starts, ends):
+    """
+    将多个[start, end)区间展开为一个位置数组, 例如[0, 5), [2, 3)展开为[0, 1, 2, 3, 4, 2]。
+
+    :param np.ndarray starts:
+    :param np.ndarray ends:
+    :return: (positions, offsets)。offsets为展开后每个区间的起始位置
+    """
+    lengths = ends - starts
+    offsets = _lengths_to_offsets(lengths)
+    positions = np.arange(offsets[-1], dtype=np.int64) + np.repeat(starts - offsets[:-1], lengths)
+    return positions, offsets
+
+
 class Padder:
     """
     别名：:class:`fastNLP.Padder` :class:`fastNLP.core.field.Padder`
@@ -536,6 +766,8 @@ class AutoPadder(Padder):
         super().__init__(pad_val=pad_val)
 
     def __call__(self, contents, field_name, field_ele_dtype, dim):
+        if isinstance(contents, ColumnarContent):
+            return _pad_columnar(contents, self.pad_val, field_ele_dtype or contents.ele_dtype)
         if field_ele_dtype:
             if dim>3:
                 return np.array(contents)
@@ -543,19 +775,12 @@ class AutoPadder(Padder):
                     (issubclass(field_ele_dtype, np.number) or issubclass(field_ele_dtype, Number)):
                 if dim==0:
                     array = np.array(contents, dtype=field_ele_dtype)
-                elif dim==1:
-                    max_len = max(map(len, contents))
-                    array = np.full((len(contents), max_len), self.pad_val, dtype=field_ele_dtype)
-                    for i, content_i in enumerate(contents):
-                        array[i, :len(content_i)] = content_i
-                elif dim==2:
-                    max_len = max(map(len, contents))
-                    max_word_len = max([max([len(content_ii) for content_ii in content_i]) for
-                                        content_i in contents])
-                    array = np.full((len(contents), max_len, max_word_len), self.pad_val, dtype=field_ele_dtype)
-                    for i, content_i in enumerate(contents):
-                        for j, content_ii in enumerate(content_i):
-                            array[i, j, :len(content_ii)] = content_ii
+                elif dim==1 or dim==2:
+                    if isinstance(contents, np.ndarray) and contents.dtype!=np.dtype('O') and contents.ndim==dim+1:
+                        array = np.array(contents, dtype=field_ele_dtype)  # 已经是对齐的了
+                    else:
+                        columnar = ColumnarContent.from_list(contents, field_ele_dtype, dim)
+                        array = _pad_columnar(columnar, self.pad_val, field_ele_dtype)
                 else:
                     shape = np.shape(contents)
                     if len(shape)==4: # 说明各dimension是相同的大小
@@ -566,20 +791,14 @@ class AutoPadder(Padder):
             elif str(field_ele_dtype).startswith('torch'):
                 if dim==0:
                     tensor = torch.tensor(contents).to(field_ele_dtype)
-                elif dim==1:
-                    max_len = max(map(len, contents))
-                    tensor = torch.full((len(contents), max_len), fill_value=self.pad_val, dtype=field_ele_dtype)
-                    for i, content_i in enumerate(contents):
-                        tensor[i, :len(content_i)] = torch.tensor(content_i)
-                elif dim==2:
-                    max_len = max(map(len, contents))
-                    max_word_len = max([max([len(content_ii) for content_ii in content_i]) for
-                                        content_i in contents])
-                    tensor = torch.full((len(contents), max_len, max_word_len), fill_value=self.pad_val,
-                                        dtype=field_ele_dtype)
-                    for i, content_i in enumerate(contents):
-                        for j, content_ii in enumerate(content_i):
-                            tensor[i, j, :len(content_ii)] = torch.tensor(content_ii)
+                elif dim==1 or dim==2:
+                    rows = list(contents) if dim==1 else [word for content_i in contents for word in content_i]
+                    lengths = np.fromiter(map(len, contents), dtype=np.int64, count=len(contents))
+                    word_lengths = np.fromiter(map(len, rows), dtype=np.int64, count=len(rows)) if dim==2 else None
+                    mask = torch.from_numpy(_ragged_mask(lengths, word_lengths))
+                    tensor = torch.full(mask.size(), fill_value=self.pad_val, dtype=field_ele_dtype)
+                    if len(rows):
+                        tensor[mask] = torch.cat([torch.as_tensor(row).to(field_ele_dtype).view(-1) for row in rows])
                 else:
                     shapes = set([np.shape(content_i) for content_i in contents])
                     if len(shapes)>1:
@@ -598,6 +817,43 @@ class AutoPadder(Padder):
             return np.array(contents)
 
 
+def _pad_columnar(contents, pad_val, dtype):
+    """
+    直接在 :class:`ColumnarContent` 的buffer上进行pad。根据每个sample的长度计算出mask，通过一次赋值将values放入padded的array中。
+
+    :param ColumnarContent contents:
+    :param pad_val:
+    :param dtype: 返回的array的类型
+    :return: np.ndarray
+    """
+    if not contents.is_ragged:
+        return contents.data.astype(dtype, copy=False)
+    word_lengths = np.diff(contents.offsets[1]) if contents.dim == 2 else None
+    mask = _ragged_mask(contents.lengths(), word_lengths)
+    array = np.full(mask.shape, pad_val, dtype=dtype)
+    array[mask] = contents.data
+    return array
+
+
+def _ragged_mask(lengths, word_lengths=None):
+    """
+    根据长度计算pad之后每个位置是否有值的mask。1维field的mask形状为(batch_size, max_len)；2维field的mask形状为
+    (batch_size, max_len, max_word_len)。mask中为True的位置按行优先的顺序恰好对应展平之后的values。
+
+    :param np.ndarray lengths: 每个sample的长度
+    :param np.ndarray word_lengths: 所有sample的所有word的长度(按顺序排列), 仅2维field需要
+    :return: np.ndarray, bool类型的mask
+    """
+    max_len = lengths.max() if len(lengths) else 0
+    mask = np.arange(max_len) < lengths[:, None]
+    if word_lengths is None:
+        return mask
+    max_word_len = word_lengths.max() if len(word_lengths) else 0
+    padded_word_lengths = np.zeros(mask.shape, dtype=np.int64)
+    padded_word_lengths[mask] = word_lengths
+    return np.arange(max_word_len) < padded_word_lengths[..., None]
+
+
 class EngChar2DPadder(Padder):
     """
     别名：:class:`fastNLP.EngChar2DPadder` :class:`fastNLP.core.field.EngChar2DPadder`
@@ -651,19 +907,19 @@ class EngChar2DPadder(Padder):
                 field_name, field_ele_dtype
             ))
         assert dim==2, f"Field:{field_name} has {dim}, EngChar2DPadder only supports input with 2 dimensions."
-        if self.pad_length < 1:
-            max_char_length = max([max(len(char_lst) for char_lst in word_lst) for word_lst in contents])
-        else:
-            max_char_length = self.pad_length
-        max_sent_length = max(len(word_lst) for word_lst in contents)
-        batch_size = len(contents)
         dtype = type(contents[0][0][0])
-
-        padded_array = np.full((batch_size, max_sent_length, max_char_length), fill_value=self.pad_val,
-                               dtype=dtype)
-        for b_idx, word_lst in enumerate(contents):
-            for c_idx, char_lst in enumerate(word_lst):
-                chars = char_lst[:max_char_length]
-                padded_array[b_idx, c_idx, :len(chars)] = chars
-
+        if not isinstance(contents, ColumnarContent):
+            contents = ColumnarContent.from_list(contents, dtype, dim)
+        if self.pad_length < 1:
+            return _pad_columnar(contents, self.pad_val, dtype)
+
+        # 将每个word截取到pad_length的长度
+        word_offsets = contents.offsets[1]
+        word_lengths = np.diff(word_offsets)
+        char_index = np.arange(len(contents.data)) - np.repeat(word_offsets[:-1], word_lengths)
+        values = contents.data[char_index < self.pad_length]
+        word_lengths = np.minimum(word_lengths, self.pad_length)
+        mask = _ragged_mask(contents.lengths(), word_lengths)
+        padded_array = np.full(mask.shape[:2] + (self.pad_length,), fill_value=self.pad_val, dtype=dtype)
+        padded_array[..., :mask.shape[2]][mask] = values
         return padded_array
@@ -9,8 +9,10 @@ __all__ = [
     "ExtractiveQAMetric"
 ]
 
+import copy
 import inspect
 from collections import defaultdict
+from itertools import chain
 
 import numpy as np
 import torch
@@ -57,10 +59,10 @@ class MetricBase(object):
             def evaluate(self, label, pred): # 这里的名称需要和dataset中target field与model返回的key是一样的，不然找不到对应的value
                 # dev或test时，每个batch结束会调用一次该方法，需要实现如何根据每个batch累加metric
                 self.total += label.size(0)
-                self.corr_num += label.eq(pred).sum().item()
+                self.corr_num += label.eq(pred).sum()
     
             def get_metric(self, reset=True): # 在这里定义如何计算metric
-                acc = self.corr_num/self.total
+                acc = float(self.corr_num)/self.total
                 if reset: # 是否清零以便重新计算
                     self.corr_num = 0
                     self.total = 0
@@ -86,10 +88,10 @@ class MetricBase(object):
             def evaluate(self, label, pred): # 这里的参数名称需要和self._init_param_map()注册时一致。
                 # dev或test时，每个batch结束会调用一次该方法，需要实现如何根据每个batch累加metric
                 self.total += label.size(0)
-                self.corr_num += label.eq(pred).sum().item()
+                self.corr_num += label.eq(pred).sum()
     
             def get_metric(self, reset=True): # 在这里定义如何计算metric
-                acc = self.corr_num/self.total
+                acc = float(self.corr_num)/self.total
                 if reset: # 是否清零以便重新计算
                     self.corr_num = 0
                     self.total = 0
@@ -113,7 +115,17 @@ class MetricBase(object):
     self.evaluate将计算一个批次(batch)的评价指标，并累计。 没有返回值
     self.get_metric将统计当前的评价指标并返回评价结果, 返回值需要是一个dict, key是指标名称，value是指标的值
 
+    如果希望Metric可以在 :class:`~fastNLP.DistTrainer` 中进行分布式验证，需要在 ``_state_names`` 中列出evaluate()累计的
+    统计量的属性名(比如上面例子中的 ('corr_num', 'total') )。在get_metric()之前，各个进程中的这些统计量会被合并: 数值、
+    numpy.ndarray与torch.Tensor求和，dict按key求和，list拼接。
+
+    evaluate()中累计的统计量最好直接保存为torch.Tensor(比如上面例子中的 ``label.eq(pred).sum()`` ，而不是调用
+    ``.item()`` )，这样统计量会留在模型所在的device上，验证时不会在每个batch都进行一次gpu与cpu之间的同步，只在get_metric()
+    中转换为python数值时同步一次。
+
     """
+
+    _state_names = None  # evaluate()累计的统计量的属性名，用于分布式验证时在进程之间合并
     
     def __init__(self):
         self._param_map = {}  # key is param in function, value is input param.
@@ -135,6 +147,23 @@ class MetricBase(object):
     @abstractmethod
     def get_metric(self, reset=True):
         raise NotImplemented
+
+    def _reduce_state(self):
+        """
+        分布式验证时调用，将所有进程中 ``_state_names`` 对应的统计量合并，合并之后每个进程中的统计量都相同。
+
+        :return: bool, 该Metric是否支持合并
+        """
+        if self._state_names is None:
+            return False
+        import torch.distributed as dist
+        # 各个进程中的统计量可能在不同的device上(或者还没有累计过而仍然是python数值)，统一放到cpu上再合并
+        states = {name: _state_to_cpu(getattr(self, name)) for name in self._state_names}
+        gathered = [None] * dist.get_world_size()
+        dist.all_gather_object(gathered, states)
+        for name in self._state_names:
+            setattr(self, name, _merge_state([state[name] for state in gathered]))
+        return True
     
     def _init_param_map(self, key_map=None, **kwargs):
         """检查key_map和其他参数map，并将这些映射关系添加到self._param_map
@@ -273,6 +302,37 @@ class MetricBase(object):
         return
 
 
+def _state_to_cpu(value):
+    """将统计量中的torch.Tensor移动到cpu上"""
+    if isinstance(value, torch.Tensor):
+        return value.cpu()
+    if isinstance(value, dict):
+        value = copy.copy(value)
+        for key, v in value.items():
+            value[key] = _state_to_cpu(v)
+        return value
+    if isinstance(value, list):
+        return [_state_to_cpu(v) for v in value]
+    return value
+
+
+def _merge_state(values):
+    """合并多个进程中同一个统计量的值"""
+    first = values[0]
+    if isinstance(first, dict):
+        merged = copy.copy(first)  # 保留defaultdict, Counter等类型
+        for value in values[1:]:
+            for key, v in value.items():
+                merged[key] = merged[key] + v if key in merged else v
+        return merged
+    if isinstance(first, list):
+        return list(chain(*values))
+    merged = first
+    for value in values[1:]:
+        merged = merged + value
+    return merged
+
+
 class AccuracyMetric(MetricBase):
     """
     
@@ -284,6 +344,8 @@ class AccuracyMetric(MetricBase):
     :param target: 参数映射表中 `target` 的映射关系，None表示映射关系为 `target` -> `target`
     :param seq_len: 参数映射表中 `seq_len` 的映射关系，None表示映射关系为 `seq_len` -> `seq_len`
     """
+
+    _state_names = ('total', 'acc_count')
     
     def __init__(self, pred=None, target=None, seq_len=None):
         
@@ -332,13 +394,14 @@ class AccuracyMetric(MetricBase):
                                f"size:{pred.size()}, target should have size: {pred.size()} or "
                                f"{pred.size()[:-1]}, got {target.size()}.")
         
+        # 统计量以tensor的形式留在device上累计，在get_metric()中才同步
         target = target.to(pred)
         if masks is not None:
-            self.acc_count += torch.sum(torch.eq(pred, target).masked_fill(masks.eq(0), 0)).item()
-            self.total += torch.sum(masks).item()
+            self.acc_count += torch.sum(torch.eq(pred, target).masked_fill(masks.eq(0), 0))
+            self.total += torch.sum(masks)
         else:
-            self.acc_count += torch.sum(torch.eq(pred, target)).item()
-            self.total += np.prod(list(pred.size()))
+            self.acc_count += torch.sum(torch.eq(pred, target))
+            self.total += pred.numel()
     
     def get_metric(self, reset=True):
         """
@@ -347,7 +410,7 @@ class AccuracyMetric(MetricBase):
         :param bool reset: 在调用完get_metric后是否清空评价指标统计量.
         :return dict evaluate_result: {"acc": float}
         """
-        evaluate_result = {'acc': round(float(self.acc_count) / (self.total + 1e-12), 6)}
+        evaluate_result = {'acc': round(float(self.acc_count) / (float(self.total) + 1e-12), 6)}
         if reset:
             self.acc_count = 0
             self.total = 0
@@ -515,6 +578,8 @@ class SpanFPreRecMetric(MetricBase):
     :param float beta: f_beta分数， :math:`f_{beta} = \frac{(1 + {beta}^{2})*(pre*rec)}{({beta}^{2}*pre + rec)}` .
         常用为beta=0.5, 1, 2. 若为0.5则精确率的权重高于召回率；若为1，则两者平等；若为2，则召回率权重高于精确率。
     """
+
+    _state_names = ('_true_positives', '_false_positives', '_false_negatives')
     
     def __init__(self, tag_vocab, pred=None, target=None, seq_len=None, encoding_type='bio', ignore_labels=None,
                  only_gross=True, f_type='micro', beta=1):
@@ -548,10 +613,13 @@ class SpanFPreRecMetric(MetricBase):
         self._init_param_map(pred=pred, target=target, seq_len=seq_len)
         
         self.tag_vocab = tag_vocab
+        self._span_labels = None
+        self._span_tables = None  # 在第一次evaluate()时根据tag_vocab构建，参见 _build_span_tables()
         
-        self._true_positives = defaultdict(int)
-        self._false_positives = defaultdict(int)
-        self._false_negatives = defaultdict(int)
+        # 每个label(按照_span_labels中的顺序)的统计量，为torch.LongTensor
+        self._true_positives = 0
+        self._false_positives = 0
+        self._false_negatives = 0
     
     def evaluate(self, pred, target, seq_len):
         """evaluate函数将针对一个批次的预测结果做评价指标的累计
@@ -585,42 +653,122 @@ class SpanFPreRecMetric(MetricBase):
                                f"size:{pred.size()}, target should have size: {pred.size()} or "
                                f"{pred.size()[:-1]}, got {target.size()}.")
         
-        batch_size = pred.size(0)
-        pred = pred.tolist()
-        target = target.tolist()
-        for i in range(batch_size):
-            pred_tags = pred[i][:int(seq_len[i])]
-            gold_tags = target[i][:int(seq_len[i])]
-            
-            pred_str_tags = [self.tag_vocab.to_word(tag) for tag in pred_tags]
-            gold_str_tags = [self.tag_vocab.to_word(tag) for tag in gold_tags]
-            
-            pred_spans = self.tag_to_span_func(pred_str_tags, ignore_labels=self.ignore_labels)
-            gold_spans = self.tag_to_span_func(gold_str_tags, ignore_labels=self.ignore_labels)
-            
-            for span in pred_spans:
-                if span in gold_spans:
-                    self._true_positives[span[0]] += 1
-                    gold_spans.remove(span)
-                else:
-                    self._false_positives[span[0]] += 1
-            for span in gold_spans:
-                self._false_negatives[span[0]] += 1
+        mask = seq_len_to_mask(seq_len, max_len=target.size(1)).to(target.device)
+        pred_keys, pred_labels = self._extract_spans(pred, mask)
+        gold_keys, gold_labels = self._extract_spans(target, mask)
+        
+        # 同一个句子中的span不会重复，因此通过key的交集统计匹配的span。统计量以tensor的形式留在device上累计
+        num_labels = len(self._span_labels)
+        true_positives = torch.bincount(pred_labels[self._match_keys(pred_keys, gold_keys)], minlength=num_labels)
+        self._true_positives += true_positives
+        self._false_positives += torch.bincount(pred_labels, minlength=num_labels) - true_positives
+        self._false_negatives += torch.bincount(gold_labels, minlength=num_labels) - true_positives
+    
+    @staticmethod
+    def _match_keys(pred_keys, gold_keys):
+        """
+        找出pred_keys中同样出现在gold_keys中的key。pred_keys与gold_keys各自内部没有重复，因此将两者拼接排序后，相邻且
+        相等的两个key即为一对匹配。(torch.isin需要torch>=1.10，这里只用排序以兼容旧版本的torch)
+
+        :param torch.LongTensor pred_keys: [num_pred]
+        :param torch.LongTensor gold_keys: [num_gold]
+        :return: torch.BoolTensor [num_pred], pred_keys中的每个key是否出现在gold_keys中
+        """
+        sorted_keys, order = torch.cat([pred_keys, gold_keys]).sort()
+        is_pair = sorted_keys[1:] == sorted_keys[:-1]
+        matched = torch.zeros(sorted_keys.size(0), dtype=torch.bool, device=pred_keys.device)
+        matched[order[:-1][is_pair]] = True
+        matched[order[1:][is_pair]] = True
+        return matched[:pred_keys.size(0)]
+    
+    def _build_span_tables(self):
+        """
+        根据tag_vocab为每个tag id预先计算: 所属的label的id；是否可以接在前一个tag之后(比如bio中的I)；是否可以被后一个
+        tag接上(比如bio中的B与I)；是否不属于任何span(O)。与 :func:`_bio_tag_to_spans` 等函数对字符串tag的处理方式一致。
+        """
+        cont_prefixes, prev_prefixes, skip_prefixes = {
+            'bio': ('i', 'bi', 'o'),
+            'bmes': ('me', 'bm', ''),
+            'bmeso': ('me', 'bm', 'o'),
+            'bioes': ('ie', 'bi', 'o'),
+        }[self.encoding_type]
+        ignore_labels = set(self.ignore_labels) if self.ignore_labels else set()
+        label2id = {}
+        label_ids, is_cont, is_prev, is_skip = [], [], [], []
+        for idx in range(len(self.tag_vocab)):
+            tag = self.tag_vocab.to_word(idx).lower()
+            prefix, label = tag[:1], tag[2:]
+            label_ids.append(label2id.setdefault(label, len(label2id)))
+            is_cont.append(prefix in cont_prefixes if prefix else False)
+            is_prev.append(prefix in prev_prefixes if prefix else False)
+            is_skip.append(prefix in skip_prefixes if prefix else False)
+        self._span_labels = list(label2id.keys())
+        self._span_tables = {torch.device('cpu'): (
+            torch.tensor(label_ids, dtype=torch.long), torch.tensor(is_cont, dtype=torch.bool),
+            torch.tensor(is_prev, dtype=torch.bool), torch.tensor(is_skip, dtype=torch.bool),
+            torch.tensor([label in ignore_labels for label in self._span_labels], dtype=torch.bool))}
+    
+    def _extract_spans(self, tags, mask):
+        """
+        同时找出一个batch中所有句子的span。
+
+        :param torch.LongTensor tags: [batch, max_len] tag的id
+        :param torch.BoolTensor mask: [batch, max_len] 句子中有效的位置
+        :return: (keys, labels), 每个span的key(由所在句子、起止位置与label唯一确定)以及label的id
+        """
+        if self._span_tables is None:
+            self._build_span_tables()
+        if tags.device not in self._span_tables:
+            self._span_tables[tags.device] = tuple(table.to(tags.device)
+                                                   for table in self._span_tables[torch.device('cpu')])
+        label_ids, is_cont, is_prev, is_skip, is_ignored = self._span_tables[tags.device]
+        tags = tags.long()
+        labels = label_ids[tags]
+        in_span = mask & ~is_skip[tags]
+        # 接在前一个tag之后，即与前一个tag属于同一个span
+        cont = torch.zeros_like(mask)
+        cont[:, 1:] = is_cont[tags[:, 1:]] & is_prev[tags[:, :-1]] & (labels[:, 1:] == labels[:, :-1]) & mask[:, 1:]
+        next_cont = torch.zeros_like(mask)
+        next_cont[:, :-1] = cont[:, 1:]
+        starts = in_span & ~cont
+        # 按行优先的顺序，第i个开始位置与第i个结束位置属于同一个span
+        start_pos = starts.nonzero()
+        end_pos = (in_span & ~next_cont).nonzero()
+        span_labels = labels[starts]
+        keep = ~is_ignored[span_labels]
+        max_len = tags.size(1)
+        keys = ((start_pos[:, 0] * max_len + start_pos[:, 1]) * max_len + end_pos[:, 1]) * len(self._span_labels) \
+               + span_labels
+        return keys[keep], span_labels[keep]
+    
+    def _get_span_counts(self):
+        """将按label id累计的统计量转换为以label为key的dict，只包含出现过的label"""
+        counts = []
+        for value in (self._true_positives, self._false_negatives, self._false_positives):
+            counts.append(value.tolist() if isinstance(value, torch.Tensor) else [])
+        true_positives, false_negatives, false_positives = defaultdict(int), defaultdict(int), defaultdict(int)
+        for idx, label in enumerate(self._span_labels or []):
+            if idx < len(counts[0]) and counts[0][idx] + counts[1][idx] + counts[2][idx] > 0:
+                true_positives[label] = counts[0][idx]
+                false_negatives[label] = counts[1][idx]
+                false_positives[label] = counts[2][idx]
+        return true_positives, false_negatives, false_positives
     
     def get_metric(self, reset=True):
         """get_metric函数将根据evaluate函数累计的评价指标统计量来计算最终的评价结果."""
+        true_positives, false_negatives, false_positives = self._get_span_counts()
         evaluate_result = {}
         if not self.only_gross or self.f_type == 'macro':
-            tags = set(self._false_negatives.keys())
-            tags.update(set(self._false_positives.keys()))
-            tags.update(set(self._true_positives.keys()))
+            tags = set(false_negatives.keys())
+            tags.update(set(false_positives.keys()))
+            tags.update(set(true_positives.keys()))
             f_sum = 0
             pre_sum = 0
             rec_sum = 0
             for tag in tags:
-                tp = self._true_positives[tag]
-                fn = self._false_negatives[tag]
-                fp = self._false_positives[tag]
+                tp = true_positives[tag]
+                fn = false_negatives[tag]
+                fp = false_positives[tag]
                 f, pre, rec = self._compute_f_pre_rec(tp, fn, fp)
                 f_sum += f
                 pre_sum += pre
@@ -639,17 +787,17 @@ class SpanFPreRecMetric(MetricBase):
                 evaluate_result['rec'] = rec_sum / len(tags)
         
         if self.f_type == 'micro':
-            f, pre, rec = self._compute_f_pre_rec(sum(self._true_positives.values()),
-                                                  sum(self._false_negatives.values()),
-                                                  sum(self._false_positives.values()))
+            f, pre, rec = self._compute_f_pre_rec(sum(true_positives.values()),
+                                                  sum(false_negatives.values()),
+                                                  sum(false_positives.values()))
             evaluate_result['f'] = f
             evaluate_result['pre'] = pre
             evaluate_result['rec'] = rec
         
         if reset:
-            self._true_positives = defaultdict(int)
-            self._false_positives = defaultdict(int)
-            self._false_negatives = defaultdict(int)
+            self._true_positives = 0
+            self._false_positives = 0
+            self._false_negatives = 0
         
         for key, value in evaluate_result.items():
             evaluate_result[key] = round(value, 6)
@@ -752,6 +900,9 @@ class ExtractiveQAMetric(MetricBase):
     :param bool print_predict_stat: True则输出预测答案是否为空与正确答案是否为空的统计信息, False则不输出
     
     """
+
+    _state_names = ('no_ans_correct', 'no_ans_wrong', 'has_ans_correct', 'has_ans_wrong', 'has_ans_f',
+                    'no2no', 'no2yes', 'yes2no', 'yes2yes')
     
     def __init__(self, pred1=None, pred2=None, target1=None, target2=None,
                  beta=1, right_open=True, print_predict_stat=False):
@@ -790,66 +941,56 @@ class ExtractiveQAMetric(MetricBase):
         """
         pred_start = pred1
         pred_end = pred2
-        target_start = target1
-        target_end = target2
         
         if len(pred_start.size()) == 2:
-            start_inference = pred_start.max(dim=-1)[1].cpu().tolist()
-        else:
-            start_inference = pred_start.cpu().tolist()
+            pred_start = pred_start.max(dim=-1)[1]
         if len(pred_end.size()) == 2:
-            end_inference = pred_end.max(dim=-1)[1].cpu().tolist()
-        else:
-            end_inference = pred_end.cpu().tolist()
-        
-        start, end = [], []
-        max_len = pred_start.size(1)
-        t_start = target_start.cpu().tolist()
-        t_end = target_end.cpu().tolist()
-        
-        for s, e in zip(start_inference, end_inference):
-            start.append(min(s, e))
-            end.append(max(s, e))
-        for s, e, ts, te in zip(start, end, t_start, t_end):
-            if not self.right_open:
-                e += 1
-                te += 1
-            if ts == 0 and te == int(not self.right_open):
-                if s == 0 and e == int(not self.right_open):
-                    self.no_ans_correct += 1
-                    self.no2no += 1
-                else:
-                    self.no_ans_wrong += 1
-                    self.no2yes += 1
-            else:
-                if s == 0 and e == int(not self.right_open):
-                    self.yes2no += 1
-                else:
-                    self.yes2yes += 1
-                
-                if s == ts and e == te:
-                    self.has_ans_correct += 1
-                else:
-                    self.has_ans_wrong += 1
-                a = [0] * s + [1] * (e - s) + [0] * (max_len - e)
-                b = [0] * ts + [1] * (te - ts) + [0] * (max_len - te)
-                a, b = torch.tensor(a), torch.tensor(b)
-                
-                TP = int(torch.sum(a * b))
-                pre = TP / int(torch.sum(a)) if int(torch.sum(a)) > 0 else 0
-                rec = TP / int(torch.sum(b)) if int(torch.sum(b)) > 0 else 0
-                
-                if pre + rec > 0:
-                    f = (1 + (self.f_beta ** 2)) * pre * rec / ((self.f_beta ** 2) * pre + rec)
-                else:
-                    f = 0
-                self.has_ans_f += f
+            pred_end = pred_end.max(dim=-1)[1]
+        pred_start, pred_end = pred_start.long(), pred_end.long()
+        target_start = target1.long().to(pred_start.device)
+        target_end = target2.long().to(pred_start.device)
+        
+        start = torch.min(pred_start, pred_end)
+        end = torch.max(pred_start, pred_end)
+        if not self.right_open:
+            end = end + 1
+            target_end = target_end + 1
+        # 以下统计量都以tensor的形式留在device上累计。此时都已是左闭右开区间, 无答案即为[0, 1)
+        pred_no_ans = (start == 0) & (end == 1)
+        gold_no_ans = (target_start == 0) & (target_end == 1)
+        gold_has_ans = ~gold_no_ans
+        
+        no2no = (gold_no_ans & pred_no_ans).sum()
+        no2yes = (gold_no_ans & ~pred_no_ans).sum()
+        self.no2no += no2no
+        self.no2yes += no2yes
+        self.no_ans_correct += no2no
+        self.no_ans_wrong += no2yes
+        self.yes2no += (gold_has_ans & pred_no_ans).sum()
+        self.yes2yes += (gold_has_ans & ~pred_no_ans).sum()
+        
+        exact_match = gold_has_ans & (start == target_start) & (end == target_end)
+        self.has_ans_correct += exact_match.sum()
+        self.has_ans_wrong += (gold_has_ans & ~exact_match).sum()
+        
+        # 预测的区间与正确区间重叠的长度即为TP
+        overlap = (torch.min(end, target_end) - torch.max(start, target_start)).clamp(min=0).double()
+        pre = overlap / (end - start).clamp(min=1).double()
+        rec = overlap / (target_end - target_start).clamp(min=1).double()
+        beta_square = self.f_beta ** 2
+        f = torch.where(overlap > 0, (1 + beta_square) * pre * rec / (beta_square * pre + rec).clamp(min=1e-13),
+                        torch.zeros_like(overlap))
+        self.has_ans_f += (f * gold_has_ans).sum()
     
     def get_metric(self, reset=True):
         """get_metric函数将根据evaluate函数累计的评价指标统计量来计算最终的评价结果."""
+        for name in self._state_names:
+            value = getattr(self, name)
+            if isinstance(value, torch.Tensor):
+                setattr(self, name, value.item())
         evaluate_result = {}
         
-        if self.no_ans_correct + self.no_ans_wrong + self.has_ans_correct + self.no_ans_wrong <= 0:
+        if self.no_ans_correct + self.no_ans_wrong + self.has_ans_correct + self.has_ans_wrong <= 0:
             return evaluate_result
         
         evaluate_result['EM'] = 0
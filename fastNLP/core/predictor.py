@@ -2,13 +2,16 @@
     ..todo::
         检查这个类是否需要
 """
+import json
 from collections import defaultdict
 
+import numpy as np
 import torch
 
 from . import DataSetIter
 from . import DataSet
 from . import SequentialSampler
+from .sampler import SortedSampler
 from .utils import _build_args, _move_dict_value_to_device, _get_model_device
 
 
@@ -19,61 +22,111 @@ class Predictor(object):
     与测试器（Tester）不同的是，predictor不关心模型性能的评价指标，只做inference。
     这是一个fastNLP调用的高级模型包装器。它与Trainer、Tester不共享任何操作。
 
+    提供了seq_len_field_name时，会将相邻的 ``batch_size * sort_batches`` 个样本按照长度排序后再组batch，减少pad的
+    计算，输出的顺序与data中的顺序保持一致。
+
     :param torch.nn.Module network: 用来完成预测任务的模型
+    :param int batch_size: 预测时batch的大小。大于1且没有提供seq_len_field_name时，序列类型的输出会被pad到所在batch中最长
+        的长度(pad的部分也会被输出，且结果与batch的组成有关)，因此需要按长度去掉pad时请提供seq_len_field_name。
+    :param int sort_batches: 每多少个batch的样本一起按照长度排序。越大pad越少，但是需要缓存的结果越多。
     """
 
-    def __init__(self, network):
+    def __init__(self, network, batch_size=1, sort_batches=100):
         if not isinstance(network, torch.nn.Module):
             raise ValueError(
                 "Only fastNLP.models.BaseModel or torch.nn,Module is allowed, not {}".format(type(network)))
         self.network = network
-        self.batch_size = 1
-        self.batch_output = []
+        self.batch_size = batch_size
+        self.sort_batches = sort_batches
 
     def predict(self, data: DataSet, seq_len_field_name=None):
         """用已经训练好的模型进行inference.
 
         :param fastNLP.DataSet data: 待预测的数据集
         :param str seq_len_field_name: 表示序列长度信息的field名字
-        :return: dict dict里面的内容为模型预测的结果
+        :return: dict dict里面的内容为模型预测的结果，每个key对应一个list，第i个元素为data中第i个样本的预测结果
+        """
+        batch_output = defaultdict(list)
+        for prediction in self.predict_iter(data, seq_len_field_name):
+            for key, value in prediction.items():
+                batch_output[key].append(value)
+        return batch_output
+
+    def predict_iter(self, data: DataSet, seq_len_field_name=None):
+        """
+        与 :meth:`predict` 相同，但是以generator的形式按照data中的顺序逐个返回每个样本的预测结果，内存中最多只保留
+        ``batch_size * sort_batches`` 个样本的结果。
+
+        :param fastNLP.DataSet data: 待预测的数据集
+        :param str seq_len_field_name: 表示序列长度信息的field名字
+        :return: generator, 每次返回一个dict，key为模型输出的key，value为该样本的预测结果。输出为一维或者
+            第二维为1时是list(或数字)，否则为np.ndarray，提供了seq_len_field_name时会去掉pad的部分，否则batch_size大于1
+            时包含pad的部分
         """
         if not isinstance(data, DataSet):
             raise ValueError("Only Dataset class is allowed, not {}.".format(type(data)))
         if seq_len_field_name is not None and seq_len_field_name not in data.field_arrays:
             raise ValueError("Field name {} not found in DataSet {}.".format(seq_len_field_name, data))
 
+        if seq_len_field_name is not None:
+            sampler = SortedSampler(seq_len_field_name, chunk_size=self.batch_size * self.sort_batches)
+        else:
+            sampler = SequentialSampler()
         prev_training = self.network.training
         self.network.eval()
         network_device = _get_model_device(self.network)
-        batch_output = defaultdict(list)
-        data_iterator = DataSetIter(data, batch_size=self.batch_size, sampler=SequentialSampler(), as_numpy=False)
+        pin_memory = network_device is not None and network_device.type == 'cuda'
+        data_iterator = DataSetIter(data, batch_size=self.batch_size, sampler=sampler, as_numpy=False,
+                                    pin_memory=pin_memory)
 
         if hasattr(self.network, "predict"):
             predict_func = self.network.predict
         else:
             predict_func = self.network.forward
 
-        with torch.no_grad():
-            for batch_x, _ in data_iterator:
-                _move_dict_value_to_device(batch_x, _, device=network_device)
-                refined_batch_x = _build_args(predict_func, **batch_x)
-                prediction = predict_func(**refined_batch_x)
-
-                if seq_len_field_name is not None:
-                    seq_lens = batch_x[seq_len_field_name].tolist()
-
-                for key, value in prediction.items():
-                    value = value.cpu().numpy()
-                    if len(value.shape) == 1 or (len(value.shape) == 2 and value.shape[1] == 1):
-                        batch_output[key].extend(value.tolist())
-                    else:
-                        if seq_len_field_name is not None:
-                            tmp_batch = []
-                            for idx, seq_len in enumerate(seq_lens):
-                                tmp_batch.append(value[idx, :seq_len])
-                            batch_output[key].extend(tmp_batch)
-                        else:
-                            batch_output[key].append(value)
-
-        self.network.train(prev_training)
-        return batch_output
+        # 排序后的结果先放在buffer中，等前面的样本都完成之后再按顺序输出
+        buffer = {}
+        next_index = 0
+        try:
+            with torch.no_grad():
+                for batch_x, _ in data_iterator:
+                    indices = data_iterator.get_batch_indices()
+                    _move_dict_value_to_device(batch_x, _, device=network_device, non_blocking=pin_memory)
+                    refined_batch_x = _build_args(predict_func, **batch_x)
+                    prediction = predict_func(**refined_batch_x)
+
+                    seq_lens = batch_x[seq_len_field_name].tolist() if seq_len_field_name is not None else None
+                    outputs = [{} for _ in indices]
+                    for key, value in prediction.items():
+                        value = value.cpu().numpy()  # 每个batch每个key只拷贝一次
+                        if len(value.shape) == 1 or (len(value.shape) == 2 and value.shape[1] == 1):
+                            value = value.tolist()
+                        elif seq_lens is not None:
+                            value = [value[idx, :seq_len] for idx, seq_len in enumerate(seq_lens)]
+                        for output, instance_value in zip(outputs, value):
+                            output[key] = instance_value
+                    buffer.update(zip(indices, outputs))
+
+                    while next_index in buffer:
+                        yield buffer.pop(next_index)
+                        next_index += 1
+        finally:
+            self.network.train(prev_training)
+
+    def predict_to_file(self, data: DataSet, path, seq_len_field_name=None):
+        """
+        将预测结果按照data中的顺序写入jsonl文件，每一行为一个样本的预测结果(key为模型输出的key)，不会在内存中保留所有的结果。
+
+        :param fastNLP.DataSet data: 待预测的数据集
+        :param str path: 保存的路径
+        :param str seq_len_field_name: 表示序列长度信息的field名字
+        :return: int, 写入的样本数量
+        """
+        count = 0
+        with open(path, 'w', encoding='utf-8') as f:
+            for prediction in self.predict_iter(data, seq_len_field_name):
+                prediction = {key: value.tolist() if isinstance(value, np.ndarray) else value
+                              for key, value in prediction.items()}
+                f.write(json.dumps(prediction, ensure_ascii=False) + '\n')
+                count += 1
+        return count
@@ -5,7 +5,11 @@ __all__ = [
     "Sampler",
     "BucketSampler",
     "SequentialSampler",
-    "RandomSampler"
+    "RandomSampler",
+    "SortedSampler",
+    "ConstTokenNumSampler",
+    "DistributedSampler",
+    "DistributedBatchSampler",
 ]
 
 from itertools import chain
@@ -55,6 +59,34 @@ class RandomSampler(Sampler):
         return list(np.random.permutation(len(data_set)))
 
 
+class SortedSampler(Sampler):
+    """
+    别名：:class:`fastNLP.SortedSampler` :class:`fastNLP.core.sampler.SortedSampler`
+
+    按照长度从长到短取出元素的 `Sampler` ，使同一个batch中的元素长度相近，减少pad。一般用于验证或预测，此时可以通过
+    :meth:`~fastNLP.DataSetIter.get_batch_indices` 得到的下标恢复原来的顺序。
+
+    :param str seq_len_field_name: 对应序列长度的 `field` 的名字
+    :param bool descending: 是否从长到短排序
+    :param int chunk_size: 大于0时将数据按顺序分为每chunk_size个一块，只在块内排序，这样按顺序输出结果时最多只需要缓存一块的
+        结果。为batch_size的整数倍时，每个batch都只包含同一块中的元素。
+    """
+
+    def __init__(self, seq_len_field_name='seq_len', descending=True, chunk_size=-1):
+        self.seq_len_field_name = seq_len_field_name
+        self.descending = descending
+        self.chunk_size = chunk_size
+
+    def __call__(self, data_set):
+        seq_lens = np.asarray(data_set.get_field(self.seq_len_field_name).content, dtype=np.int64)
+        if self.descending:
+            seq_lens = -seq_lens
+        chunk_size = self.chunk_size if self.chunk_size > 0 else max(len(seq_lens), 1)
+        indices = [start + np.argsort(seq_lens[start:start + chunk_size], kind='mergesort')
+                   for start in range(0, len(seq_lens), chunk_size)]
+        return np.concatenate(indices).tolist() if indices else []
+
+
 class BucketSampler(Sampler):
     """
     别名：:class:`fastNLP.BucketSampler` :class:`fastNLP.core.sampler.BucketSampler`
@@ -106,6 +138,205 @@ class BucketSampler(Sampler):
         return list(chain(*batchs))
 
 
+class ConstTokenNumSampler(object):
+    """
+    别名：:class:`fastNLP.ConstTokenNumSampler` :class:`fastNLP.core.sampler.ConstTokenNumSampler`
+
+    按照token数量组batch的 `batch sampler` 。与 :class:`~fastNLP.Sampler` 不同，它直接返回若干个batch的下标。
+    将样本按长度排序后依次放入batch，使每个batch pad之后的大小(max_len * batch中样本数量)不超过 ``max_token`` ，这样长句子
+    组成的batch中样本较少，短句子组成的batch中样本较多，每一步占用的显存基本恒定。超过 ``max_token`` 的单个样本会单独成为一个
+    batch。由于组batch只依赖于长度的分布，每个epoch的batch数量是固定的。::
+
+        sampler = ConstTokenNumSampler('seq_len', max_token=4096)
+        batch = DataSetIter(data_set, batch_sampler=sampler)
+        # 或者直接传给Trainer
+        trainer = Trainer(train_data, model, sampler=sampler)
+
+    :param str seq_len_field_name: 对应序列长度的 `field` 的名字
+    :param int max_token: 每个batch pad之后最多包含多少个token
+    :param int max_sentence: 每个batch最多包含多少个样本，为-1则不限制
+    :param bool shuffle: 是否打乱batch的顺序(长度相同的样本之间也会被打乱)。为False时按照长度从小到大返回
+    """
+
+    def __init__(self, seq_len_field_name='seq_len', max_token=4096, max_sentence=-1, shuffle=True):
+        assert max_token > 0, "max_token must be positive."
+        self.seq_len_field_name = seq_len_field_name
+        self.max_token = max_token
+        self.max_sentence = max_sentence
+        self.shuffle = shuffle
+
+    def __call__(self, data_set):
+        """
+        :param DataSet data_set: `DataSet` 对象, 需要Sample的数据
+        :return: List[List[int]], 每个元素为一个batch中样本的下标
+        """
+        seq_lens = self._get_seq_lens(data_set)
+        if self.shuffle:
+            order = np.random.permutation(len(seq_lens))
+            sorted_indices = order[np.argsort(seq_lens[order], kind='mergesort')]
+        else:
+            sorted_indices = np.argsort(seq_lens, kind='mergesort')
+        batches = [sorted_indices[start:end].tolist()
+                   for start, end in self._pack(seq_lens[sorted_indices])]
+        if self.shuffle:
+            np.random.shuffle(batches)
+        return batches
+
+    def get_num_batches(self, data_set):
+        """
+        返回data_set会被分成多少个batch
+
+        :param DataSet data_set:
+        :return: int
+        """
+        return len(self._pack(np.sort(self._get_seq_lens(data_set))))
+
+    def _get_seq_lens(self, data_set):
+        return np.asarray(data_set.get_field(self.seq_len_field_name).content, dtype=np.int64)
+
+    def _pack(self, sorted_seq_lens):
+        """
+        将从小到大排列好的长度贪心地分为若干个batch
+
+        :param np.ndarray sorted_seq_lens:
+        :return: List[(start, end)], 每个batch在sorted_seq_lens中的区间
+        """
+        spans = []
+        start = 0
+        total = len(sorted_seq_lens)
+        while start < total:
+            # batch中的其它样本都不会比第一个短，因此batch大小不会超过max_token // seq_len
+            window = max(self.max_token // max(int(sorted_seq_lens[start]), 1), 1)
+            if self.max_sentence > 0:
+                window = min(window, self.max_sentence)
+            seq_lens = sorted_seq_lens[start:start + window]
+            padded_sizes = seq_lens * np.arange(1, len(seq_lens) + 1)
+            size = max(int(np.count_nonzero(padded_sizes <= self.max_token)), 1)
+            spans.append((start, start + size))
+            start += size
+        return spans
+
+
+def _get_dist_info(num_replicas, rank):
+    if num_replicas is None or rank is None:
+        import torch.distributed as dist
+        if not dist.is_available() or not dist.is_initialized():
+            raise RuntimeError("torch.distributed is not initialized, please pass num_replicas and rank.")
+        num_replicas = dist.get_world_size() if num_replicas is None else num_replicas
+        rank = dist.get_rank() if rank is None else rank
+    if not 0 <= rank < num_replicas:
+        raise ValueError("rank should be in [0, {}), got {}.".format(num_replicas, rank))
+    return num_replicas, rank
+
+
+def _call_with_seed(sampler, data_set, seed):
+    """使用固定的随机种子调用sampler，保证所有进程得到相同的顺序，且不影响全局的numpy随机状态"""
+    state = np.random.get_state()
+    np.random.seed(seed)
+    try:
+        return sampler(data_set)
+    finally:
+        np.random.set_state(state)
+
+
+def _shard(items, num_replicas, rank, pad):
+    if pad and len(items) % num_replicas != 0:
+        # 重复开头的元素，使得每个进程得到的数量相同
+        num_padded = num_replicas - len(items) % num_replicas
+        items = items + (items * (num_padded // len(items) + 1))[:num_padded]
+    return items[rank::num_replicas]
+
+
+class DistributedSampler(Sampler):
+    """
+    别名：:class:`fastNLP.DistributedSampler` :class:`fastNLP.core.sampler.DistributedSampler`
+
+    分布式训练时使用的 `Sampler` 。包裹一个 :class:`~fastNLP.Sampler` ，所有进程使用相同的随机种子调用它得到同样的顺序，
+    然后每个进程只取出属于自己的那一份(第rank, rank+num_replicas, ...个)。每次调用后种子会加1，因此每个epoch的顺序不同。::
+
+        sampler = DistributedSampler(BucketSampler(batch_size=32))
+        batch = DataSetIter(data_set, batch_size=32, sampler=sampler)
+
+    :param sampler: 被包裹的 :class:`~fastNLP.Sampler` ，为None时使用 :class:`~fastNLP.RandomSampler`
+    :param int num_replicas: 进程数量，为None时通过torch.distributed.get_world_size()获取
+    :param int rank: 当前进程的编号，为None时通过torch.distributed.get_rank()获取
+    :param int seed: 随机种子，所有进程需要相同
+    :param bool pad: 是否重复部分样本使得每个进程的样本数量相同。训练时需要为True，否则各个进程的step数量可能不一致
+    """
+
+    def __init__(self, sampler=None, num_replicas=None, rank=None, seed=0, pad=True):
+        if sampler is not None and not isinstance(sampler, Sampler):
+            raise TypeError("sampler should be fastNLP.Sampler, got {}.".format(type(sampler)))
+        self.sampler = sampler if sampler is not None else RandomSampler()
+        self.num_replicas, self.rank = _get_dist_info(num_replicas, rank)
+        self.seed = seed
+        self.pad = pad
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        """设置下一次调用时使用的epoch，真正使用的随机种子为seed + epoch"""
+        self.epoch = epoch
+
+    def __call__(self, data_set):
+        indices = list(_call_with_seed(self.sampler, data_set, self.seed + self.epoch))
+        self.epoch += 1
+        return _shard(indices, self.num_replicas, self.rank, self.pad)
+
+    def get_num_samples(self, num_samples):
+        """
+        返回当前进程会分到多少个样本
+
+        :param int num_samples: 整个数据集的样本数量
+        :return: int
+        """
+        if self.pad:
+            return (num_samples + self.num_replicas - 1) // self.num_replicas
+        return len(range(self.rank, num_samples, self.num_replicas))
+
+
+class DistributedBatchSampler(object):
+    """
+    别名：:class:`fastNLP.DistributedBatchSampler` :class:`fastNLP.core.sampler.DistributedBatchSampler`
+
+    与 :class:`~fastNLP.DistributedSampler` 相同，但包裹的是 :class:`~fastNLP.ConstTokenNumSampler` 这样的 `batch sampler` ，
+    以batch为单位分给各个进程。
+
+    :param batch_sampler: 被包裹的 `batch sampler` ，需要实现 ``__call__`` 与 ``get_num_batches``
+    :param int num_replicas: 进程数量，为None时通过torch.distributed.get_world_size()获取
+    :param int rank: 当前进程的编号，为None时通过torch.distributed.get_rank()获取
+    :param int seed: 随机种子，所有进程需要相同
+    :param bool pad: 是否重复部分batch使得每个进程的batch数量相同
+    """
+
+    def __init__(self, batch_sampler, num_replicas=None, rank=None, seed=0, pad=True):
+        self.batch_sampler = batch_sampler
+        self.num_replicas, self.rank = _get_dist_info(num_replicas, rank)
+        self.seed = seed
+        self.pad = pad
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        """设置下一次调用时使用的epoch，真正使用的随机种子为seed + epoch"""
+        self.epoch = epoch
+
+    def __call__(self, data_set):
+        batches = list(_call_with_seed(self.batch_sampler, data_set, self.seed + self.epoch))
+        self.epoch += 1
+        return _shard(batches, self.num_replicas, self.rank, self.pad)
+
+    def get_num_batches(self, data_set):
+        """
+        返回当前进程会分到多少个batch
+
+        :param DataSet data_set:
+        :return: int
+        """
+        num_batches = self.batch_sampler.get_num_batches(data_set)
+        if self.pad:
+            return (num_batches + self.num_replicas - 1) // self.num_replicas
+        return len(range(self.rank, num_batches, self.num_replicas))
+
+
 def simple_sort_bucketing(lengths):
     """
 
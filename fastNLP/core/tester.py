@@ -35,10 +35,11 @@ Tester在验证进行之前会调用model.eval()提示当前进入了evaluation
 import torch
 import torch.nn as nn
 
-from .batch import BatchIter, DataSetIter
+from .batch import BatchIter, DataSetIter, PrefetchIter
 from .dataset import DataSet
 from .metrics import _prepare_metrics
 from .sampler import SequentialSampler
+from .sampler import DistributedSampler
 from .utils import _CheckError
 from .utils import _build_args
 from .utils import _check_loss_evaluate
@@ -48,6 +49,7 @@ from .utils import _get_model_device
 from .utils import _move_model_to_device
 from ._parallel_utils import _data_parallel_wrapper
 from functools import partial
+import warnings
 
 __all__ = [
     "Tester"
@@ -80,9 +82,16 @@ class Tester(object):
 
         如果模型是通过predict()进行预测的话，那么将不能使用多卡(DataParallel)进行验证，只会使用第一张卡上的模型。
     :param int verbose: 如果为0不输出任何信息; 如果为1，打印出验证结果。
+    :param int num_prefetch: 大于0时使用 :class:`~fastNLP.PrefetchIter` 在后台线程中提前准备num_prefetch个batch，
+        并提前搬运到模型所在的device上。
+    :param sampler: 验证时取数据的顺序， :class:`~fastNLP.Sampler` 类型，为None时使用 :class:`~fastNLP.SequentialSampler` 。
+    :param bool use_dist: 是否进行分布式验证(需要先初始化torch.distributed)。为True时每个进程只验证data中属于自己的一部分，
+        然后将各个进程中Metric累计的统计量合并(参见 :class:`~fastNLP.core.metrics.MetricBase` 的 ``_state_names`` )，
+        因此每个进程得到的验证结果相同。所有进程都需要调用test()。
     """
     
-    def __init__(self, data, model, metrics, batch_size=16, num_workers=0, device=None, verbose=1):
+    def __init__(self, data, model, metrics, batch_size=16, num_workers=0, device=None, verbose=1, num_prefetch=0,
+                 sampler=None, use_dist=False):
         super(Tester, self).__init__()
         
         if not isinstance(data, DataSet):
@@ -94,16 +103,28 @@ class Tester(object):
         
         self.data = data
         self._model = _move_model_to_device(model, device=device)
+        if isinstance(self._model, nn.parallel.DistributedDataParallel):
+            self._model = self._model.module  # 验证时不需要进程之间的同步
         self.batch_size = batch_size
         self.verbose = verbose
-
+        self.use_dist = use_dist
+
+        model_device = _get_model_device(self._model)
+        pin_memory = model_device is not None and model_device.type == 'cuda'
+        self.pin_memory = pin_memory
+        sampler = sampler if sampler is not None else SequentialSampler()
+        if use_dist:
+            sampler = DistributedSampler(sampler, pad=False)  # 不重复样本，否则会影响验证结果
         if isinstance(data, DataSet):
             self.data_iterator = DataSetIter(
-                dataset=data, batch_size=batch_size, num_workers=num_workers, sampler=SequentialSampler())
+                dataset=data, batch_size=batch_size, num_workers=num_workers, pin_memory=pin_memory,
+                sampler=sampler)
         elif isinstance(data, BatchIter):
             self.data_iterator = data
         else:
             raise TypeError("data type {} not support".format(type(data)))
+        if num_prefetch > 0:
+            self.data_iterator = PrefetchIter(self.data_iterator, num_prefetch=num_prefetch, device=model_device)
 
         # check predict
         if (hasattr(self._model, 'predict') and callable(self._model.predict)) or \
@@ -141,7 +162,8 @@ class Tester(object):
         try:
             with torch.no_grad():
                 for batch_x, batch_y in data_iterator:
-                    _move_dict_value_to_device(batch_x, batch_y, device=self._model_device)
+                    _move_dict_value_to_device(batch_x, batch_y, device=self._model_device,
+                                               non_blocking=self.pin_memory)
                     pred_dict = self._data_forward(self._predict_func, batch_x)
                     if not isinstance(pred_dict, dict):
                         raise TypeError(f"The return value of {_get_func_signature(self._predict_func)} "
@@ -149,10 +171,13 @@ class Tester(object):
                     for metric in self.metrics:
                         metric(pred_dict, batch_y)
                 for metric in self.metrics:
+                    reduced = self.use_dist and metric._reduce_state()
                     eval_result = metric.get_metric()
                     if not isinstance(eval_result, dict):
                         raise TypeError(f"The return value of {_get_func_signature(metric.get_metric)} must be "
                                         f"`dict`, got {type(eval_result)}")
+                    if self.use_dist and not reduced:
+                        eval_result = _average_eval_result(metric, eval_result)
                     metric_name = metric.__class__.__name__
                     eval_results[metric_name] = eval_result
         except _CheckError as e:
@@ -196,3 +221,14 @@ class Tester(object):
             _str += ", ".join([str(key) + "=" + str(value) for key, value in metric_result.items()])
             _str += '\n'
         return _str[:-1]
+
+
+def _average_eval_result(metric, eval_result):
+    """Metric没有声明_state_names时，只能对各个进程的验证结果取平均，这在各进程样本数量不同时不是精确值"""
+    import torch.distributed as dist
+    warnings.warn(f"{metric.__class__.__name__} does not define `_state_names`, the evaluation results of all "
+                  f"processes are averaged, which may be inaccurate.")
+    gathered = [None] * dist.get_world_size()
+    dist.all_gather_object(gathered, eval_result)
+    return {key: sum(result[key] for result in gathered) / len(gathered) if isinstance(value, (int, float)) else value
+            for key, value in eval_result.items()}
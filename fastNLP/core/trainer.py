@@ -299,7 +299,9 @@ __all__ = [
     "Trainer"
 ]
 
+import contextlib
 import os
+import threading
 import time
 from datetime import datetime, timedelta
 
@@ -313,7 +315,7 @@ except:
     from .utils import _pseudo_tqdm as tqdm
 import warnings
 
-from .batch import DataSetIter, BatchIter
+from .batch import DataSetIter, BatchIter, PrefetchIter
 from .callback import CallbackManager, CallbackException
 from .dataset import DataSet
 from .losses import _prepare_losser
@@ -321,6 +323,7 @@ from .metrics import _prepare_metrics
 from .optimizer import Optimizer
 from .sampler import Sampler
 from .sampler import RandomSampler
+from .sampler import ConstTokenNumSampler
 from .tester import Tester
 from .utils import _CheckError
 from .utils import _build_args
@@ -330,6 +333,13 @@ from .utils import _move_dict_value_to_device
 from .utils import _get_func_signature
 from .utils import _get_model_device
 from .utils import _move_model_to_device
+from .utils import _prepare_precision
+from .utils import _AsyncSaver
+from .utils import _ModelSnapshot
+from .utils import _copy_to_cpu
+from .utils import _get_rng_state
+from .utils import _set_rng_state
+from .utils import _torch_load
 
 
 class Trainer(object):
@@ -350,7 +360,8 @@ class Trainer(object):
     :param optimizer: `torch.optim.Optimizer` 优化器。如果为None，则Trainer使用默认的Adam(model.parameters(), lr=4e-3)这个优化器
     :param int batch_size: 训练和验证的时候的batch大小。
     :param loss: 使用的 :class:`~fastNLP.core.losses.LossBase` 对象。当为None时，默认使用 :class:`~fastNLP.LossInForward`
-    :param sampler: Batch数据生成的顺序， :class:`~fastNLP.Sampler` 类型。如果为None，默认使用 :class:`~fastNLP.RandomSampler`
+    :param sampler: Batch数据生成的顺序， :class:`~fastNLP.Sampler` 类型。如果为None，默认使用 :class:`~fastNLP.RandomSampler` 。
+        也可以传入 :class:`~fastNLP.ConstTokenNumSampler` ，按照token数量组batch，此时batch_size只用于验证。
     :param drop_last: 如果最后一个batch没有正好为batch_size这么多数据，就扔掉最后一个batch
     :param num_workers: int, 有多少个线程来进行数据pad处理。
     :param update_every: int, 多少步更新一次梯度。用于希望累计梯度的场景，比如需要128的batch_size, 但是直接设为128
@@ -386,12 +397,28 @@ class Trainer(object):
 
         已知可能会出现的问题：Adagrad优化器可能无法正常使用这个参数，请手动管理模型位置。
 
+    :param int num_prefetch: 大于0时使用 :class:`~fastNLP.PrefetchIter` 在后台线程中提前准备num_prefetch个batch，
+        并提前搬运到模型所在的device上(gpu上为pin memory + non_blocking的异步拷贝)，使数据准备与计算重叠。验证时同样生效。
+    :param str,None precision: 训练时使用的精度，支持None(或'fp32'), 'fp16', 'bf16'。为'fp16'或'bf16'时，forward与loss的
+        计算在torch.autocast下进行，可以减少约一半的activation显存；在gpu上使用'fp16'时还会使用GradScaler对loss进行缩放，
+        防止梯度下溢。模型在cpu上时统一使用'bf16'。
     :param list(callbacks) callbacks: 用于在train过程中起调节作用的回调函数。比如early stop，negative sampling等可以
         通过callback机制实现。 可使用的callback参见 :doc:`callback模块 <fastNLP.core.callback>`
     :param int check_code_level: 模型检查等级. -1: 不进行检查; 0: 仅出现错误时停止; 1: 如果有field没有被使用，
         报告警告信息; 2: 有任何field没有被使用都报错. 检查的原理是通过使用很小的batch(默认2个sample)来运行代码，但是
         这个过程理论上不会修改任何参数，只是会检查能否运行。但如果(1)模型中存在将batch_size写为某个固定值的情况；
         (2)模型中存在累加前向计算次数的，可能会多计算1次。以上情况建议将check_code_level设置为-1。
+    :param str,None checkpoint_path: 周期性保存完整checkpoint的文件路径(每次覆盖)，为None时不保存。checkpoint中包含模型与
+        optimizer的参数、step与epoch、最好的验证结果、当前epoch的sampler顺序、python/numpy/torch的随机状态以及callback的状态
+        (参见 :meth:`~fastNLP.Callback.state_dict` )，可以通过 ``train(resume_from=checkpoint_path)`` 从中断的位置继续训练。
+        保存在后台线程中进行，并先写入临时文件再替换，不会因为中断而留下损坏的checkpoint。
+    :param int checkpoint_every: 多少个step保存一次checkpoint; 如果为-1，则每个epoch结束保存一次。
+    :param bool async_validation: 为True时验证在后台线程中进行，不阻塞训练。验证时先将模型的参数与buffer(state_dict)复制到
+        cpu上的一份快照中，然后在后台线程中用载有这份快照的cpu上的模型验证dev_data(该模型只在第一次验证时通过序列化构建一次，
+        因此模型需要可以被torch.save保存)。on_valid_begin在开始验证时调用，on_valid_end在验证完成后的下一个
+        step调用，最好的模型与early stop等以最近一次完成的验证结果为准；此时callback中的model已经继续训练了若干个step，
+        得到验证结果的模型以及对应的epoch与step需要通过Callback的valid_model, valid_epoch与valid_step获取。同一时间最多进行一个验证，如果到下一次验证时上一次
+        验证还没有完成，会先等待其完成。
     """
     
     def __init__(self, train_data, model, optimizer=None, loss=None,
@@ -399,7 +426,8 @@ class Trainer(object):
                  num_workers=0, n_epochs=10, print_every=5,
                  dev_data=None, metrics=None, metric_key=None,
                  validate_every=-1, save_path=None, use_tqdm=True, device=None, prefetch=False,
-                 callbacks=None, check_code_level=0):
+                 num_prefetch=0, precision=None, callbacks=None, check_code_level=0,
+                 checkpoint_path=None, checkpoint_every=-1, async_validation=False):
         if prefetch and num_workers==0:
             num_workers = 1
         if prefetch:
@@ -438,26 +466,40 @@ class Trainer(object):
         losser = _prepare_losser(loss)
         
         # sampler check
-        if sampler is not None and not isinstance(sampler, Sampler):
+        if sampler is not None and not isinstance(sampler, (Sampler, ConstTokenNumSampler)):
             raise ValueError("The type of sampler should be fastNLP.BaseSampler, got {}.".format(type(sampler)))
 
         if sampler is None:
             sampler = RandomSampler()
 
-        if isinstance(train_data, DataSet):
-            self.data_iterator = DataSetIter(
-                dataset=train_data, batch_size=batch_size, num_workers=num_workers, sampler=sampler, drop_last=drop_last)
-        elif isinstance(train_data, BatchIter):
-            self.data_iterator = train_data
-        else:
+        if not isinstance(train_data, (DataSet, BatchIter)):
             raise TypeError("train_data type {} not support".format(type(train_data)))
 
-        if check_code_level > -1 and isinstance(self.data_iterator, DataSetIter):
+        if check_code_level > -1 and isinstance(train_data, DataSet):
             _check_code(dataset=train_data, model=model, losser=losser, metrics=metrics, dev_data=dev_data,
                         metric_key=self.metric_key, check_level=check_code_level,
                         batch_size=min(batch_size, DEFAULT_CHECK_BATCH_SIZE))
             # _check_code 是 fastNLP 帮助你检查代码是否正确的方法 。如果你在错误栈中看到这行注释，请认真检查你的代码
         self.model = _move_model_to_device(model, device=device)
+        model_device = _get_model_device(self.model)
+        # 模型在gpu上时使用pin memory，使得batch可以异步地拷贝到gpu
+        pin_memory = model_device is not None and model_device.type == 'cuda'
+        self.pin_memory = pin_memory
+
+        if isinstance(train_data, DataSet) and isinstance(sampler, ConstTokenNumSampler):
+            self.data_iterator = DataSetIter(
+                dataset=train_data, num_workers=num_workers, pin_memory=pin_memory, batch_sampler=sampler)
+        elif isinstance(train_data, DataSet):
+            self.data_iterator = DataSetIter(
+                dataset=train_data, batch_size=batch_size, num_workers=num_workers, pin_memory=pin_memory,
+                sampler=sampler, drop_last=drop_last)
+        else:
+            self.data_iterator = train_data
+        if num_prefetch > 0:
+            self.data_iterator = PrefetchIter(self.data_iterator, num_prefetch=num_prefetch, device=model_device)
+        self.precision = precision
+        self._autocast_device_type, self._autocast_dtype, self.grad_scaler = \
+            _prepare_precision(precision, model_device)
 
         self.train_data = train_data
         self.dev_data = dev_data  # If None, No validation.
@@ -472,8 +514,10 @@ class Trainer(object):
         self.best_dev_epoch = None
         self.best_dev_step = None
         self.best_dev_perf = None
-        self.n_steps = (len(self.train_data) // self.batch_size + int(
-            len(self.train_data) % self.batch_size != 0)) * int(drop_last==0) * self.n_epochs
+        if self.data_iterator.num_batches is not None:
+            self.n_steps = self.data_iterator.num_batches * self.n_epochs
+        else:  # 比如OnlineDataIter, 无法事先知道batch的数量
+            self.n_steps = None
 
         if isinstance(optimizer, torch.optim.Optimizer):
             self.optimizer = optimizer
@@ -493,6 +537,7 @@ class Trainer(object):
                                  data=self.dev_data,
                                  metrics=self.metrics,
                                  batch_size=self.batch_size,
+                                 num_prefetch=num_prefetch,
                                  device=None,  # 由上面的部分处理device
                                  verbose=0)
         
@@ -502,7 +547,26 @@ class Trainer(object):
         self.callback_manager = CallbackManager(env={"trainer": self},
                                                 callbacks=callbacks)
 
-    def train(self, load_best_model=True, on_exception='auto'):
+        if not (checkpoint_path is None or isinstance(checkpoint_path, str)):
+            raise ValueError("checkpoint_path can only be None or `str`.")
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = int(checkpoint_every) if checkpoint_every != 0 else -1
+        self._checkpoint_saver = _AsyncSaver()
+        self._resume_states = None
+        # dev上表现最好的模型在cpu上的快照，save_path不为None时在后台写入save_path
+        self._best_model_snapshot = _ModelSnapshot()
+        self.async_validation = async_validation
+        self._valid_snapshot = _ModelSnapshot()  # 后台验证使用的模型快照
+        self._valid_tester = None
+        self._valid_thread = None
+        # 最近一次验证对应的epoch, step与模型(后台验证时为验证使用的快照)，在on_valid_end中供callback使用
+        self.valid_epoch = None
+        self.valid_step = None
+        self.valid_model = None
+        self._valid_step = None  # 后台验证中的快照对应的(epoch, step)
+        self._valid_result = None
+
+    def train(self, load_best_model=True, on_exception='auto', resume_from=None):
         """
         使用该函数使Trainer开始训练。
 
@@ -511,6 +575,8 @@ class Trainer(object):
         :param str on_exception: 在训练过程遭遇exception，并被 :py:class:Callback 的on_exception()处理后，是否继续抛出异常。
                 支持'ignore','raise', 'auto': 'ignore'将捕获异常，写在Trainer.train()后面的代码将继续运行; 'raise'将异常抛出;
                 'auto'将ignore以下两种Exception: CallbackException与KeyboardInterrupt, raise其它exception.
+        :param str resume_from: checkpoint的路径(参见初始化参数checkpoint_path)。不为None时从checkpoint保存时的位置继续训练，
+                如果checkpoint是在epoch中间保存的，会从该epoch中下一个batch开始。
         :return dict: 返回一个字典类型的数据,
                 内含以下内容::
 
@@ -533,12 +599,16 @@ class Trainer(object):
             self._load_best_model = load_best_model
             self.start_time = str(datetime.now().strftime('%Y-%m-%d-%H-%M-%S'))
             start_time = time.time()
+            if resume_from is not None:
+                self._load_checkpoint(resume_from)
             print("training epochs started " + self.start_time, flush=True)
             
             try:
                 self.callback_manager.on_train_begin()
                 self._train()
                 self.callback_manager.on_train_end()
+                self._checkpoint_saver.wait()
+                self._best_model_snapshot.wait()
 
             except BaseException as e:
                 self.callback_manager.on_exception(e)
@@ -575,24 +645,45 @@ class Trainer(object):
             inner_tqdm = tqdm
         self.step = 0
         self.epoch = 0
+        start_epoch = 1
+        self._num_epoch_batches = 0
+        resume_states, self._resume_states = self._resume_states, None
+        rng_state = None
+        if resume_states is not None:
+            self.step = resume_states['step']
+            if resume_states['epoch_finished']:
+                start_epoch = resume_states['epoch'] + 1
+                _set_rng_state(resume_states['rng'])
+            else:
+                start_epoch = resume_states['epoch']
+                self._num_epoch_batches = resume_states['num_epoch_batches']
+                self.data_iterator.resume_epoch(resume_states['epoch_indices'], self._num_epoch_batches)
+                # 读取第一个batch之后再恢复随机状态，与中断前继续训练时的情况保持一致
+                rng_state = resume_states['rng']
         start = time.time()
-        if isinstance(self.model, nn.DataParallel):
+        if isinstance(self.model, (nn.DataParallel, nn.parallel.DistributedDataParallel)):
             self._forward_func = self.model.module.forward
         else:
             self._forward_func = self.model.forward
-        with inner_tqdm(total=self.n_steps, postfix='loss:{0:<6.5f}', leave=False, dynamic_ncols=True) as pbar:
+        with inner_tqdm(total=self.n_steps, initial=self.step, postfix='loss:{0:<6.5f}', leave=False,
+                        dynamic_ncols=True) as pbar:
             self.pbar = pbar
             avg_loss = 0
             data_iterator = self.data_iterator
             self.batch_per_epoch = data_iterator.num_batches
-            for epoch in range(1, self.n_epochs + 1):
+            for epoch in range(start_epoch, self.n_epochs + 1):
                 self.epoch = epoch
                 pbar.set_description_str(desc="Epoch {}/{}".format(epoch, self.n_epochs))
                 # early stopping
                 self.callback_manager.on_epoch_begin()
                 for batch_x, batch_y in data_iterator:
+                    if rng_state is not None:
+                        _set_rng_state(rng_state)
+                        rng_state = None
                     self.step += 1
-                    _move_dict_value_to_device(batch_x, batch_y, device=self._model_device)
+                    self._num_epoch_batches += 1
+                    _move_dict_value_to_device(batch_x, batch_y, device=self._model_device,
+                                               non_blocking=self.pin_memory)
                     indices = data_iterator.get_batch_indices()
                     # negative sampling; replace unknown; re-weight batch_y
                     self.callback_manager.on_batch_begin(batch_x, batch_y, indices)
@@ -626,42 +717,157 @@ class Trainer(object):
                         avg_loss = 0
                     self.callback_manager.on_batch_end()
                     
-                    if ((self.validate_every > 0 and self.step % self.validate_every == 0) or
-                        (self.validate_every < 0 and self.step % len(data_iterator) == 0)) \
+                    if self._valid_thread is not None:
+                        self._finish_async_validation(wait=False)
+                    if self.validate_every > 0 and self.step % self.validate_every == 0 \
                             and self.dev_data is not None:
-                        eval_res = self._do_validation(epoch=epoch, step=self.step)
-                        eval_str = "Evaluation at Epoch {}/{}. Step:{}/{}. ".format(epoch, self.n_epochs, self.step,
-                                                                                    self.n_steps) + \
-                                   self.tester._format_eval_results(eval_res)
-                        pbar.write(eval_str + '\n')
+                        self._validate_and_write(epoch, pbar)
+                    
+                    if self.checkpoint_every > 0 and self.step % self.checkpoint_every == 0:
+                        self._save_checkpoint(epoch_finished=False)
                 
                 # ================= mini-batch end ==================== #
+                if rng_state is not None:  # 恢复的epoch中已经没有剩余的batch
+                    _set_rng_state(rng_state)
+                    rng_state = None
+                # 在epoch结束时验证，而不依赖于len(data_iterator)，因此也支持OnlineDataIter这种不知道长度的数据
+                if self.validate_every < 0 and self.dev_data is not None:
+                    self._validate_and_write(epoch, pbar)
                 
                 # lr decay; early stopping
                 self.callback_manager.on_epoch_end()
+                self._num_epoch_batches = 0
+                if self.checkpoint_every < 0:
+                    self._save_checkpoint(epoch_finished=True)
             # =============== epochs end =================== #
+            self._finish_async_validation(wait=True)
             pbar.close()
             self.pbar = None
         # ============ tqdm end ============== #
     
+    def _save_checkpoint(self, epoch_finished):
+        """在后台线程中将当前的训练状态保存到checkpoint_path"""
+        if self.checkpoint_path is None:
+            return
+        self._finish_async_validation(wait=True)  # 使checkpoint中包含正在进行的验证的结果
+        model = self.model.module if isinstance(self.model, (nn.DataParallel, nn.parallel.DistributedDataParallel)) \
+            else self.model
+        states = {
+            'model': model.state_dict(),
+            'optimizer': self.optimizer.state_dict(),
+            'grad_scaler': self.grad_scaler.state_dict() if self.grad_scaler is not None else None,
+            'step': self.step,
+            'epoch': self.epoch,
+            'epoch_finished': epoch_finished,
+            'num_epoch_batches': self._num_epoch_batches,
+            'epoch_indices': None if epoch_finished else self.data_iterator.get_epoch_indices(),
+            'metric_key': self.metric_key,
+            'best_metric_indicator': self.best_metric_indicator,
+            'best_dev_perf': self.best_dev_perf,
+            'best_dev_epoch': self.best_dev_epoch,
+            'best_dev_step': self.best_dev_step,
+            'best_model_states': self._best_model_snapshot.state_dict() if self.save_path is None else None,
+            'start_time': self.start_time,
+            'rng': _get_rng_state(),
+            'callbacks': self.callback_manager.state_dict(),
+        }
+        # 在主线程中复制一份快照，之后的参数更新不会影响正在后台写入的内容
+        self._checkpoint_saver.save(_copy_to_cpu(states), self.checkpoint_path)
+
+    def _load_checkpoint(self, path):
+        """读取checkpoint并恢复模型、optimizer等状态，sampler顺序与随机状态在_train()开始时恢复"""
+        states = _torch_load(path, map_location='cpu')
+        model = self.model.module if isinstance(self.model, (nn.DataParallel, nn.parallel.DistributedDataParallel)) \
+            else self.model
+        model.load_state_dict(states['model'])
+        self.optimizer.load_state_dict(states['optimizer'])
+        if self.grad_scaler is not None and states['grad_scaler'] is not None:
+            self.grad_scaler.load_state_dict(states['grad_scaler'])
+        self.metric_key = states['metric_key']
+        self.best_metric_indicator = states['best_metric_indicator']
+        self.best_dev_perf = states['best_dev_perf']
+        self.best_dev_epoch = states['best_dev_epoch']
+        self.best_dev_step = states['best_dev_step']
+        if states['best_model_states'] is not None:
+            self._best_model_snapshot.load_state_dict(self.model, states['best_model_states'])
+        self.start_time = states['start_time']  # 保证保存在save_path中的最好模型的文件名不变
+        self.callback_manager.load_state_dict(states['callbacks'])
+        if not states['epoch_finished'] and states['epoch_indices'] is None:
+            warnings.warn("The data iterator does not support resuming the sampling order, the consumed batches of "
+                          "the interrupted epoch will be read and discarded.")
+        self._resume_states = states
+
+    def _validate_and_write(self, epoch, pbar):
+        if self.async_validation:
+            self._finish_async_validation(wait=True)
+            self._start_async_validation(epoch)
+        else:
+            eval_res = self._do_validation(epoch=epoch, step=self.step)
+            self._write_eval_result(eval_res, epoch, self.step, pbar)
+
+    def _write_eval_result(self, eval_res, epoch, step, pbar):
+        eval_str = "Evaluation at Epoch {}/{}. Step:{}/{}. ".format(epoch, self.n_epochs, step,
+                                                                    self.n_steps) + \
+                   self.tester._format_eval_results(eval_res)
+        pbar.write(eval_str + '\n')
+
     def _do_validation(self, epoch, step):
         self.callback_manager.on_valid_begin()
         res = self.tester.test()
-        
+        self._update_best_eval(res, epoch, step, self.model)
+        return res
+
+    def _update_best_eval(self, res, epoch, step, model):
+        # model为得到res的模型，在后台验证时是验证使用的快照
         is_better_eval = False
         if self._better_eval_result(res):
+            if self.save_path is not None or self._load_best_model:
+                self._best_model_snapshot.update(model)
             if self.save_path is not None:
-                self._save_model(self.model,
-                                 "best_" + "_".join([self.model.__class__.__name__, self.metric_key, self.start_time]))
-            elif self._load_best_model:
-                self._best_model_states = {name: param.cpu().clone() for name, param in self.model.named_parameters()}
+                model_name = "best_" + "_".join([self.model.__class__.__name__, self.metric_key, self.start_time])
+                self._best_model_snapshot.save(os.path.join(self.save_path, model_name))
             self.best_dev_perf = res
             self.best_dev_epoch = epoch
             self.best_dev_step = step
             is_better_eval = True
+        self.valid_epoch, self.valid_step, self.valid_model = epoch, step, model
         # get validation results; adjust optimizer
         self.callback_manager.on_valid_end(res, self.metric_key, self.optimizer, is_better_eval)
-        return res
+
+    def _start_async_validation(self, epoch):
+        """将当前的模型复制到快照中，并在后台线程中开始验证"""
+        self.callback_manager.on_valid_begin()
+        self._valid_snapshot.update(self.model)
+        valid_model = self._valid_snapshot.get_model()
+        if self._valid_tester is None:
+            self._valid_tester = Tester(model=valid_model, data=self.dev_data, metrics=self.metrics,
+                                        batch_size=self.batch_size, device=None, verbose=0)
+        self._valid_step = (epoch, self.step)
+        self._valid_thread = threading.Thread(target=self._run_async_validation, daemon=True)
+        self._valid_thread.start()
+
+    def _run_async_validation(self):
+        try:
+            self._valid_result = self._valid_tester.test()
+        except BaseException as e:
+            self._valid_result = e
+
+    def _finish_async_validation(self, wait):
+        """
+        处理已经完成的后台验证的结果。
+
+        :param bool wait: 为True时等待正在进行的验证完成；为False时如果验证还没有完成则直接返回
+        """
+        if self._valid_thread is None or (not wait and self._valid_thread.is_alive()):
+            return
+        self._valid_thread.join()
+        self._valid_thread = None
+        res, self._valid_result = self._valid_result, None
+        if isinstance(res, BaseException):
+            raise res
+        epoch, step = self._valid_step
+        self._update_best_eval(res, epoch, step, self._valid_snapshot.get_model())
+        self._write_eval_result(res, epoch, step, self.pbar)
     
     def _mode(self, model, is_test=False):
         """Train mode or Test mode. This is for PyTorch currently.
@@ -680,11 +886,22 @@ class Trainer(object):
 
         """
         if self.step % self.update_every == 0:
-            self.optimizer.step()
+            if self.grad_scaler is not None:
+                self.grad_scaler.step(self.optimizer)
+                self.grad_scaler.update()
+            else:
+                self.optimizer.step()
     
+    def _autocast(self):
+        """precision不为None时返回torch.autocast，否则返回一个不做任何事情的context manager"""
+        if self._autocast_dtype is None:
+            return contextlib.suppress()
+        return torch.autocast(device_type=self._autocast_device_type, dtype=self._autocast_dtype)
+
     def _data_forward(self, network, x):
         x = _build_args(self._forward_func, **x)
-        y = network(**x)
+        with self._autocast():
+            y = network(**x)
         if not isinstance(y, dict):
             raise TypeError(
                 f"The return value of {_get_func_signature(self._forward_func)} should be dict, got {type(y)}.")
@@ -699,7 +916,10 @@ class Trainer(object):
         """
         if (self.step-1) % self.update_every == 0:
             self.model.zero_grad()
-        loss.backward()
+        if self.grad_scaler is not None:
+            self.grad_scaler.scale(loss).backward()
+        else:
+            loss.backward()
     
     def _compute_loss(self, predict, truth):
         """Compute loss given prediction and ground truth.
@@ -708,7 +928,8 @@ class Trainer(object):
         :param truth: ground truth dict, produced by batch_y
         :return: a scalar
         """
-        return self.losser(predict, truth)
+        with self._autocast():
+            return self.losser(predict, truth)
     
     def _save_model(self, model, model_name, only_param=False):
         """ 存储不含有显卡信息的state_dict或model
@@ -721,7 +942,7 @@ class Trainer(object):
             model_path = os.path.join(self.save_path, model_name)
             if not os.path.exists(self.save_path):
                 os.makedirs(self.save_path, exist_ok=True)
-            if isinstance(model, nn.DataParallel):
+            if isinstance(model, (nn.DataParallel, nn.parallel.DistributedDataParallel)):
                 model = model.module
             if only_param:
                 state_dict = model.state_dict()
@@ -735,18 +956,18 @@ class Trainer(object):
     
     def _load_model(self, model, model_name, only_param=False):
         # 返回bool值指示是否成功reload模型
+        if isinstance(model, (nn.DataParallel, nn.parallel.DistributedDataParallel)):
+            model = model.module
         if self.save_path is not None:
             model_path = os.path.join(self.save_path, model_name)
+            self._best_model_snapshot.wait()
             if only_param:
-                states = torch.load(model_path)
-            else:
-                states = torch.load(model_path).state_dict()
-            if isinstance(model, nn.DataParallel):
-                model.module.load_state_dict(states)
+                states = _torch_load(model_path)
             else:
-                model.load_state_dict(states)
-        elif hasattr(self, "_best_model_states"):
-            model.load_state_dict(self._best_model_states)
+                states = _torch_load(model_path).state_dict()
+            model.load_state_dict(states)
+        elif self._best_model_snapshot.state_dict() is not None:
+            model.load_state_dict(self._best_model_snapshot.state_dict())
         else:
             return False
         return True
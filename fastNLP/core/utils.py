@@ -9,9 +9,14 @@ __all__ = [
 
 import _pickle
 import inspect
+import io
 import os
+import random
+import shutil
+import threading
 import warnings
-from collections import Counter, namedtuple
+from collections import Counter, OrderedDict, namedtuple
+from functools import lru_cache
 
 import numpy as np
 import torch
@@ -62,8 +67,45 @@ def _prepare_cache_filepath(filepath):
         os.makedirs(cache_dir)
 
 
+class _CachePickler(_pickle.Pickler):
+    """
+    将结果中的DataSet以二进制格式单独保存到dataset_dir中，pickle文件中只记录其编号。
+    """
+    def __init__(self, file, dataset_dir):
+        super().__init__(file)
+        self.dataset_dir = dataset_dir
+        self.num_datasets = 0
+
+    def persistent_id(self, obj):
+        from .dataset import DataSet
+        if isinstance(obj, DataSet):
+            name = str(self.num_datasets)
+            obj.save(os.path.join(self.dataset_dir, name), binary=True)
+            self.num_datasets += 1
+            return 'DataSet', name
+        return None
+
+
+class _CacheUnpickler(_pickle.Unpickler):
+    def __init__(self, file, dataset_dir, mmap=False):
+        super().__init__(file)
+        self.dataset_dir = dataset_dir
+        self.mmap = mmap
+
+    def persistent_load(self, pid):
+        from .dataset import DataSet
+        type_tag, name = pid
+        if type_tag != 'DataSet':
+            raise _pickle.UnpicklingError("Unsupported persistent object:{}.".format(type_tag))
+        return DataSet.load(os.path.join(self.dataset_dir, name), mmap=self.mmap)
+
+
+def _get_cache_dataset_dir(filepath):
+    return os.path.abspath(filepath) + '_datasets'
+
+
 #  TODO 可以保存下缓存时的参数，如果load的时候发现参数不一致，发出警告。
-def cache_results(_cache_fp, _refresh=False, _verbose=1):
+def cache_results(_cache_fp, _refresh=False, _verbose=1, _mmap=False):
     """
     别名：:class:`fastNLP.cache_results` :class:`fastNLP.core.uitls.cache_results`
 
@@ -101,23 +143,27 @@ def cache_results(_cache_fp, _refresh=False, _verbose=1):
         process_data(_cache_fp='cache2.pkl')  # 完全不影响之前的‘cache.pkl'
 
     上面的_cache_fp是cache_results会识别的参数，它将从'cache2.pkl'这里缓存/读取数据，即这里的'cache2.pkl'覆盖默认的
-    'cache.pkl'。如果在你的函数前面加上了@cache_results()则你的函数会增加三个参数[_cache_fp, _refresh, _verbose]。
-    上面的例子即为使用_cache_fp的情况，这三个参数不会传入到你的函数中，当然你写的函数参数名也不可能包含这三个名称::
+    'cache.pkl'。如果在你的函数前面加上了@cache_results()则你的函数会增加四个参数[_cache_fp, _refresh, _verbose, _mmap]。
+    上面的例子即为使用_cache_fp的情况，这四个参数不会传入到你的函数中，当然你写的函数参数名也不可能包含这四个名称::
 
         process_data(_cache_fp='cache2.pkl', _refresh=True)  # 这里强制重新生成一份对预处理的cache。
         #  _verbose是用于控制输出信息的，如果为0,则不输出任何内容;如果为1,则会提醒当前步骤是读取的cache还是生成了新的cache
 
+    如果_mmap为True，返回结果中的 :class:`~fastNLP.DataSet` 会以二进制格式(见 :meth:`~fastNLP.DataSet.save` )单独保存在
+    '{_cache_fp}_datasets' 文件夹中，读取cache时这些DataSet会以内存映射的方式打开，不需要将整个数据集反序列化到内存中。
+
     :param str _cache_fp: 将返回结果缓存到什么位置;或从什么位置读取缓存。如果为None，cache_results没有任何效用，除非在
         函数调用的时候传入_cache_fp这个参数。
     :param bool _refresh: 是否重新生成cache。
     :param int _verbose: 是否打印cache的信息。
+    :param bool _mmap: 是否以二进制格式保存结果中的DataSet，并在读取cache时使用np.memmap打开。
     :return:
     """
     
     def wrapper_(func):
         signature = inspect.signature(func)
         for key, _ in signature.parameters.items():
-            if key in ('_cache_fp', '_refresh', '_verbose'):
+            if key in ('_cache_fp', '_refresh', '_verbose', '_mmap'):
                 raise RuntimeError("The function decorated by cache_results cannot have keyword `{}`.".format(key))
         
         def wrapper(*args, **kwargs):
@@ -136,13 +182,18 @@ def cache_results(_cache_fp, _refresh=False, _verbose=1):
                 assert isinstance(verbose, int), "_verbose can only be integer."
             else:
                 verbose = _verbose
+            if '_mmap' in kwargs:
+                mmap = kwargs.pop('_mmap')
+                assert isinstance(mmap, bool), "_mmap can only be bool."
+            else:
+                mmap = _mmap
             refresh_flag = True
             
             if cache_filepath is not None and refresh is False:
                 # load data
                 if os.path.exists(cache_filepath):
                     with open(cache_filepath, 'rb') as f:
-                        results = _pickle.load(f)
+                        results = _CacheUnpickler(f, _get_cache_dataset_dir(cache_filepath), mmap=mmap).load()
                     if verbose == 1:
                         print("Read cache from {}.".format(cache_filepath))
                     refresh_flag = False
@@ -153,8 +204,14 @@ def cache_results(_cache_fp, _refresh=False, _verbose=1):
                     if results is None:
                         raise RuntimeError("The return value is None. Delete the decorator.")
                     _prepare_cache_filepath(cache_filepath)
+                    dataset_dir = _get_cache_dataset_dir(cache_filepath)
+                    if os.path.isdir(dataset_dir):
+                        shutil.rmtree(dataset_dir)
                     with open(cache_filepath, 'wb') as f:
-                        _pickle.dump(results, f)
+                        if mmap:
+                            _CachePickler(f, dataset_dir).dump(results)
+                        else:
+                            _pickle.dump(results, f)
                     print("Save cache to {}.".format(cache_filepath))
             
             return results
@@ -254,7 +311,10 @@ def _move_model_to_device(model, device):
     :return: torch.nn.DataParallel or torch.nn.Module
     """
     if isinstance(model, torch.nn.parallel.DistributedDataParallel):
-        raise RuntimeError("model of `torch.nn.parallel.DistributedDataParallel` is not supported right now.")
+        # DistributedDataParallel由 DistTrainer 管理device
+        if device is not None:
+            raise RuntimeError("When model is `torch.nn.parallel.DistributedDataParallel`, the device has to be `None`.")
+        return model
     
     if device is None:
         if isinstance(model, torch.nn.DataParallel):
@@ -319,24 +379,308 @@ def _get_model_device(model):
         return parameters[0].device
 
 
-def _build_args(func, **kwargs):
+def _get_rng_state():
+    """获取python, numpy, torch(以及cuda)的随机状态"""
+    return {'python': random.getstate(),
+            'numpy': np.random.get_state(),
+            'torch': torch.get_rng_state(),
+            'cuda': torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None}
+
+
+def _set_rng_state(state):
+    """恢复由 :func:`_get_rng_state` 获取的随机状态"""
+    random.setstate(state['python'])
+    np.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'])
+    if state['cuda'] is not None and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+
+
+def _copy_to_cpu(obj):
+    """递归地将obj中的tensor复制一份到cpu上，得到不会再被训练过程修改的快照"""
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, dict):
+        return obj.__class__((key, _copy_to_cpu(value)) for key, value in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return obj.__class__(_copy_to_cpu(value) for value in obj)
+    return obj
+
+
+def _torch_load(path, map_location=None):
+    """读取包含numpy随机状态等非tensor对象的文件，新版本的torch.load默认weights_only=True，会拒绝这些对象"""
+    if 'weights_only' in inspect.signature(torch.load).parameters:
+        return torch.load(path, map_location=map_location, weights_only=False)
+    return torch.load(path, map_location=map_location)
+
+
+class _AsyncSaver:
+    """
+    在后台线程中调用torch.save保存对象。先写入临时文件再通过os.replace替换，因此中途中断不会留下不完整的文件。
+    同一时间最多只有一个保存任务在进行，再次调用save()时会先等待上一次保存完成。
+
+    :param bool async_write: 为False时在调用线程中直接保存
+    """
+
+    def __init__(self, async_write=True):
+        self.async_write = async_write
+        self._thread = None
+        self._exception = None
+
+    def _save(self, obj, path):
+        try:
+            dirname = os.path.dirname(os.path.abspath(path))
+            os.makedirs(dirname, exist_ok=True)
+            tmp_path = path + '.tmp'
+            if isinstance(obj, io.BytesIO):  # 已经序列化好的内容
+                with open(tmp_path, 'wb') as f:
+                    f.write(obj.getbuffer())
+            else:
+                torch.save(obj, tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException as e:
+            self._exception = e
+
+    def save(self, obj, path):
+        """
+        保存obj到path。obj中的tensor需要是不会再被修改的快照(参见 :func:`_copy_to_cpu` )，obj为io.BytesIO时直接写入其中的内容。
+        """
+        self.wait()
+        if self.async_write:
+            self._thread = threading.Thread(target=self._save, args=(obj, path), daemon=True)
+            self._thread.start()
+        else:
+            self._save(obj, path)
+            self.wait()
+
+    def wait(self):
+        """等待正在进行的保存完成，如果保存过程中出现了异常，在这里抛出"""
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._exception is not None:
+            exception, self._exception = self._exception, None
+            raise exception
+
+
+def _allocate_cpu_states(model):
+    """
+    按照model.state_dict()的名字在cpu上分配与参数、buffer形状相同的tensor(值未初始化)。模型在gpu上时使用pin memory，之后可以
+    通过non_blocking的copy_异步地更新。参数对应的是Parameter，共享的参数(例如tie的embedding)共享同一个tensor。
+    """
+    states, allocated = OrderedDict(), {}
+    for name, tensor in model.state_dict(keep_vars=True).items():
+        if id(tensor) not in allocated:
+            cpu_tensor = torch.empty(tensor.size(), dtype=tensor.dtype, pin_memory=tensor.is_cuda)
+            if isinstance(tensor, nn.Parameter):
+                cpu_tensor = nn.Parameter(cpu_tensor, requires_grad=tensor.requires_grad)
+            allocated[id(tensor)] = cpu_tensor
+        states[name] = allocated[id(tensor)]
+    return states
+
+
+def _set_model_tensors(model, states):
+    """将model中states的key对应的参数与buffer替换为states中的tensor，返回被替换下来的tensor"""
+    old_states = OrderedDict()
+    for name, tensor in states.items():
+        module = model
+        *module_names, attr = name.split('.')
+        for module_name in module_names:
+            module = module._modules[module_name]
+        tensors = module._parameters if attr in module._parameters else module._buffers
+        old_states[name] = tensors[attr]
+        tensors[attr] = tensor
+    return old_states
+
+
+class _ModelSnapshot:
+    """
+    在cpu上保存模型某一时刻的快照。快照只包含按照state_dict的名字预先分配的一组cpu上的tensor，不会复制模型对象本身。第一次
+    update()时分配，之后每次update()只通过copy_将参数与buffer复制进去(模型在gpu上时是non_blocking的异步拷贝)。save()在后台
+    线程中将快照写入磁盘，写入完成之前下一次update()会等待，所以同一时间只需要一份快照。
+
+    :param bool async_write: 为False时save()在调用线程中直接保存
     """
-    根据func的初始化参数，从kwargs中选择func需要的参数
+
+    def __init__(self, async_write=True):
+        self._states = None
+        self._model = None  # 最近一次update()的模型，保存整个模型以及构建cpu上的模型时使用它的结构
+        self._cpu_model = None
+        self._event = None
+        self._saver = _AsyncSaver(async_write)
+
+    @staticmethod
+    def _unwrap(model):
+        if isinstance(model, (nn.DataParallel, nn.parallel.DistributedDataParallel)):
+            return model.module
+        return model
+
+    def update(self, model):
+        """将model当前的参数与buffer复制到快照中"""
+        model = self._unwrap(model)
+        self._saver.wait()
+        if self._states is None:
+            self._states = _allocate_cpu_states(model)
+        self._model = model
+        use_cuda = False
+        with torch.no_grad():
+            for name, tensor in model.state_dict(keep_vars=True).items():
+                self._states[name].copy_(tensor, non_blocking=True)
+                use_cuda = use_cuda or tensor.is_cuda
+        if use_cuda:
+            self._event = torch.cuda.Event()
+            self._event.record()
+        else:
+            self._event = None
+
+    def load_state_dict(self, model, states):
+        """使用model的结构以及states中的值(例如从checkpoint中读取的快照)初始化快照"""
+        model = self._unwrap(model)
+        self._saver.wait()
+        if self._states is None:
+            self._states = _allocate_cpu_states(model)
+        self._model = model
+        with torch.no_grad():
+            for name, tensor in states.items():
+                self._states[name].copy_(tensor)
+        self._event = None
+
+    def synchronize(self):
+        """等待update()中的异步拷贝完成"""
+        if self._event is not None:
+            self._event.synchronize()
+            self._event = None
+
+    def state_dict(self):
+        """返回快照的state_dict，其中的tensor会在下一次update()时被修改。还没有update()过时返回None"""
+        if self._states is None:
+            return None
+        self.synchronize()
+        return OrderedDict((name, tensor.detach()) for name, tensor in self._states.items())
+
+    def _serialize_model(self):
+        # 临时将模型的参数与buffer替换为快照中的tensor后序列化，不会复制模型，也不会拷贝gpu上的参数
+        buffer = io.BytesIO()
+        old_states = _set_model_tensors(self._model, self._states)
+        try:
+            torch.save(self._model, buffer)
+        finally:
+            _set_model_tensors(self._model, old_states)
+        buffer.seek(0)
+        return buffer
+
+    def get_model(self):
+        """
+        返回一个cpu上的模型，其参数与buffer就是快照中的tensor，会随着update()改变。第一次调用时通过序列化构建，之后复用。
+        """
+        if self._cpu_model is None:
+            self.synchronize()
+            self._cpu_model = _torch_load(self._serialize_model(), map_location='cpu')
+            _set_model_tensors(self._cpu_model, self._states)
+        self.synchronize()
+        return self._cpu_model
+
+    def save(self, path, only_param=False):
+        """
+        在后台线程中将快照保存到path。
+
+        :param str path: 保存的路径
+        :param bool only_param: 为True时只保存state_dict，否则与 :func:`_save_model` 一样保存整个cpu上的模型
+        """
+        self.synchronize()
+        if only_param:
+            self._saver.save(self.state_dict(), path)
+        else:
+            self._saver.save(self._serialize_model(), path)
+
+    def wait(self):
+        """等待正在进行的保存完成"""
+        self._saver.wait()
+
+
+def _prepare_precision(precision, device):
+    """
+    根据precision与模型所在的device，确定autocast使用的device_type、dtype以及是否需要GradScaler
+
+    :param str,None precision: None(或'fp32'), 'fp16', 'bf16'
+    :param torch.device,None device: 模型所在的device, 为None时视为cpu
+    :return: (device_type, dtype, grad_scaler)。precision为None时返回(None, None, None)；
+        只有在cuda上使用fp16时grad_scaler才不为None。
+    """
+    if precision is None or precision == 'fp32':
+        return None, None, None
+    if precision not in ('fp16', 'bf16'):
+        raise ValueError("precision only supports None, 'fp32', 'fp16' and 'bf16', got {}.".format(precision))
+    device_type = 'cuda' if device is not None and torch.device(device).type == 'cuda' else 'cpu'
+    if device_type == 'cpu':
+        if precision == 'fp16':
+            warnings.warn("fp16 autocast is not supported on cpu, fall back to bf16.")
+        return device_type, torch.bfloat16, None
+    if precision == 'bf16':
+        return device_type, torch.bfloat16, None
+    if hasattr(torch, 'amp') and hasattr(torch.amp, 'GradScaler'):
+        grad_scaler = torch.amp.GradScaler('cuda')
+    else:
+        grad_scaler = torch.cuda.amp.GradScaler()
+    return device_type, torch.float16, grad_scaler
+
+
+def _func_cache_key(func):
+    # bound method每次访问都会重新生成，且会持有实例，因此以其下的function作为缓存的key
+    return func.__func__ if inspect.ismethod(func) else func
+
+
+@lru_cache(maxsize=1024)
+def _cached_getfullargspec(func):
+    return inspect.getfullargspec(func)
+
+
+def _getfullargspec(func):
+    """
+    带缓存的inspect.getfullargspec，bound method与其下的function的结果相同(都包含self)。
 
     :param func: callable
-    :param kwargs: 参数
-    :return:dict. func中用到的参数
+    :return: inspect.FullArgSpec
     """
-    spect = inspect.getfullargspec(func)
+    try:
+        return _cached_getfullargspec(_func_cache_key(func))
+    except TypeError:  # 无法hash的callable
+        return inspect.getfullargspec(func)
+
+
+@lru_cache(maxsize=4096)
+def _resolve_args(func, keys):
+    # 对于func与传入参数名的集合keys，返回(默认参数的dict, 需要从kwargs中取出的参数名)；func接受**kwargs时返回None
+    spect = _getfullargspec(func)
     if spect.varkw is not None:
-        return kwargs
-    needed_args = set(spect.args)
+        return None
     defaults = []
     if spect.defaults is not None:
         defaults = [arg for arg in spect.defaults]
     start_idx = len(spect.args) - len(defaults)
-    output = {name: default for name, default in zip(spect.args[start_idx:], defaults)}
-    output.update({name: val for name, val in kwargs.items() if name in needed_args})
+    default_args = {name: default for name, default in zip(spect.args[start_idx:], defaults)}
+    return default_args, tuple(name for name in spect.args if name in keys)
+
+
+def _build_args(func, **kwargs):
+    """
+    根据func的初始化参数，从kwargs中选择func需要的参数。对于同一个func与同一组参数名，参数的匹配只在第一次调用时计算。
+
+    :param func: callable
+    :param kwargs: 参数
+    :return:dict. func中用到的参数
+    """
+    keys = frozenset(kwargs)
+    try:
+        resolved = _resolve_args(_func_cache_key(func), keys)
+    except TypeError:  # 无法hash的callable
+        resolved = _resolve_args.__wrapped__(func, keys)
+    if resolved is None:
+        return kwargs
+    default_args, names = resolved
+    output = dict(default_args)
+    for name in names:
+        output[name] = kwargs[name]
     return output
 
 
@@ -358,7 +702,7 @@ def _map_args(maps: dict, **kwargs):
 
 def _get_arg_list(func):
     assert callable(func)
-    spect = inspect.getfullargspec(func)
+    spect = _getfullargspec(func)
     if spect.defaults is not None:
         args = spect.args[: -len(spect.defaults)]
         defaults = spect.args[-len(spect.defaults):]
@@ -380,7 +724,7 @@ def _check_arg_dict_list(func, args):
         arg_dict_list = args
     assert callable(func) and isinstance(arg_dict_list, (list, tuple))
     assert len(arg_dict_list) > 0 and isinstance(arg_dict_list[0], dict)
-    spect = inspect.getfullargspec(func)
+    spect = _getfullargspec(func)
     all_args = set([arg for arg in spect.args if arg != 'self'])
     defaults = []
     if spect.defaults is not None:
@@ -430,19 +774,29 @@ def _get_func_signature(func):
     """
     if inspect.ismethod(func):
         class_name = func.__self__.__class__.__name__
-        signature = inspect.signature(func)
-        signature_str = str(signature)
-        if len(signature_str) > 2:
-            _self = '(self, '
-        else:
-            _self = '(self'
-        signature_str = class_name + '.' + func.__name__ + _self + signature_str[1:]
-        return signature_str
+        return class_name + '.' + _get_method_signature(func.__func__)
     elif inspect.isfunction(func):
-        signature = inspect.signature(func)
-        signature_str = str(signature)
-        signature_str = func.__name__ + signature_str
-        return signature_str
+        return _get_function_signature(func)
+
+
+@lru_cache(maxsize=1024)
+def _get_method_signature(func):
+    # func为bound method下的function，返回值不包含类名。与bound method的signature一样去掉第一个参数
+    signature = inspect.signature(func)
+    signature = signature.replace(parameters=list(signature.parameters.values())[1:])
+    signature_str = str(signature)
+    if len(signature_str) > 2:
+        _self = '(self, '
+    else:
+        _self = '(self'
+    return func.__name__ + _self + signature_str[1:]
+
+
+@lru_cache(maxsize=1024)
+def _get_function_signature(func):
+    signature = inspect.signature(func)
+    signature_str = str(signature)
+    return func.__name__ + signature_str
 
 
 def _is_function_or_method(func):
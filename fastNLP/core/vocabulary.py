@@ -5,11 +5,29 @@ __all__ = [
 
 from functools import wraps
 from collections import Counter, defaultdict
+from itertools import chain, repeat
 from .dataset import DataSet
+from .field import ColumnarContent, _lengths_to_offsets
 from .utils import Option
-from functools import partial
 import numpy as np
 
+def _iter_words(fields):
+    """
+    依次产生fields中的词，每个field可以是 ``str`` , ``list(str)`` , ``list(list(str))`` 或对应的 np.ndarray
+    """
+    for field in fields:
+        if isinstance(field, str):
+            yield field
+        elif isinstance(field, (list, np.ndarray)):
+            if not isinstance(field[0], (list, np.ndarray)):
+                yield from field
+            else:
+                if isinstance(field[0][0], (list, np.ndarray)):
+                    raise RuntimeError("Only support field with 2 dimensions.")
+                for words in field:
+                    yield from words
+
+
 class VocabularyOption(Option):
     def __init__(self,
                  max_size=None,
@@ -243,18 +261,25 @@ class Vocabulary(object):
             raise ValueError("word {} not in vocabulary".format(w))
     
     @_check_build_vocab
-    def index_dataset(self, *datasets, field_name, new_field_name=None):
+    def index_dataset(self, *datasets, field_name, new_field_name=None, num_proc=0, chunk_size=None, columnar=False):
         """
         将DataSet中对应field的词转为数字，Example::
 
             # remember to use `field_name`
             vocab.index_dataset(train_data, dev_data, test_data, field_name='words')
 
+        当field的每个元素都是 ``str`` 、 ``list(str)`` 或 ``list(list(str))`` 之一时，会将整个field的词展平后一次性查表，再按
+        每个sample的长度切分回原来的结构；否则逐个instance进行转换。
+
         :param datasets: 需要转index的 class:`~fastNLP.DataSet` , 支持一个或多个（list）
         :param str field_name: 需要转index的field, 若有多个 DataSet, 每个DataSet都必须有此 field.
             目前仅支持 ``str`` , ``list(str)`` , ``list(list(str))``
         :param str new_field_name: 保存结果的field_name. 若为 ``None`` , 将覆盖原field.
             Default: ``None``
+        :param int num_proc: 逐个instance转换时使用多少个进程处理, 参见 :meth:`~fastNLP.DataSet.apply`
+        :param int chunk_size: 多进程时每个进程每次处理的instance数量, 参见 :meth:`~fastNLP.DataSet.apply`
+        :param bool columnar: 是否直接以列式存储(参见 :class:`~fastNLP.core.field.ColumnarContent` )保存结果，这样不会为
+            每个sample创建Python list。仅在可以一次性转换时有效。Default: ``False``
         """
         
         def index_instance(ins):
@@ -279,18 +304,63 @@ class Vocabulary(object):
         for idx, dataset in enumerate(datasets):
             if isinstance(dataset, DataSet):
                 try:
-                    dataset.apply(index_instance, new_field_name=new_field_name)
+                    results = self._index_content(dataset.get_field(field_name).content, columnar=columnar)
+                    if results is not None:
+                        dataset._add_apply_field(results, new_field_name, {})
+                    else:
+                        dataset.apply(index_instance, new_field_name=new_field_name, num_proc=num_proc,
+                                      chunk_size=chunk_size)
                 except Exception as e:
                     print("When processing the `{}` dataset, the following error occurred.".format(idx))
                     raise e
             else:
                 raise RuntimeError("Only DataSet type is allowed.")
 
+    def _index_content(self, content, columnar=False):
+        """
+        一次性将整个field的内容转为index。所有的词被展平为一个list，通过word2idx查表之后，再根据offsets切分回原来的结构。
+
+        :param list content: field的内容
+        :param bool columnar: 为True时返回 :class:`~fastNLP.core.field.ColumnarContent`
+        :return: 转换后的内容; 如果field不是统一的 ``str`` , ``list(str)`` , ``list(list(str))`` 结构，返回None
+        """
+        if not isinstance(content, list) or len(content) == 0:
+            return None
+        if all(isinstance(field, str) for field in content):
+            words, offsets = content, []
+        elif all(isinstance(field, list) for field in content):
+            sent_offsets = _lengths_to_offsets(np.fromiter(map(len, content), dtype=np.int64, count=len(content)))
+            rows = list(chain.from_iterable(content))
+            if all(isinstance(row, str) for row in rows):
+                words, offsets = rows, [sent_offsets]
+            elif all(isinstance(row, list) for row in rows):
+                word_offsets = _lengths_to_offsets(np.fromiter(map(len, rows), dtype=np.int64, count=len(rows)))
+                words, offsets = list(chain.from_iterable(rows)), [sent_offsets, word_offsets]
+            else:
+                return None
+        else:
+            return None
+        
+        unknown_idx = self.word2idx[self.unknown] if self.unknown is not None else None
+        try:
+            indices = list(map(self.word2idx.get, words, repeat(unknown_idx)))
+        except TypeError:  # 比如3维的field, 交给逐个instance的方式处理并报错
+            return None
+        if unknown_idx is None and None in indices:
+            raise ValueError("word {} not in vocabulary".format(words[indices.index(None)]))
+        
+        if columnar:
+            return ColumnarContent(np.array(indices, dtype=np.int64), offsets, int, len(offsets))
+        for offset in reversed(offsets):
+            offset = offset.tolist()
+            indices = [indices[start:end] for start, end in zip(offset[:-1], offset[1:])]
+        return indices
+
     @property
     def _no_create_word_length(self):
         return len(self._no_create_word)
 
-    def from_dataset(self, *datasets, field_name, no_create_entry_dataset=None):
+    def from_dataset(self, *datasets, field_name, no_create_entry_dataset=None, num_proc=0, chunk_size=None):
         """
         使用dataset的对应field中词构建词典::
 
@@ -309,6 +379,9 @@ class Vocabulary(object):
             finetune embedding的话，这个词在更新之后可能会有更好的表示; 而如果这个词仅出现在了dev或test中，那么就不能为它们单独建立vector，
             而应该让它指向unk这个vector的值。所以只位于no_create_entry_dataset中的token，将首先从预训练的词表中寻找它的表示，
             如果找到了，就使用该表示; 如果没有找到，则认为该词的表示应该为unk的表示。
+        :param int num_proc: 使用多少个进程统计词频。DataSet会被切分为若干段，每个进程只返回该段的词频(Counter)，合并后一次性
+            加入到Vocabulary中，参见 :meth:`update_counter` 。
+        :param int chunk_size: 多进程时每一段的instance数量, 参见 :meth:`~fastNLP.DataSet.apply`
         :return self:
         """
         if isinstance(field_name, str):
@@ -316,43 +389,63 @@ class Vocabulary(object):
         elif not isinstance(field_name, list):
             raise TypeError('invalid argument field_name: {}'.format(field_name))
         
-        def construct_vocab(ins, no_create_entry=False):
-            for fn in field_name:
-                field = ins[fn]
-                if isinstance(field, str):
-                    self.add_word(field, no_create_entry=no_create_entry)
-                elif isinstance(field, (list, np.ndarray)):
-                    if not isinstance(field[0], (list, np.ndarray)):
-                        for word in field:
-                            self.add_word(word, no_create_entry=no_create_entry)
-                    else:
-                        if isinstance(field[0][0], (list, np.ndarray)):
-                            raise RuntimeError("Only support field with 2 dimensions.")
-                        for words in field:
-                            for word in words:
-                                self.add_word(word, no_create_entry=no_create_entry)
-
+        def count_words(dataset, start, end):
+            # 在子进程中统计[start, end)内的词频，只有Counter会被传回主进程
+            contents = [dataset.get_field(fn).content[start:end] for fn in field_name]
+            return Counter(_iter_words(chain.from_iterable(zip(*contents))))
+
+        def count_dataset(dataset):
+            counter = Counter()
+            for shard_counter in dataset._map_ranges(count_words, num_proc=num_proc, chunk_size=chunk_size):
+                counter.update(shard_counter)
+            return counter
+
+        counter = Counter()
         for idx, dataset in enumerate(datasets):
             if isinstance(dataset, DataSet):
                 try:
-                    dataset.apply(construct_vocab)
+                    counter.update(count_dataset(dataset))
                 except Exception as e:
                     print("When processing the `{}` dataset, the following error occurred.".format(idx))
                     raise e
             else:
                 raise TypeError("Only DataSet type is allowed.")
+        self.update_counter(counter)
 
         if no_create_entry_dataset is not None:
-            partial_construct_vocab = partial(construct_vocab, no_create_entry=True)
             if isinstance(no_create_entry_dataset, DataSet):
-                no_create_entry_dataset.apply(partial_construct_vocab)
-            elif isinstance(no_create_entry_dataset, list):
+                no_create_entry_dataset = [no_create_entry_dataset]
+            counter = Counter()
+            if isinstance(no_create_entry_dataset, list):
                 for dataset in no_create_entry_dataset:
                     if not isinstance(dataset, DataSet):
                         raise TypeError("Only DataSet type is allowed.")
-                    dataset.apply(partial_construct_vocab)
+                    counter.update(count_dataset(dataset))
+            self.update_counter(counter, no_create_entry=True)
         return self
 
+    @_check_build_status
+    def update_counter(self, counter, no_create_entry=False):
+        """
+        将统计好的词频一次性加入到Vocabulary中，结果与按顺序对每个词调用 :meth:`add_word` 相同。可以用于分批(比如分片
+        统计的大规模语料)增量地更新词表，已经在词表中的词的index不会改变::
+
+            vocab.update_counter(Counter(words_of_shard1))
+            vocab.update_counter(Counter(words_of_shard2))
+
+        :param collections.Counter counter: 词到出现次数的映射
+        :param bool no_create_entry: 参见 :meth:`add_word`
+        """
+        if no_create_entry:
+            # 只有之前出现的所有次数都是no_create_entry的词，才会继续保持no_create_entry
+            for word, count in counter.items():
+                if self.word_count.get(word, 0) == self._no_create_word.get(word, 0):
+                    self._no_create_word[word] += count
+        else:
+            for word in self._no_create_word.keys() & counter.keys():
+                self._no_create_word.pop(word)
+        self.word_count.update(counter)
+
     def _is_word_no_create_entry(self, word):
         """
         判断当前的word是否是不需要创建entry的，具体参见from_dataset的说明
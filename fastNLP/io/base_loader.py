@@ -6,9 +6,10 @@ __all__ = [
 
 import _pickle as pickle
 import os
-from typing import Union, Dict
+from typing import Union, Dict, Iterator
 import os
 from ..core.dataset import DataSet
+from ..core.instance import Instance
 
 
 class BaseLoader(object):
@@ -142,6 +143,8 @@ class DataSetLoader:
     - _load 函数：从一个数据文件中读取数据到一个 :class:`~fastNLP.DataSet`
     - load 函数（可以使用基类的方法）：从一个或多个数据文件中读取数据到一个或多个 :class:`~fastNLP.DataSet`
     - process 函数：一个或多个从数据文件中读取数据，并处理成可以训练的一个或多个 :class:`~fastNLP.DataSet`
+    - _load_iter 函数（可选）：逐个产生数据文件中的 :class:`~fastNLP.Instance` ，使得 :meth:`load_iter` 可以与
+      :class:`~fastNLP.OnlineDataIter` 一起使用，而不需要把整个文件读入内存
 
     **process 函数中可以 调用load 函数或 _load 函数**
 
@@ -201,6 +204,27 @@ class DataSetLoader:
         """
         raise NotImplementedError
 
+    def load_iter(self, path: str) -> Iterator[Instance]:
+        """
+        从指定路径的文件中逐个读取 :class:`~fastNLP.Instance` ，不会将整个文件读入内存。可以传入
+        :class:`~fastNLP.OnlineDataIter` 进行流式训练::
+
+            loader = CSVLoader(headers=['raw_words', 'target'], sep='\t')
+            data_iter = OnlineDataIter(lambda: loader.load_iter('path/to/train.tsv'), batch_size=32)
+
+        :param str path: 文件路径
+        :return: 产生 :class:`~fastNLP.Instance` 的生成器
+        """
+        return self._load_iter(path)
+
+    def _load_iter(self, path: str) -> Iterator[Instance]:
+        """从指定路径的文件中逐个产生 :class:`~fastNLP.Instance`
+
+        :param str path: 文件路径
+        :return: 产生 :class:`~fastNLP.Instance` 的生成器
+        """
+        raise NotImplementedError
+
     def process(self, paths: Union[str, Dict[str, str]], **options) -> DataInfo:
         """
         对于特定的任务和数据集，读取并处理数据，返回处理DataInfo类对象或字典。
@@ -50,10 +50,14 @@ class ConllLoader(DataSetLoader):
 
     def _load(self, path):
         ds = DataSet()
+        for ins in self._load_iter(path):
+            ds.append(ins)
+        return ds
+
+    def _load_iter(self, path):
         for idx, data in _read_conll(path, indexes=self.indexes, dropna=self.dropna):
             ins = {h: data[i] for i, h in enumerate(self.headers)}
-            ds.append(Instance(**ins))
-        return ds
+            yield Instance(**ins)
 
 
 class Conll2003Loader(ConllLoader):
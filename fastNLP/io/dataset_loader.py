@@ -51,13 +51,17 @@ class JsonLoader(DataSetLoader):
 
     def _load(self, path):
         ds = DataSet()
+        for ins in self._load_iter(path):
+            ds.append(ins)
+        return ds
+
+    def _load_iter(self, path):
         for idx, d in _read_json(path, fields=self.fields_list, dropna=self.dropna):
             if self.fields:
                 ins = {self.fields[k]: v for k, v in d.items()}
             else:
                 ins = d
-            ds.append(Instance(**ins))
-        return ds
+            yield Instance(**ins)
 
 
 class CSVLoader(DataSetLoader):
@@ -80,10 +84,14 @@ class CSVLoader(DataSetLoader):
 
     def _load(self, path):
         ds = DataSet()
+        for ins in self._load_iter(path):
+            ds.append(ins)
+        return ds
+
+    def _load_iter(self, path):
         for idx, data in _read_csv(path, headers=self.headers,
                                    sep=self.sep, dropna=self.dropna):
-            ds.append(Instance(**data))
-        return ds
+            yield Instance(**data)
 
 
 def _cut_long_sentence(sent, max_sample_length=200):
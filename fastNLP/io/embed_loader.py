@@ -3,8 +3,15 @@ __all__ = [
     "EmbeddingOption",
 ]
 
+import hashlib
+import mmap
+import multiprocessing as mp
 import os
+import shutil
 import warnings
+from collections import Counter
+from functools import partial
+from itertools import starmap
 
 import numpy as np
 
@@ -39,7 +46,7 @@ class EmbedLoader(BaseLoader):
 
     @staticmethod
     def load_with_vocab(embed_filepath, vocab, dtype=np.float32, padding='<pad>', unknown='<unk>', normalize=True,
-                        error='ignore', init_method=None):
+                        error='ignore', init_method=None, cache_dir=None, num_proc=0):
         """
         从embed_filepath这个预训练的词向量中抽取出vocab这个词表的词的embedding。EmbedLoader将自动判断embed_filepath是
         word2vec(第一行只有两个元素)还是glove格式的数据。
@@ -54,67 +61,115 @@ class EmbedLoader(BaseLoader):
         :param str error: `ignore` , `strict` ; 如果 `ignore` ，错误将自动跳过; 如果 `strict` , 错误将抛出。
             这里主要可能出错的地方在于词表有空行或者词表出现了维度不一致。
         :param callable init_method: 传入numpy.ndarray, 返回numpy.ndarray, 用以初始化embedding
+        :param str cache_dir: 若不为None，第一次读取时会将embed_filepath转换为二进制格式保存在cache_dir中(以文件内容的hash
+            区分不同的文件)，之后的读取直接通过mmap从中取出vocab需要的行，不再解析文本。参见 :meth:`build_cache`
+        :param int num_proc: 转换为二进制格式时使用多少个进程解析文本，仅在cache_dir不为None时有效
         :return numpy.ndarray:  shape为 [len(vocab), dimension], dimension由pretrain的embedding决定。
         """
         assert isinstance(vocab, Vocabulary), "Only fastNLP.Vocabulary is supported."
         if not os.path.exists(embed_filepath):
             raise FileNotFoundError("`{}` does not exist.".format(embed_filepath))
-        with open(embed_filepath, 'r', encoding='utf-8') as f:
-            hit_flags = np.zeros(len(vocab), dtype=bool)
-            line = f.readline().strip()
-            parts = line.split()
-            start_idx = 0
-            if len(parts) == 2:
-                dim = int(parts[1])
-                start_idx += 1
-            else:
-                dim = len(parts) - 1
-                f.seek(0)
+        hit_flags = np.zeros(len(vocab), dtype=bool)
+        if cache_dir is not None:
+            words, vectors = EmbedLoader.build_cache(embed_filepath, cache_dir, error=error, num_proc=num_proc)
+            dim = vectors.shape[1]
             matrix = np.random.randn(len(vocab), dim).astype(dtype)
             if init_method:
                 matrix = init_method(matrix)
-            for idx, line in enumerate(f, start_idx):
-                try:
-                    parts = line.strip().split()
-                    word = ''.join(parts[:-dim])
-                    nums = parts[-dim:]
-                    # 对齐unk与pad
-                    if word==padding and vocab.padding is not None:
-                        word = vocab.padding
-                    elif word==unknown and vocab.unknown is not None:
-                        word = vocab.unknown
-                    if word in vocab:
-                        index = vocab.to_index(word)
-                        matrix[index] = np.fromstring(' '.join(nums), sep=' ', dtype=dtype, count=dim)
-                        hit_flags[index] = True
-                except Exception as e:
-                    if error == 'ignore':
-                        warnings.warn("Error occurred at the {} line.".format(idx))
-                    else:
-                        print("Error occurred at the {} line.".format(idx))
-                        raise e
-            total_hits = sum(hit_flags)
-            print("Found {} out of {} words in the pre-training embedding.".format(total_hits, len(vocab)))
-            if init_method is None:
-                found_vectors = matrix[hit_flags]
-                if len(found_vectors) != 0:
-                    mean = np.mean(found_vectors, axis=0, keepdims=True)
-                    std = np.std(found_vectors, axis=0, keepdims=True)
-                    unfound_vec_num = len(vocab) - total_hits
-                    r_vecs = np.random.randn(unfound_vec_num, dim).astype(dtype) * std + mean
-                    matrix[hit_flags == False] = r_vecs
-
-            if normalize:
-                matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
-            
-            return matrix
+            indices, rows = _match_vocab(words, vocab, padding, unknown)
+            matrix[indices] = vectors[rows]
+            hit_flags[indices] = True
+        else:
+            with open(embed_filepath, 'r', encoding='utf-8') as f:
+                line = f.readline().strip()
+                parts = line.split()
+                start_idx = 0
+                if len(parts) == 2:
+                    dim = int(parts[1])
+                    start_idx += 1
+                else:
+                    dim = len(parts) - 1
+                    f.seek(0)
+                matrix = np.random.randn(len(vocab), dim).astype(dtype)
+                if init_method:
+                    matrix = init_method(matrix)
+                for idx, line in enumerate(f, start_idx):
+                    try:
+                        parts = line.strip().split()
+                        word = ''.join(parts[:-dim])
+                        nums = parts[-dim:]
+                        # 对齐unk与pad
+                        if word==padding and vocab.padding is not None:
+                            word = vocab.padding
+                        elif word==unknown and vocab.unknown is not None:
+                            word = vocab.unknown
+                        if word in vocab:
+                            index = vocab.to_index(word)
+                            matrix[index] = np.fromstring(' '.join(nums), sep=' ', dtype=dtype, count=dim)
+                            hit_flags[index] = True
+                    except Exception as e:
+                        if error == 'ignore':
+                            warnings.warn("Error occurred at the {} line.".format(idx))
+                        else:
+                            print("Error occurred at the {} line.".format(idx))
+                            raise e
+        total_hits = sum(hit_flags)
+        print("Found {} out of {} words in the pre-training embedding.".format(total_hits, len(vocab)))
+        if init_method is None:
+            found_vectors = matrix[hit_flags]
+            if len(found_vectors) != 0:
+                mean = np.mean(found_vectors, axis=0, keepdims=True)
+                std = np.std(found_vectors, axis=0, keepdims=True)
+                unfound_vec_num = len(vocab) - total_hits
+                r_vecs = np.random.randn(unfound_vec_num, dim).astype(dtype) * std + mean
+                matrix[hit_flags == False] = r_vecs
+
+        if normalize:
+            matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+        
+        return matrix
+
+    @staticmethod
+    def build_cache(embed_filepath, cache_dir, error='ignore', num_proc=0):
+        """
+        将文本格式(word2vec或glove)的预训练embedding转换为二进制格式，保存在 ``cache_dir/<文件名>-<文件内容的md5>-<error>`` 中。
+        包含一个float32的 ``vectors.npy`` 矩阵和一个每行一个词的 ``words.txt`` 。如果已经转换过，直接读取。
+
+        :param str embed_filepath: 预训练的embedding的路径。
+        :param str cache_dir: 保存二进制格式的目录
+        :param str error: `ignore` , `strict` ; 转换时遇到错误的处理方式，参见 :meth:`load_with_vocab`
+        :param int num_proc: 转换时使用多少个进程解析文本, 参见 :meth:`load_without_vocab`
+        :return (List[str], numpy.memmap): 词的列表, 以及通过mmap读取的shape为[len(words), dimension]的矩阵,
+            第i行为第i个词的embedding。文件中重复出现的词会保留多行。
+        """
+        cache_path = _get_embed_cache_path(embed_filepath, cache_dir, error)
+        if not os.path.exists(cache_path):
+            tmp_path = cache_path + '.tmp{}'.format(os.getpid())
+            os.makedirs(tmp_path, exist_ok=True)
+            try:
+                _build_embed_cache(embed_filepath, tmp_path, error=error, num_proc=num_proc)
+                os.replace(tmp_path, cache_path)
+            except OSError:  # 其它进程已经完成了转换
+                if not os.path.exists(cache_path):
+                    raise
+            finally:
+                if os.path.exists(tmp_path):
+                    shutil.rmtree(tmp_path)
+        with open(os.path.join(cache_path, _EMBED_CACHE_WORDS), 'r', encoding='utf-8') as f:
+            words = f.read()
+            words = words.split('\n') if words else []
+        vectors = np.load(os.path.join(cache_path, _EMBED_CACHE_VECTORS), mmap_mode='r')
+        return words, vectors[:len(words)]
     
     @staticmethod
     def load_without_vocab(embed_filepath, dtype=np.float32, padding='<pad>', unknown='<unk>', normalize=True,
-                           error='ignore'):
+                           error='ignore', num_proc=0):
         """
         从embed_filepath中读取预训练的word vector。根据预训练的词表读取embedding并生成一个对应的Vocabulary。
 
+        文件会被切分为若干段按块解析，每一段的向量通过一次 ``np.fromstring`` 转换后直接写入预先分配好的矩阵中，不会为每个词
+        保留单独的向量。
+
         :param str embed_filepath: 预训练的embedding的路径。
         :param dtype: 读出的embedding的类型
         :param str padding: 词表中的padding的token. 并以此用做vocab的padding。
@@ -122,65 +177,265 @@ class EmbedLoader(BaseLoader):
         :param bool normalize: 是否将每个vector归一化到norm为1
         :param str error: `ignore` , `strict` ; 如果 `ignore` ，错误将自动跳过; 如果 `strict` , 错误将抛出。这里主要可能出错的地
             方在于词表有空行或者词表出现了维度不一致。
+        :param int num_proc: 使用多少个进程解析文件。大于1时(且系统支持fork)各个进程直接将解析结果写入共享的矩阵中。
         :return (numpy.ndarray, Vocabulary): Embedding的shape是[词表大小+x, 词表维度], "词表大小+x"是由于最终的大小还取决与
             是否使用padding, 以及unknown有没有在词表中找到对应的词。 Vocabulary中的词的顺序与Embedding的顺序是一一对应的。
 
         """
         vocab = Vocabulary(padding=padding, unknown=unknown)
-        vec_dict = {}
-        found_unknown = False
-        found_pad = False
-        
-        with open(embed_filepath, 'r', encoding='utf-8') as f:
-            line = f.readline()
-            start = 1
-            dim = -1
-            if len(line.strip().split()) != 2:
-                f.seek(0)
-                start = 0
-            for idx, line in enumerate(f, start=start):
-                try:
-                    parts = line.strip().split()
-                    if dim == -1:
-                        dim = len(parts) - 1
-                    word = ''.join(parts[:-dim])
-                    nums = parts[-dim:]
-                    vec = np.fromstring(' '.join(nums), sep=' ', dtype=dtype, count=dim)
-                    vec_dict[word] = vec
-                    vocab.add_word(word)
-                    if unknown is not None and unknown == word:
-                        found_unknown = True
-                    if padding is not None and padding == word:
-                        found_pad = True
-                except Exception as e:
-                    if error == 'ignore':
-                        warnings.warn("Error occurred at the {} line.".format(idx))
-                        pass
-                    else:
-                        print("Error occurred at the {} line.".format(idx))
-                        raise e
-            if dim == -1:
-                raise RuntimeError("{} is an empty file.".format(embed_filepath))
+        start_idx = 0
+        if padding is not None:
+            start_idx += 1
+        if unknown is not None:
+            start_idx += 1
+        # 前start_idx行留给padding与unknown
+        words, vectors = _parse_embed_file(embed_filepath, dtype=dtype, error=error, num_proc=num_proc,
+                                           reserve=start_idx)
+        dim = vectors.shape[1]
+        vocab.update_counter(Counter(words))
+        found_unknown = unknown is not None and unknown in vocab.word_count
+        found_pad = padding is not None and padding in vocab.word_count
+
+        word2idx = dict(vocab)
+        indices = np.fromiter((word2idx[word] for word in words), dtype=np.int64, count=len(words))
+        if len(vocab) == len(vectors) and np.array_equal(indices, np.arange(start_idx, len(vectors))):
+            matrix = vectors  # 没有重复的词且不包含padding与unknown时，词的顺序与文件中一致
+        else:
             matrix = np.random.randn(len(vocab), dim).astype(dtype)
-            for key, vec in vec_dict.items():
-                index = vocab.to_index(key)
-                matrix[index] = vec
+            matrix[indices] = vectors[start_idx:]  # 重复的词以最后一次出现的为准
 
-            if (unknown is not None and not found_unknown) or (padding is not None and not found_pad):
-                start_idx = 0
-                if padding is not None:
-                    start_idx += 1
-                if unknown is not None:
-                    start_idx += 1
+        if (unknown is not None and not found_unknown) or (padding is not None and not found_pad):
+            mean = np.mean(matrix[start_idx:], axis=0, keepdims=True)
+            std = np.std(matrix[start_idx:], axis=0, keepdims=True)
+            if (unknown is not None and not found_unknown):
+                matrix[start_idx - 1] = np.random.randn(1, dim).astype(dtype) * std + mean
+            if (padding is not None and not found_pad):
+                matrix[0] = np.random.randn(1, dim).astype(dtype) * std + mean
+        
+        if normalize:
+            matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+        
+        return matrix, vocab
+
+_EMBED_CACHE_WORDS = 'words.txt'
+_EMBED_CACHE_VECTORS = 'vectors.npy'
+
+
+def _get_embed_cache_path(embed_filepath, cache_dir, error):
+    # error不同时解析的结果(以及是否检查错误)不同, 因此不能共用缓存
+    md5 = hashlib.md5()
+    with open(embed_filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 24), b''):
+            md5.update(chunk)
+    return os.path.join(cache_dir, '{}-{}-{}'.format(os.path.basename(embed_filepath), md5.hexdigest(), error))
+
+
+def _build_embed_cache(embed_filepath, cache_path, error='ignore', num_proc=0):
+    """
+    解析embed_filepath，将向量直接写入到预先分配好的 ``vectors.npy`` (np.memmap)中，不会将整个embedding读入内存。
+    """
+    words, vectors = _parse_embed_file(embed_filepath, dtype=np.float32, error=error, num_proc=num_proc,
+                                       out_path=os.path.join(cache_path, _EMBED_CACHE_VECTORS))
+    vectors.flush()
+    del vectors
+    with open(os.path.join(cache_path, _EMBED_CACHE_WORDS), 'w', encoding='utf-8') as f:
+        f.write('\n'.join(words))
+
+
+_EMBED_CHUNK_SIZE = 1 << 26  # 每次解析64MB
+
+
+def _read_embed_header(embed_filepath):
+    """
+    判断是word2vec(第一行只有两个元素)还是glove格式。
+
+    :return (int, int, int): 向量的维度(空文件为-1), 数据开始的字节位置, 数据开始的行号
+    """
+    with open(embed_filepath, 'rb') as f:
+        first_line = f.readline()
+    parts = first_line.decode('utf-8').strip().split()
+    if len(parts) == 2:
+        return int(parts[1]), len(first_line), 1
+    return len(parts) - 1, 0, 0
 
-                mean = np.mean(matrix[start_idx:], axis=0, keepdims=True)
-                std = np.std(matrix[start_idx:], axis=0, keepdims=True)
-                if (unknown is not None and not found_unknown):
-                    matrix[start_idx - 1] = np.random.randn(1, dim).astype(dtype) * std + mean
-                if (padding is not None and not found_pad):
-                    matrix[0] = np.random.randn(1, dim).astype(dtype) * std + mean
-            
-            if normalize:
-                matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
-            
-            return matrix, vocab
+
+def _split_embed_file(embed_filepath, start, num_chunks):
+    """将文件[start, 文件末尾)切分为num_chunks段左右，每一段都从行首开始"""
+    size = os.path.getsize(embed_filepath)
+    bounds = [start]
+    with open(embed_filepath, 'rb') as f:
+        for i in range(1, num_chunks):
+            f.seek(max(start + (size - start) * i // num_chunks, bounds[-1]))
+            f.readline()
+            pos = f.tell()
+            if pos >= size:
+                break
+            if pos > bounds[-1]:
+                bounds.append(pos)
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _count_embed_lines(embed_filepath, start, end):
+    num_lines = 0
+    last = b'\n'
+    with open(embed_filepath, 'rb') as f:
+        f.seek(start)
+        while start < end:
+            chunk = f.read(min(1 << 24, end - start))
+            num_lines += chunk.count(b'\n')
+            start += len(chunk)
+            last = chunk[-1:]
+    return num_lines + (last != b'\n')
+
+
+def _embed_line_error(error, line_idx, e):
+    if error == 'ignore':
+        warnings.warn("Error occurred at the {} line.".format(line_idx))
+    else:
+        print("Error occurred at the {} line.".format(line_idx))
+        raise e
+
+
+def _parse_floats(text, dtype):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        try:
+            return np.fromstring(text, sep=' ', dtype=dtype)
+        except ValueError:
+            return np.zeros(0, dtype=dtype)
+
+
+def _parse_embed_range(embed_filepath, dim, dtype, error, out, start, end, line_idx, row_start):
+    """
+    解析文件中[start, end)字节范围内的行，将向量依次写入out[row_start:]。
+
+    :return List[str]: 解析成功的词，与写入的行一一对应
+    """
+    with open(embed_filepath, 'rb') as f:
+        f.seek(start)
+        lines = f.read(end - start).decode('utf-8').split('\n')
+    if lines[-1] == '':
+        lines.pop()
+    words, texts, line_ids = [], [], []
+    for idx, line in enumerate(lines, line_idx):
+        word, _, text = line.partition(' ')
+        if text[-1:].isspace():
+            text = text.rstrip()
+        if not word or text.count(' ') != dim - 1:
+            # 词中包含空格或者使用了其它的分隔符，需要完整地切分这一行
+            parts = line.rsplit(None, dim)
+            if len(parts) != dim + 1:
+                _embed_line_error(error, idx, ValueError("Line {} has {} parts, while dimension is {}.".format(
+                    idx, len(parts), dim)))
+                continue
+            word, text = ''.join(parts[0].split()), line[len(parts[0]):]
+        words.append(word)
+        texts.append(text)
+        line_ids.append(idx)
+    # np.fromstring遇到无法转换的内容时只会给出警告并停止(新版本的numpy会报错)，通过数量判断是否出错
+    vectors = _parse_floats(' '.join(texts), dtype)
+    if vectors.size != len(words) * dim:  # 存在无法转换为数字的行，逐行找出
+        keep, rows = [], []
+        for i, text in enumerate(texts):
+            vector = _parse_floats(text, dtype)
+            if vector.size == dim:
+                rows.append(vector)
+                keep.append(i)
+            else:
+                _embed_line_error(error, line_ids[i], ValueError("Cannot convert line {} to {} numbers.".format(
+                    line_ids[i], dim)))
+        words = [words[i] for i in keep]
+        vectors = np.stack(rows) if rows else np.zeros((0, dim), dtype=dtype)
+    out[row_start:row_start + len(words)] = vectors.reshape(len(words), dim)
+    return words
+
+
+_embed_worker_func = None
+
+
+def _init_embed_worker(func):
+    global _embed_worker_func
+    _embed_worker_func = func
+
+
+def _embed_worker(*args):
+    return _embed_worker_func(*args)
+
+
+def _parse_embed_file(embed_filepath, dtype=np.float32, error='ignore', num_proc=0, reserve=0, out_path=None):
+    """
+    按块解析word2vec或glove格式的embedding文件。先统计每一块的行数以确定每一块在输出矩阵中的起始行，然后各块(num_proc大于1
+    时在多个进程中)直接将向量写入预先分配好的矩阵, 最后将因错误而空出的行压缩掉。
+
+    :param int reserve: 在矩阵最前面预留的行数
+    :param str out_path: 若不为None，输出矩阵为该路径下的 ``.npy`` memmap; 否则在内存中
+    :return (List[str], numpy.ndarray): 词的列表，以及shape为[reserve+len(words), dim]的矩阵
+    """
+    dim, data_start, line_start = _read_embed_header(embed_filepath)
+    if dim <= 0:
+        raise RuntimeError("{} is an empty file.".format(embed_filepath))
+    size = os.path.getsize(embed_filepath)
+    num_chunks = max(1, num_proc, -(-(size - data_start) // _EMBED_CHUNK_SIZE))
+    ranges = _split_embed_file(embed_filepath, data_start, num_chunks)
+    # fork时子进程直接继承输出矩阵(MAP_SHARED)，写入的结果对主进程可见
+    parallel = num_proc > 1 and len(ranges) > 1 and 'fork' in mp.get_all_start_methods()
+    num_proc = min(num_proc, len(ranges))
+    count_args = [(embed_filepath, start, end) for start, end in ranges]
+    if parallel:
+        with mp.get_context('fork').Pool(num_proc) as pool:
+            line_counts = pool.starmap(_count_embed_lines, count_args)
+    else:
+        line_counts = list(starmap(_count_embed_lines, count_args))
+    
+    total = reserve + sum(line_counts)
+    if out_path is not None:
+        out = np.lib.format.open_memmap(out_path, mode='w+', dtype=dtype, shape=(total, dim))
+    elif parallel:
+        buffer = mmap.mmap(-1, max(1, total * dim * np.dtype(dtype).itemsize))
+        out = np.frombuffer(buffer, dtype=dtype, count=total * dim).reshape(total, dim)
+    else:
+        out = np.empty((total, dim), dtype=dtype)
+    
+    line_offsets = np.cumsum([0] + line_counts[:-1]).tolist()
+    args = [(start, end, line_start + offset, reserve + offset)
+            for (start, end), offset in zip(ranges, line_offsets)]
+    parse_func = partial(_parse_embed_range, embed_filepath, dim, dtype, error, out)
+    if parallel:
+        with mp.get_context('fork').Pool(num_proc, initializer=_init_embed_worker, initargs=(parse_func,)) as pool:
+            results = pool.starmap(_embed_worker, args)
+    else:
+        results = list(starmap(parse_func, args))
+    
+    words = []
+    for chunk_words, (_, _, _, row_start) in zip(results, args):
+        dst = reserve + len(words)
+        if dst != row_start:  # 前面有出错的行，向前移动
+            out[dst:dst + len(chunk_words)] = out[row_start:row_start + len(chunk_words)]
+        words.extend(chunk_words)
+    return words, out[:reserve + len(words)]
+
+
+def _match_vocab(words, vocab, padding='<pad>', unknown='<unk>'):
+    """
+    找到vocab中的词在words中的位置。与逐行读取时一致，words中的padding与unknown对应到vocab的padding与unknown上，重复的词
+    以最后一次出现的为准。
+
+    :return (np.ndarray, np.ndarray): vocab中找到的词的index, 以及它们在words中的位置。按照在words中的位置排序，使得从
+        mmap中读取时是顺序访问的。
+    """
+    alias = {}
+    if vocab.padding is not None:
+        alias[padding] = vocab.padding
+    if vocab.unknown is not None:
+        alias[unknown] = vocab.unknown
+    word2idx = {word: index for word, index in vocab}
+    index2row = {}
+    for row, word in enumerate(words):
+        index = word2idx.get(alias.get(word, word))
+        if index is not None:
+            index2row[index] = row
+    indices = np.fromiter(index2row.keys(), dtype=np.int64, count=len(index2row))
+    rows = np.fromiter(index2row.values(), dtype=np.int64, count=len(index2row))
+    order = np.argsort(rows, kind='stable')
+    return indices[order], rows[order]
@@ -6,13 +6,15 @@ __all__ = [
     "GraphParser"
 ]
 
+import atexit
+import multiprocessing as mp
+import os
+
 import numpy as np
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
-from collections import defaultdict
-
 from ..core.const import Const as C
 from ..core.losses import LossFunc
 from ..core.metrics import MetricBase
@@ -52,80 +54,170 @@ def _mst(scores):
         heads[roots] = new_heads
         heads[new_root] = 0
     
-    edges = defaultdict(set)
-    vertices = set((0,))
-    for dep, head in enumerate(heads[tokens]):
-        vertices.add(dep + 1)
-        edges[head].add(dep + 1)
-    for cycle in _find_cycle(vertices, edges):
-        dependents = set()
-        to_visit = set(cycle)
-        while len(to_visit) > 0:
-            node = to_visit.pop()
-            if node not in dependents:
-                dependents.add(node)
-                to_visit.update(edges[node])
-        cycle = np.array(list(cycle))
+    for cycle in _find_cycle(heads):
+        # 环中的词以及所有以环中的词为祖先的词都不能成为环中的词的新head
+        dependents = np.zeros(length, dtype=bool)
+        dependents[cycle] = True
+        while True:
+            new_dependents = dependents[heads] & ~dependents
+            if not new_dependents.any():
+                break
+            dependents |= new_dependents
         old_heads = heads[cycle]
         old_scores = scores[cycle, old_heads]
-        non_heads = np.array(list(dependents))
-        scores[np.repeat(cycle, len(non_heads)),
-               np.repeat([non_heads], len(cycle), axis=0).flatten()] = min_score
+        scores[np.ix_(cycle, np.flatnonzero(dependents))] = min_score
         new_heads = np.argmax(scores[cycle][:, tokens], axis=1) + 1
         new_scores = scores[cycle, new_heads] / old_scores
         change = np.argmax(new_scores)
-        changed_cycle = cycle[change]
-        old_head = old_heads[change]
-        new_head = new_heads[change]
-        heads[changed_cycle] = new_head
-        edges[new_head].add(changed_cycle)
-        edges[old_head].remove(changed_cycle)
+        heads[cycle[change]] = new_heads[change]
     
     return heads
 
 
-def _find_cycle(vertices, edges):
+def _find_cycle(heads):
     """
-    https://en.wikipedia.org/wiki/Tarjan%27s_strongly_connected_components_algorithm
-    https://github.com/tdozat/Parser/blob/0739216129cd39d69997d28cbc4133b360ea3934/lib/etc/tarjan.py
+    找出heads所表示的图中的所有环。每个词只有一个head, 因此从每个还未访问过的词出发沿着head向上走, 若走回了本次出发后
+    经过的词, 则从该词开始的一段路径构成一个环。环按照其中最小的词的顺序返回。
+
+    :param numpy.ndarray heads: [seq_len] 每个词的head, heads[0]为0
+    :return: list[numpy.ndarray], 每个环中的词(从小到大排列)
     """
-    _index = 0
-    _stack = []
-    _indices = {}
-    _lowlinks = {}
-    _onstack = defaultdict(lambda: False)
-    _SCCs = []
-    
-    def _strongconnect(v):
-        nonlocal _index
-        _indices[v] = _index
-        _lowlinks[v] = _index
-        _index += 1
-        _stack.append(v)
-        _onstack[v] = True
-        
-        for w in edges[v]:
-            if w not in _indices:
-                _strongconnect(w)
-                _lowlinks[v] = min(_lowlinks[v], _lowlinks[w])
-            elif _onstack[w]:
-                _lowlinks[v] = min(_lowlinks[v], _indices[w])
-        
-        if _lowlinks[v] == _indices[v]:
-            SCC = set()
-            while True:
-                w = _stack.pop()
-                _onstack[w] = False
-                SCC.add(w)
-                if not (w != v):
-                    break
-            _SCCs.append(SCC)
-    
-    for v in vertices:
-        if v not in _indices:
-            _strongconnect(v)
-    
-    return [SCC for SCC in _SCCs if len(SCC) > 1]
+    visited = np.zeros(len(heads), dtype=np.int64)  # 第几次出发时访问到该词, 0为还未访问
+    visited[0] = -1  # root不会在环中
+    cycles = []
+    for start in range(1, len(heads)):
+        if visited[start]:
+            continue
+        path = []
+        node = start
+        while not visited[node]:
+            visited[node] = start
+            path.append(node)
+            node = heads[node]
+        if visited[node] == start:
+            cycles.append(np.array(sorted(path[path.index(node):])))
+    cycles.sort(key=lambda cycle: cycle[0])
+    return cycles
+
+
+_mst_pool = None
+_mst_pool_size = 0
+
+
+def _close_mst_pool():
+    global _mst_pool, _mst_pool_size
+    if _mst_pool is not None:
+        _mst_pool.terminate()
+        _mst_pool = None
+        _mst_pool_size = 0
+
+
+atexit.register(_close_mst_pool)
+
+
+def _get_mst_pool(num_workers):
+    """
+    返回用于并行MST解码的进程池。进程池在模块内缓存, 避免每个batch都重新创建进程; 不支持fork的平台上返回None。
+    """
+    global _mst_pool, _mst_pool_size
+    if 'fork' not in mp.get_all_start_methods():
+        return None
+    if _mst_pool is None or _mst_pool_size != num_workers:
+        _close_mst_pool()
+        _mst_pool = mp.get_context('fork').Pool(num_workers)
+        _mst_pool_size = num_workers
+    return _mst_pool
+
+
+def _stripe(x, n, w, offset=(0, 0), dim=1):
+    """
+    返回x([seq_len, seq_len, ...])中n条宽度为w的斜向条带组成的view, 第i条为从 ``(offset[0] + i, offset[1] + i)`` 开始,
+    dim为1时沿行方向、为0时沿列方向取的w个元素。
+
+    :param x: [seq_len, seq_len, ...]
+    :return: [n, w, ...]
+    """
+    x, seq_len = x.contiguous(), x.size(1)
+    stride, numel = list(x.stride()), x[0, 0].numel()
+    stride[0] = (seq_len + 1) * numel
+    stride[1] = (1 if dim == 1 else seq_len) * numel
+    return x.as_strided(size=(n, w, *x.shape[2:]), stride=stride,
+                        storage_offset=(offset[0] * seq_len + offset[1]) * numel)
+
+
+def _eisner_backtrack(p_i, p_c, length):
+    heads = [0] * (length + 1)
+    stack = [(0, length, True)]
+    while stack:
+        i, j, complete = stack.pop()
+        if i == j:
+            continue
+        if complete:
+            r = p_c[i][j]
+            stack.append((i, r, False))
+            stack.append((r, j, True))
+        else:
+            r = p_i[i][j]
+            heads[j] = i
+            i, j = min(i, j), max(i, j)
+            stack.append((i, r, True))
+            stack.append((j, r + 1, True))
+    return heads
+
+
+def _eisner(scores, mask):
+    """
+    在整个batch上同时进行的Eisner解码, 得到分数最高的projective树, root(位置0)只有一个孩子。
+    动态规划的每一步都是对所有句子、所有同宽度的span同时进行的tensor运算, 只有最后的回溯在python中进行。
+    参考 https://github.com/yzhangcs/parser
+
+    :param scores: [batch, seq_len, seq_len] scores[b, i, j]为j作为i的head的分数
+    :param mask: [batch, seq_len] 包含root的mask
+    :return heads: [batch, seq_len]
+    """
+    lens = mask.long().sum(1) - 1
+    batch_size, seq_len, _ = scores.shape
+    # [head, dep, batch]
+    scores = scores.permute(2, 1, 0).contiguous()
+    # _stripe要求连续的内存, 否则每次都会复制整个chart
+    s_i = scores.new_full(scores.shape, float('-inf'))
+    s_c = scores.new_full(scores.shape, float('-inf'))
+    p_i = scores.new_zeros(seq_len, seq_len, batch_size).long()
+    p_c = scores.new_zeros(seq_len, seq_len, batch_size).long()
+    s_c.diagonal().fill_(0)
+
+    for w in range(1, seq_len):
+        n = seq_len - w
+        starts = p_i.new_tensor(range(n)).unsqueeze(0)
+        # I(j->i) = max(C(i->r) + C(j->r+1) + s(j->i)), i <= r < j
+        ilr = (_stripe(s_c, n, w) + _stripe(s_c, n, w, (w, 1))).permute(2, 0, 1)
+        il_span, il_path = ilr.max(-1)
+        s_i.diagonal(-w).copy_(il_span + scores.diagonal(-w))
+        p_i.diagonal(-w).copy_(il_path + starts)
+        # I(i->j) = max(C(i->r) + C(j->r+1) + s(i->j)), i <= r < j
+        s_i.diagonal(w).copy_(il_span + scores.diagonal(w))
+        p_i.diagonal(w).copy_(il_path + starts)
+
+        # C(j->i) = max(C(r->i) + I(j->r)), i <= r < j
+        cl = _stripe(s_c, n, w, (0, 0), 0) + _stripe(s_i, n, w, (w, 0))
+        cl_span, cl_path = cl.permute(2, 0, 1).max(-1)
+        s_c.diagonal(-w).copy_(cl_span)
+        p_c.diagonal(-w).copy_(cl_path + starts)
+        # C(i->j) = max(I(i->r) + C(r->j)), i < r <= j
+        cr = _stripe(s_i, n, w, (0, 1)) + _stripe(s_c, n, w, (1, w), 0)
+        cr_span, cr_path = cr.permute(2, 0, 1).max(-1)
+        s_c.diagonal(w).copy_(cr_span)
+        # 只有覆盖整个句子的C(0->len)是合法的, 从而root只能有一个孩子
+        s_c[0, w][lens.ne(w)] = float('-inf')
+        p_c.diagonal(w).copy_(cr_path + starts + 1)
+
+    p_i = p_i.permute(2, 0, 1).cpu()
+    p_c = p_c.permute(2, 0, 1).cpu()
+    heads = torch.zeros(batch_size, seq_len, dtype=torch.long)
+    for b, length in enumerate(lens.tolist()):
+        if length > 0:
+            heads[b, :length + 1] = torch.tensor(_eisner_backtrack(p_i[b].tolist(), p_c[b].tolist(), length))
+    return heads.to(mask.device)
 
 
 class GraphParser(BaseModel):
@@ -156,26 +248,49 @@ class GraphParser(BaseModel):
         return heads
     
     @staticmethod
-    def mst_decoder(arc_matrix, mask=None):
+    def mst_decoder(arc_matrix, mask=None, num_workers=0):
         """
         用最大生成树算法, 计算parsing结果, 保证输出合法的树结构
 
         :param arc_matrix: [batch, seq_len, seq_len] 输入图矩阵
         :param mask: [batch, seq_len] 输入图的padding mask, 有内容的部分为 1, 否则为 0.
             若为 ``None`` 时, 默认为全1向量. Default: ``None``
+        :param int num_workers: 大于1时在多个进程中并行地对batch中的句子解码. Default: ``0``
         :return heads: [batch, seq_len] 每个元素在树中对应的head(parent)预测结果
         """
         batch_size, seq_len, _ = arc_matrix.shape
-        matrix = arc_matrix.clone()
-        ans = matrix.new_zeros(batch_size, seq_len).long()
-        lens = (mask.long()).sum(1) if mask is not None else torch.zeros(batch_size) + seq_len
-        for i, graph in enumerate(matrix):
-            len_i = lens[i]
-            ans[i, :len_i] = torch.as_tensor(_mst(graph.detach()[:len_i, :len_i].cpu().numpy()), device=ans.device)
+        # 整个batch只拷贝一次到cpu
+        matrix = arc_matrix.detach().cpu().numpy()
+        lens = mask.long().sum(1).tolist() if mask is not None else [seq_len] * batch_size
+        graphs = [graph[:len_i, :len_i] for graph, len_i in zip(matrix, lens)]
+        pool = _get_mst_pool(num_workers) if num_workers > 1 and batch_size > 1 else None
+        if pool is not None:
+            chunksize = (batch_size + num_workers - 1) // num_workers
+            results = pool.map(_mst, graphs, chunksize=chunksize)
+        else:
+            results = map(_mst, graphs)
+        ans = np.zeros((batch_size, seq_len), dtype=np.int64)
+        for i, heads in enumerate(results):
+            ans[i, :len(heads)] = heads
+        ans = torch.from_numpy(ans).to(arc_matrix.device)
         if mask is not None:
             ans *= mask.long()
         return ans
 
+    @staticmethod
+    def eisner_decoder(arc_matrix, mask=None):
+        """
+        用Eisner算法在整个batch上同时解码, 保证输出合法的projective树结构, 且root只有一个孩子
+
+        :param arc_matrix: [batch, seq_len, seq_len] 输入图矩阵
+        :param mask: [batch, seq_len] 输入图的padding mask, 有内容的部分为 1, 否则为 0.
+            若为 ``None`` 时, 默认为全1向量. Default: ``None``
+        :return heads: [batch, seq_len] 每个元素在树中对应的head(parent)预测结果
+        """
+        if mask is None:
+            mask = arc_matrix.new_ones(arc_matrix.shape[:2], dtype=torch.long)
+        return _eisner(arc_matrix.detach(), mask)
+
 
 class ArcBiaffine(nn.Module):
     """
@@ -256,7 +371,12 @@ class BiaffineParser(GraphParser):
     :param dropout: dropout概率.
     :param encoder: encoder类别, 可选 ('lstm', 'var-lstm', 'transformer'). Default: lstm
     :param use_greedy_infer: 是否在inference时使用贪心算法.
-        若 ``False`` , 使用更加精确但相对缓慢的MST算法. Default: ``False``
+        若 ``False`` , 使用更加精确但相对缓慢的树解码算法(由decoder决定). Default: ``False``
+    :param decoder: use_greedy_infer为 ``False`` 时inference使用的解码算法, 可选 ('mst', 'mst_parallel', 'eisner').
+        'mst' 为逐句的最大生成树算法; 'mst_parallel' 在多个进程中对batch中的句子并行地做最大生成树解码;
+        'eisner' 在整个batch上用tensor运算做Eisner解码, 只输出projective的树. Default: mst
+    :param int num_workers: decoder为 'mst_parallel' 时并行解码使用的进程数, 为 ``None`` 时使用 ``os.cpu_count()`` 个进程.
+        Default: ``None``
     """
     
     def __init__(self,
@@ -270,8 +390,12 @@ class BiaffineParser(GraphParser):
                  label_mlp_size=100,
                  dropout=0.3,
                  encoder='lstm',
-                 use_greedy_infer=False):
+                 use_greedy_infer=False,
+                 decoder='mst',
+                 num_workers=None):
         super(BiaffineParser, self).__init__()
+        if decoder not in ('mst', 'mst_parallel', 'eisner'):
+            raise ValueError('unsupported decoder type: {}'.format(decoder))
         rnn_out_size = 2 * rnn_hidden_size
         word_hid_dim = pos_hid_dim = rnn_hidden_size
         self.word_embedding = get_embeddings(init_embed)
@@ -325,6 +449,8 @@ class BiaffineParser(GraphParser):
         self.arc_predictor = ArcBiaffine(arc_mlp_size, bias=True)
         self.label_predictor = LabelBilinear(label_mlp_size, label_mlp_size, num_label, bias=True)
         self.use_greedy_infer = use_greedy_infer
+        self.decoder = decoder
+        self.num_workers = num_workers if num_workers is not None else (os.cpu_count() or 1)
         self.reset_parameters()
         self.dropout = dropout
     
@@ -399,6 +525,10 @@ class BiaffineParser(GraphParser):
             # use greedy decoding in training
             if self.training or self.use_greedy_infer:
                 heads = self.greedy_decoder(arc_pred, mask)
+            elif self.decoder == 'eisner':
+                heads = self.eisner_decoder(arc_pred, mask)
+            elif self.decoder == 'mst_parallel':
+                heads = self.mst_decoder(arc_pred, mask, num_workers=self.num_workers)
             else:
                 heads = self.mst_decoder(arc_pred, mask)
             head_pred = heads
@@ -513,6 +643,8 @@ class ParserMetric(MetricBase):
         UAS: 不带label时, 边预测的准确率
         LAS: 同时预测边和label的准确率
     """
+
+    _state_names = ('num_arc', 'num_label', 'num_sample')
     
     def __init__(self, pred1=None, pred2=None,
                  target1=None, target2=None, seq_len=None):
@@ -12,8 +12,6 @@ from ...core.vocabulary import Vocabulary
 import collections
 
 import unicodedata
-import numpy as np
-from itertools import chain
 import copy
 import json
 import math
@@ -904,94 +902,119 @@ class _WordBertModel(nn.Module):
         self.tokenzier._reinit_on_new_vocab(new_word_piece_vocab)
         self.encoder.embeddings.word_embeddings = embed
 
-        word_to_wordpieces = []
-        word_pieces_lengths = []
+        word_to_wordpieces = {}
         for word, index in vocab:
             if index == vocab.padding_idx:  # pad是个特殊的符号
                 word = '[PAD]'
             elif index == vocab.unknown_idx:
                 word = '[UNK]'
             word_pieces = self.tokenzier.wordpiece_tokenizer.tokenize(word)
-            word_pieces = self.tokenzier.convert_tokens_to_ids(word_pieces)
-            word_to_wordpieces.append(word_pieces)
-            word_pieces_lengths.append(len(word_pieces))
+            word_to_wordpieces[index] = self.tokenzier.convert_tokens_to_ids(word_pieces)
         print("Found(Or seg into word pieces) {} words out of {}.".format(found_count, len(vocab)))
         self._cls_index = self.tokenzier.vocab['[CLS]']
         self._sep_index = self.tokenzier.vocab['[SEP]']
         self._pad_index = vocab.padding_idx
         self._wordpiece_pad_index = self.tokenzier.vocab['[PAD]']  # 需要用于生成word_piece
-        self.word_to_wordpieces = np.array(word_to_wordpieces)
-        self.word_pieces_lengths = nn.Parameter(torch.LongTensor(word_pieces_lengths), requires_grad=False)
+        # 每个word的word pieces被pad成一张表, 第i行为index为i的word的word pieces; 长度为0的word(例如pad)在forward中被忽略
+        max_word_pieces = max(map(len, word_to_wordpieces.values()))
+        word_to_wordpieces_table = torch.full((len(vocab), max_word_pieces), self._wordpiece_pad_index, dtype=torch.long)
+        word_pieces_lengths = torch.zeros(len(vocab), dtype=torch.long)
+        for index, word_pieces in word_to_wordpieces.items():
+            word_to_wordpieces_table[index, :len(word_pieces)] = torch.LongTensor(word_pieces)
+            word_pieces_lengths[index] = len(word_pieces)
+        self.register_buffer('word_to_wordpieces', word_to_wordpieces_table)
+        self.word_pieces_lengths = nn.Parameter(word_pieces_lengths, requires_grad=False)
         print("Successfully generate word pieces.")
 
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        # 之前版本保存的state_dict中没有word_to_wordpieces, 此时沿用__init__中根据vocab生成的表
+        key = prefix + 'word_to_wordpieces'
+        if key not in state_dict:
+            state_dict[key] = self.word_to_wordpieces
+        super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
     def forward(self, words):
         """
+        word pieces的生成与pool都是在整个batch上的tensor运算。
 
         :param words: torch.LongTensor, batch_size x max_len
         :return: num_layers x batch_size x max_len x hidden_size或者num_layers x batch_size x (max_len+2) x hidden_size
         """
         batch_size, max_word_len = words.size()
-        seq_len = words.ne(self._pad_index).sum(dim=-1)
-        batch_word_pieces_length = self.word_pieces_lengths[words]  # batch_size x max_len
-        word_pieces_lengths = batch_word_pieces_length.sum(dim=-1)
-        max_word_piece_length = word_pieces_lengths.max().item()
+        word_mask = words.ne(self._pad_index)
+        seq_len = word_mask.sum(dim=-1)
+        batch_word_pieces_length = self.word_pieces_lengths[words].masked_fill(word_mask.eq(0), 0)  # batch_size x max_len
+        batch_word_pieces_cum_length = batch_word_pieces_length.cumsum(dim=-1)  # 每个word的end(不包含)
+        batch_word_pieces_start = batch_word_pieces_cum_length - batch_word_pieces_length  # 每个word的start
+        word_pieces_lengths = batch_word_pieces_cum_length[:, -1]  # batch_size
+        # 只同步一次, 获取word piece的最大长度以及单个word的最大word piece数
+        max_word_piece_length, max_piece_num = torch.stack([word_pieces_lengths.max(),
+                                                            batch_word_pieces_length.max()]).tolist()
+        # 1. 获取words的word_pieces的id. 在每个word的第一个word piece处标记1再cumsum, 得到每个word piece所属的word
+        piece_range = torch.arange(max_word_piece_length, device=words.device)
+        piece_mask = piece_range.unsqueeze(0).lt(word_pieces_lengths.unsqueeze(1))  # batch_size x max_word_piece_length
+        word_starts = batch_word_pieces_start.masked_fill(batch_word_pieces_length.eq(0), max_word_piece_length)
+        piece_word_index = words.new_zeros(batch_size, max_word_piece_length + 1)
+        piece_word_index.scatter_(1, word_starts, 1)
+        piece_word_index = piece_word_index[:, :-1].cumsum(dim=-1).sub_(1).clamp_(min=0)  # batch_size x max_word_piece_length
+        piece_offset = piece_range.unsqueeze(0) - batch_word_pieces_start.gather(1, piece_word_index)
+        piece_offset = piece_offset.masked_fill(piece_mask.eq(0), 0)
+        pieces = self.word_to_wordpieces[words.gather(1, piece_word_index), piece_offset]
         # +2是由于需要加入[CLS]与[SEP]
-        word_pieces = words.new_full((batch_size, max_word_piece_length+2), fill_value=self._wordpiece_pad_index)
+        word_pieces = words.new_full((batch_size, max_word_piece_length + 2), fill_value=self._wordpiece_pad_index)
         word_pieces[:, 0].fill_(self._cls_index)
-        batch_indexes = torch.arange(batch_size).to(words)
-        word_pieces[batch_indexes, word_pieces_lengths+1] = self._sep_index
-        attn_masks = torch.zeros_like(word_pieces)
-        # 1. 获取words的word_pieces的id，以及对应的span范围
-        word_indexes = words.tolist()
-        for i in range(batch_size):
-            word_pieces_i = list(chain(*self.word_to_wordpieces[word_indexes[i]]))
-            word_pieces[i, 1:len(word_pieces_i)+1] = torch.LongTensor(word_pieces_i)
-            attn_masks[i, :len(word_pieces_i)+2].fill_(1)
+        word_pieces[:, 1:-1] = pieces.masked_fill(piece_mask.eq(0), self._wordpiece_pad_index)
+        batch_indexes = torch.arange(batch_size, device=words.device)
+        word_pieces[batch_indexes, word_pieces_lengths + 1] = self._sep_index
+        attn_masks = torch.arange(max_word_piece_length + 2, device=words.device).unsqueeze(0).lt(
+            word_pieces_lengths.unsqueeze(1) + 2).long()
         # TODO 截掉长度超过的部分。
         # 2. 获取hidden的结果，根据word_pieces进行对应的pool计算
         # all_outputs: [batch_size x max_len x hidden_size, batch_size x max_len x hidden_size, ...]
         bert_outputs, _ = self.encoder(word_pieces, token_type_ids=None, attention_mask=attn_masks,
                                            output_all_encoded_layers=True)
         # output_layers = [self.layers]  # len(self.layers) x batch_size x max_word_piece_length x hidden_size
+        hidden_size = bert_outputs[-1].size(-1)
 
-        if self.include_cls_sep:
-            outputs = bert_outputs[-1].new_zeros(len(self.layers), batch_size, max_word_len + 2,
-                                                 bert_outputs[-1].size(-1))
-            s_shift = 1
+        if self.pool_method in ('first', 'last'):
+            if self.pool_method == 'first':
+                pool_index = batch_word_pieces_start
+            else:
+                pool_index = batch_word_pieces_cum_length - 1
+            pool_index = pool_index.clamp(0, max(max_word_piece_length - 1, 0))
+            pool_index = pool_index.unsqueeze(-1).expand(-1, -1, hidden_size)
+        elif self.pool_method == 'max':
+            # batch_size x max_len x max_piece_num, 每个word的所有word piece的位置, 不足的部分用最后一个word piece补齐
+            pool_index = batch_word_pieces_start.unsqueeze(-1) + torch.arange(max_piece_num, device=words.device)
+            pool_index = torch.min(pool_index, (batch_word_pieces_cum_length - 1).unsqueeze(-1))
+            pool_index = pool_index.clamp(0, max(max_word_piece_length - 1, 0)).view(batch_size, -1, 1)
+            pool_index = pool_index.expand(-1, -1, hidden_size)
         else:
-            outputs = bert_outputs[-1].new_zeros(len(self.layers), batch_size, max_word_len,
-                                                 bert_outputs[-1].size(-1))
-            s_shift = 0
-        batch_word_pieces_cum_length = batch_word_pieces_length.new_zeros(batch_size, max_word_len + 1)
-        batch_word_pieces_cum_length[:, 1:] = batch_word_pieces_length.cumsum(dim=-1)  # batch_size x max_len
-        for l_index, l in enumerate(self.layers):
+            # pad部分的word piece被分配到额外的一个word上, 最后被丢弃
+            pool_index = piece_word_index.masked_fill(piece_mask.eq(0), max_word_len)
+            pool_index = pool_index.unsqueeze(-1).expand(-1, -1, hidden_size)
+            avg_lengths = batch_word_pieces_length.clamp(min=1).unsqueeze(-1).to(bert_outputs[-1])
+
+        outputs = []
+        for l in self.layers:
             output_layer = bert_outputs[l]
             # 从word_piece collapse到word的表示
             truncate_output_layer = output_layer[:, 1:-1]  # 删除[CLS]与[SEP] batch_size x len x hidden_size
-            outputs_seq_len = seq_len + s_shift
-            if self.pool_method == 'first':
-                for i in range(batch_size):
-                    i_word_pieces_cum_length = batch_word_pieces_cum_length[i, :seq_len[i]]  # 每个word的start位置
-                    outputs[l_index, i, s_shift:outputs_seq_len[i]] = truncate_output_layer[i, i_word_pieces_cum_length]  # num_layer x batch_size x len x hidden_size
-            elif self.pool_method == 'last':
-                for i in range(batch_size):
-                    i_word_pieces_cum_length = batch_word_pieces_cum_length[i, 1:seq_len[i]+1] - 1 # 每个word的end
-                    outputs[l_index, i, s_shift:outputs_seq_len[i]] = truncate_output_layer[i, i_word_pieces_cum_length]
+            if self.pool_method in ('first', 'last'):
+                output = truncate_output_layer.gather(1, pool_index)
             elif self.pool_method == 'max':
-                for i in range(batch_size):
-                    for j in range(seq_len[i]):
-                        start, end = batch_word_pieces_cum_length[i, j], batch_word_pieces_cum_length[i, j+1]
-                        outputs[l_index, i, j+s_shift], _ = torch.max(truncate_output_layer[i, start:end], dim=-2)
+                output = truncate_output_layer.gather(1, pool_index)
+                output = output.view(batch_size, max_word_len, max_piece_num, hidden_size).max(dim=-2)[0]
             else:
-                for i in range(batch_size):
-                    for j in range(seq_len[i]):
-                        start, end = batch_word_pieces_cum_length[i, j], batch_word_pieces_cum_length[i, j+1]
-                        outputs[l_index, i, j+s_shift] = torch.mean(truncate_output_layer[i, start:end], dim=-2)
+                output = truncate_output_layer.new_zeros(batch_size, max_word_len + 1, hidden_size)
+                output = output.scatter_add(1, pool_index, truncate_output_layer)[:, :-1] / avg_lengths
+            output = output.masked_fill(word_mask.eq(0).unsqueeze(-1), 0)
             if self.include_cls_sep:
-                outputs[l_index, :, 0] = output_layer[:, 0]
-                outputs[l_index, batch_indexes, seq_len+s_shift] = output_layer[batch_indexes, seq_len+s_shift]
+                output = torch.cat([output_layer[:, :1], output, output.new_zeros(batch_size, 1, hidden_size)], dim=1)
+                output[batch_indexes, seq_len + 1] = output_layer[batch_indexes, word_pieces_lengths + 1]
+            outputs.append(output)
         # 3. 最终的embedding结果
-        return outputs
+        return torch.stack(outputs, dim=0)
 
 
 class _WordPieceBertModel(nn.Module):
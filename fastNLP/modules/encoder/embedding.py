@@ -21,12 +21,16 @@ from ...io.file_utils import cached_path, _get_base_url
 from ._bert import _WordBertModel
 from typing import List
 
+import hashlib
+import json
 import warnings
+from collections import OrderedDict
 from ...core.dataset import DataSet
 from ...core.batch import DataSetIter
 from ...core.sampler import SequentialSampler
 from ...core.utils import _move_model_to_device, _get_model_device
 from ...io.file_utils import PRETRAINED_BERT_MODEL_DIR, PRETRAINED_ELMO_MODEL_DIR, PRETRAIN_STATIC_FILES
+from ...io.embed_loader import EmbedLoader, _match_vocab
 
 
 class Embedding(nn.Module):
@@ -224,9 +228,11 @@ class StaticEmbedding(TokenEmbedding):
     :param float word_dropout: 以多大的概率将一个词替换为unk。这样既可以训练unk也是一定的regularize。
     :param float dropout: 以多大的概率对embedding的表示进行Dropout。0.1即随机将10%的值置为0。
     :param bool normailize: 是否对vector进行normalize，使得每个vector的norm为1。
+    :param str cache_dir: 若不为None，会将预训练的embedding转换为二进制格式缓存在该目录中，之后的读取只需通过mmap取出vocab
+        需要的行。参见 :meth:`fastNLP.io.EmbedLoader.build_cache`
     """
     def __init__(self, vocab: Vocabulary, model_dir_or_name: str='en', requires_grad: bool=True, init_method=None,
-                 lower=False, dropout=0, word_dropout=0, normalize=False):
+                 lower=False, dropout=0, word_dropout=0, normalize=False, cache_dir=None):
         super(StaticEmbedding, self).__init__(vocab, word_dropout=word_dropout, dropout=dropout)
 
         # 得到cache_path
@@ -256,7 +262,7 @@ class StaticEmbedding(TokenEmbedding):
             print(f"All word in vocab have been lowered. There are {len(vocab)} words, {len(lowered_vocab)} unique lowered "
                   f"words.")
             embedding = self._load_with_vocab(model_path, vocab=lowered_vocab, init_method=init_method,
-                                                          normalize=normalize)
+                                              normalize=normalize, cache_dir=cache_dir)
             # 需要适配一下
             if not hasattr(self, 'words_to_words'):
                 self.words_to_words = torch.arange(len(lowered_vocab, )).long()
@@ -275,7 +281,7 @@ class StaticEmbedding(TokenEmbedding):
             self.words_to_words = words_to_words
         else:
             embedding = self._load_with_vocab(model_path, vocab=vocab, init_method=init_method,
-                                                          normalize=normalize)
+                                              normalize=normalize, cache_dir=cache_dir)
         self.embedding = nn.Embedding(num_embeddings=embedding.shape[0], embedding_dim=embedding.shape[1],
                                       padding_idx=vocab.padding_idx,
                                       max_norm=None, norm_type=2, scale_grad_by_freq=False,
@@ -304,7 +310,7 @@ class StaticEmbedding(TokenEmbedding):
             param.requires_grad = value
 
     def _load_with_vocab(self, embed_filepath, vocab, dtype=np.float32, padding='<pad>', unknown='<unk>',
-                         normalize=True, error='ignore', init_method=None):
+                         normalize=True, error='ignore', init_method=None, cache_dir=None):
         """
         从embed_filepath这个预训练的词向量中抽取出vocab这个词表的词的embedding。EmbedLoader将自动判断embed_filepath是
         word2vec(第一行只有两个元素)还是glove格式的数据。
@@ -319,79 +325,89 @@ class StaticEmbedding(TokenEmbedding):
         :param str error: `ignore` , `strict` ; 如果 `ignore` ，错误将自动跳过; 如果 `strict` , 错误将抛出。
             这里主要可能出错的地方在于词表有空行或者词表出现了维度不一致。
         :param init_method: 如何初始化没有找到的值。可以使用torch.nn.init.*中各种方法。默认使用torch.nn.init.zeros_
+        :param str cache_dir: 二进制格式embedding的缓存目录，参见 :meth:`fastNLP.io.EmbedLoader.build_cache`
         :return torch.tensor:  shape为 [len(vocab), dimension], dimension由pretrain的embedding决定。
         """
         assert isinstance(vocab, Vocabulary), "Only fastNLP.Vocabulary is supported."
         if not os.path.exists(embed_filepath):
             raise FileNotFoundError("`{}` does not exist.".format(embed_filepath))
-        with open(embed_filepath, 'r', encoding='utf-8') as f:
-            line = f.readline().strip()
-            parts = line.split()
-            start_idx = 0
-            if len(parts) == 2:
-                dim = int(parts[1])
-                start_idx += 1
-            else:
-                dim = len(parts) - 1
-                f.seek(0)
-            matrix = {}
-            found_count = 0
-            for idx, line in enumerate(f, start_idx):
-                try:
-                    parts = line.strip().split()
-                    word = ''.join(parts[:-dim])
-                    nums = parts[-dim:]
-                    # 对齐unk与pad
-                    if word == padding and vocab.padding is not None:
-                        word = vocab.padding
-                    elif word == unknown and vocab.unknown is not None:
-                        word = vocab.unknown
-                    if word in vocab:
-                        index = vocab.to_index(word)
-                        matrix[index] = torch.from_numpy(np.fromstring(' '.join(nums), sep=' ', dtype=dtype, count=dim))
-                        found_count += 1
-                except Exception as e:
-                    if error == 'ignore':
-                        warnings.warn("Error occurred at the {} line.".format(idx))
-                    else:
-                        print("Error occurred at the {} line.".format(idx))
-                        raise e
-            print("Found {} out of {} words in the pre-training embedding.".format(found_count, len(vocab)))
-            for word, index in vocab:
-                if index not in matrix and not vocab._is_word_no_create_entry(word):
-                    if vocab.unknown_idx in matrix:  # 如果有unkonwn，用unknown初始化
-                        matrix[index] = matrix[vocab.unknown_idx]
-                    else:
-                        matrix[index] = None
-
-            vectors = torch.zeros(len(matrix), dim)
-            if init_method:
-                init_method(vectors)
-            else:
-                nn.init.uniform_(vectors, -np.sqrt(3/dim), np.sqrt(3/dim))
-
-            if vocab._no_create_word_length>0:
-                if vocab.unknown is None:  # 创建一个专门的unknown
-                    unknown_idx = len(matrix)
-                    vectors = torch.cat((vectors, torch.zeros(1, dim)), dim=0).contiguous()
+        matrix = {}
+        found_count = 0
+        if cache_dir is not None:
+            words, cached_vectors = EmbedLoader.build_cache(embed_filepath, cache_dir, error=error)
+            dim = cached_vectors.shape[1]
+            indices, rows = _match_vocab(words, vocab, padding, unknown)
+            found_vectors = torch.from_numpy(np.asarray(cached_vectors[rows], dtype=dtype))
+            for index, vec in zip(indices.tolist(), found_vectors):
+                matrix[index] = vec
+            found_count = len(indices)
+        else:
+            with open(embed_filepath, 'r', encoding='utf-8') as f:
+                line = f.readline().strip()
+                parts = line.split()
+                start_idx = 0
+                if len(parts) == 2:
+                    dim = int(parts[1])
+                    start_idx += 1
+                else:
+                    dim = len(parts) - 1
+                    f.seek(0)
+                for idx, line in enumerate(f, start_idx):
+                    try:
+                        parts = line.strip().split()
+                        word = ''.join(parts[:-dim])
+                        nums = parts[-dim:]
+                        # 对齐unk与pad
+                        if word == padding and vocab.padding is not None:
+                            word = vocab.padding
+                        elif word == unknown and vocab.unknown is not None:
+                            word = vocab.unknown
+                        if word in vocab:
+                            index = vocab.to_index(word)
+                            matrix[index] = torch.from_numpy(np.fromstring(' '.join(nums), sep=' ', dtype=dtype, count=dim))
+                            found_count += 1
+                    except Exception as e:
+                        if error == 'ignore':
+                            warnings.warn("Error occurred at the {} line.".format(idx))
+                        else:
+                            print("Error occurred at the {} line.".format(idx))
+                            raise e
+        print("Found {} out of {} words in the pre-training embedding.".format(found_count, len(vocab)))
+        for word, index in vocab:
+            if index not in matrix and not vocab._is_word_no_create_entry(word):
+                if vocab.unknown_idx in matrix:  # 如果有unkonwn，用unknown初始化
+                    matrix[index] = matrix[vocab.unknown_idx]
                 else:
-                    unknown_idx = vocab.unknown_idx
-                words_to_words = nn.Parameter(torch.full((len(vocab),), fill_value=unknown_idx).long(),
-                                              requires_grad=False)
-                for order, (index, vec) in enumerate(matrix.items()):
-                    if vec is not None:
-                        vectors[order] = vec
-                    words_to_words[index] = order
-                self.words_to_words = words_to_words
+                    matrix[index] = None
+
+        vectors = torch.zeros(len(matrix), dim)
+        if init_method:
+            init_method(vectors)
+        else:
+            nn.init.uniform_(vectors, -np.sqrt(3/dim), np.sqrt(3/dim))
+
+        if vocab._no_create_word_length>0:
+            if vocab.unknown is None:  # 创建一个专门的unknown
+                unknown_idx = len(matrix)
+                vectors = torch.cat((vectors, torch.zeros(1, dim)), dim=0).contiguous()
             else:
-                for index, vec in matrix.items():
-                    if vec is not None:
-                        vectors[index] = vec
+                unknown_idx = vocab.unknown_idx
+            words_to_words = nn.Parameter(torch.full((len(vocab),), fill_value=unknown_idx).long(),
+                                          requires_grad=False)
+            for order, (index, vec) in enumerate(matrix.items()):
+                if vec is not None:
+                    vectors[order] = vec
+                words_to_words[index] = order
+            self.words_to_words = words_to_words
+        else:
+            for index, vec in matrix.items():
+                if vec is not None:
+                    vectors[index] = vec
 
-            if normalize:
-                vectors /= (torch.norm(vectors, dim=1, keepdim=True) + 1e-12)
+        if normalize:
+            vectors /= (torch.norm(vectors, dim=1, keepdim=True) + 1e-12)
 
-            return vectors
+        return vectors
 
     def forward(self, words):
         """
@@ -408,11 +424,148 @@ class StaticEmbedding(TokenEmbedding):
         return words
 
 
+class _SentenceCache(object):
+    """
+    ContextualEmbedding的句子表示缓存。包含两层:
+
+        1. 内存中的LRU缓存, 最多保存cache_size句话的表示(None为不限制);
+        2. cache_dir不为None时, 所有句子的表示会追加写入cache_dir下的embeds.bin, 读取时以memmap的形式按需读取, 并通过
+           index.json记录每句话的位置, 因此之后的进程可以复用。
+
+    句子以其word index序列的md5为key。cache_dir中的内容只对生成它的vocab与模型有效。
+
+    同一时间只能有一个进程(一个_SentenceCache)使用同一个cache_dir: 写入embeds.bin与更新index.json时没有加锁, 且初始化时会
+    截掉embeds.bin中没有记录在index.json中的部分, 即其它进程正在写入的内容。多个进程需要同一份缓存时, 应先在一个进程中
+    生成好, 之后再在各进程中读取。
+
+    :param int embed_size: 每个token表示的维度
+    :param int cache_size: 内存中最多缓存多少句话的表示
+    :param str cache_dir: 在硬盘上缓存表示的文件夹
+    """
+    INDEX_NAME = 'index.json'
+    EMBEDS_NAME = 'embeds.bin'
+
+    def __init__(self, embed_size, cache_size=None, cache_dir=None):
+        self.embed_size = embed_size
+        self.cache_size = cache_size
+        self.cache_dir = cache_dir
+        self._memory = OrderedDict()
+        self._index = {}  # key -> (第一行的位置, 行数)
+        self._num_rows = 0
+        self._memmap = None
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            index_path = os.path.join(cache_dir, self.INDEX_NAME)
+            if os.path.exists(index_path):
+                with open(index_path, 'r', encoding='utf-8') as f:
+                    meta = json.load(f)
+                if meta['embed_size'] != embed_size:
+                    raise ValueError(f"The sentence cache in {cache_dir} has embed_size {meta['embed_size']}, "
+                                     f"but {embed_size} is expected.")
+                self._index = {key: tuple(value) for key, value in meta['index'].items()}
+                self._num_rows = meta['num_rows']
+            # 删除上次中断时写入了但是没有记录在index中的部分
+            embeds_path = os.path.join(cache_dir, self.EMBEDS_NAME)
+            if os.path.exists(embeds_path):
+                os.truncate(embeds_path, self._num_rows * embed_size * 4)
+
+    @staticmethod
+    def key(word_ids):
+        """不依赖于python hash的seed, 因此在不同进程之间是稳定的"""
+        return hashlib.md5(np.asarray(word_ids, dtype=np.int64).tobytes()).hexdigest()
+
+    def __contains__(self, key):
+        return key in self._memory or key in self._index
+
+    def __len__(self):
+        return len(self._index) if self.cache_dir is not None else len(self._memory)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_memmap'] = None
+        return state
+
+    def _add_to_memory(self, key, embed):
+        self._memory[key] = embed
+        self._memory.move_to_end(key)
+        if self.cache_size is not None:
+            while len(self._memory) > self.cache_size:
+                self._memory.popitem(last=False)
+
+    def add(self, key, embed):
+        """
+        :param str key: :meth:`key` 的结果
+        :param np.ndarray embed: [seq_len, embed_size]
+        """
+        # 复制一份, 否则缓存的是整个batch输出的view, 会使整个batch的数组一直留在内存中
+        embed = np.array(embed, dtype=np.float32, order='C', copy=True)
+        if self.cache_dir is not None and key not in self._index:
+            with open(os.path.join(self.cache_dir, self.EMBEDS_NAME), 'ab') as f:
+                f.write(embed.tobytes())
+            self._index[key] = (self._num_rows, len(embed))
+            self._num_rows += len(embed)
+            self._memmap = None  # 文件变长了, 需要重新map
+        self._add_to_memory(key, torch.from_numpy(embed))
+
+    def get(self, key):
+        """
+        :param str key: :meth:`key` 的结果
+        :return: torch.FloatTensor [seq_len, embed_size], 没有缓存时返回None
+        """
+        embed = self._memory.get(key)
+        if embed is not None:
+            self._memory.move_to_end(key)
+            return embed
+        if key in self._index:
+            if self._memmap is None:
+                self._memmap = np.memmap(os.path.join(self.cache_dir, self.EMBEDS_NAME), dtype=np.float32,
+                                         mode='r', shape=(self._num_rows, self.embed_size))
+            start, length = self._index[key]
+            embed = torch.from_numpy(np.array(self._memmap[start:start + length]))
+            self._add_to_memory(key, embed)
+            return embed
+        return None
+
+    def lookup(self, words, pad_index):
+        """
+        获取一个batch的表示, 所有句子的表示拼接后只拷贝一次到words所在的device, 再通过一次gather得到pad后的结果。
+
+        :param torch.LongTensor words: [batch_size, max_len]
+        :param int pad_index: pad的index
+        :return: torch.FloatTensor [batch_size, max_sent_len, embed_size], 有任何一句话没有缓存时返回None
+        """
+        seq_len = words.ne(pad_index).sum(dim=-1).tolist()
+        embeds = []
+        for word_ids, length in zip(words.tolist(), seq_len):
+            embed = self.get(self.key(word_ids[:length]))
+            if embed is None:
+                return None
+            embeds.append(embed)
+        lengths = torch.LongTensor([len(embed) for embed in embeds])
+        flat_embeds = torch.cat(embeds, dim=0).to(words.device)
+        positions = torch.arange(lengths.max().item(), dtype=torch.long)
+        mask = positions.unsqueeze(0).lt(lengths.unsqueeze(1))
+        index = (lengths.cumsum(dim=0) - lengths).unsqueeze(1) + positions.unsqueeze(0)
+        index = index.masked_fill(mask.eq(0), 0).to(words.device)
+        return flat_embeds[index].masked_fill(mask.eq(0).unsqueeze(-1).to(words.device), 0)
+
+    def flush(self):
+        """将index写入硬盘"""
+        if self.cache_dir is not None:
+            meta = {'embed_size': self.embed_size, 'num_rows': self._num_rows,
+                    'index': {key: list(value) for key, value in self._index.items()}}
+            index_path = os.path.join(self.cache_dir, self.INDEX_NAME)
+            with open(index_path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+            os.replace(index_path + '.tmp', index_path)
+
+
 class ContextualEmbedding(TokenEmbedding):
     def __init__(self, vocab: Vocabulary, word_dropout:float=0.0, dropout:float=0.0):
         super(ContextualEmbedding, self).__init__(vocab, word_dropout=word_dropout, dropout=dropout)
 
-    def add_sentence_cache(self, *datasets, batch_size=32, device='cpu', delete_weights: bool=True):
+    def add_sentence_cache(self, *datasets, batch_size=32, device='cpu', delete_weights: bool=True,
+                           cache_size=None, cache_dir=None):
         """
         由于动态embedding生成比较耗时，所以可以把每句话embedding缓存下来，这样就不需要每次都运行生成过程。
 
@@ -420,6 +573,9 @@ class ContextualEmbedding(TokenEmbedding):
         :param batch_size: int, 生成cache的sentence表示时使用的batch的大小
         :param device: 参考 :class::fastNLP.Trainer 的device
         :param delete_weights: 似乎在生成了cache之后删除权重，在不需要finetune动态模型的情况下，删除权重会大量减少内存占用。
+        :param int cache_size: 内存中最多缓存多少句话的表示, 超过之后删除最久没有使用的句子。None为不限制。
+        :param str cache_dir: 不为None时同时将表示缓存在该文件夹中(按需读入内存), 下次调用时已经缓存在其中的句子不会重新计算。
+            该文件夹只能用于同一个vocab与模型, 且同一时间只能被一个进程使用, 参见 :class:`_SentenceCache` 。
         :return:
         """
         for index, dataset in enumerate(datasets):
@@ -429,8 +585,11 @@ class ContextualEmbedding(TokenEmbedding):
             except Exception as e:
                 print(f"Exception happens at {index} dataset.")
                 raise e
+        if delete_weights and cache_size is not None and cache_dir is None:
+            raise ValueError("cache_size requires cache_dir when delete_weights=True, otherwise the representations "
+                             "dropped from memory can not be recovered.")
 
-        sent_embeds = {}
+        sent_embeds = _SentenceCache(self.embed_size, cache_size=cache_size, cache_dir=cache_dir)
         _move_model_to_device(self, device=device)
         device = _get_model_device(self)
         pad_index = self._word_vocab.padding_idx
@@ -440,22 +599,21 @@ class ContextualEmbedding(TokenEmbedding):
                 try:
                     batch = DataSetIter(dataset, batch_size=batch_size, sampler=SequentialSampler())
                     for batch_x, batch_y in batch:
-                        words = batch_x['words'].to(device)
+                        words = batch_x['words']
                         words_list = words.tolist()
-                        seq_len = words.ne(pad_index).sum(dim=-1)
+                        seq_len = words.ne(pad_index).sum(dim=-1).tolist()
+                        keys = [sent_embeds.key(word_ids[:length]) for word_ids, length in zip(words_list, seq_len)]
+                        if all(key in sent_embeds for key in keys):  # 已经缓存在cache_dir中
+                            continue
                         max_len = words.size(1)
-                        # 因为有些情况可能包含CLS, SEP, 从后面往前计算比较安全。
-                        seq_len_from_behind = (max_len - seq_len).tolist()
-                        word_embeds = self(words).detach().cpu().numpy()
-                        for b in range(words.size(0)):
-                            length = seq_len_from_behind[b]
-                            if length==0:
-                                sent_embeds[tuple(words_list[b][:seq_len[b]])] = word_embeds[b]
-                            else:
-                                sent_embeds[tuple(words_list[b][:seq_len[b]])] = word_embeds[b, :-length]
+                        word_embeds = self(words.to(device)).detach().cpu().numpy()
+                        for b, key in enumerate(keys):
+                            # 因为有些情况可能包含CLS, SEP, 从后面往前计算比较安全。
+                            sent_embeds.add(key, word_embeds[b, :word_embeds.shape[1] - (max_len - seq_len[b])])
                 except Exception as e:
                     print(f"Exception happens at {index} dataset.")
                     raise e
+        sent_embeds.flush()
         print("Finish calculating sentence representations.")
         self.sent_embeds = sent_embeds
         if delete_weights:
@@ -469,18 +627,9 @@ class ContextualEmbedding(TokenEmbedding):
         :return:
         """
         if hasattr(self, 'sent_embeds'):
-            words_list = words.tolist()
-            seq_len = words.ne(self._word_pad_index).sum(dim=-1)
-            _embeds = []
-            for b in range(len(words)):
-                words_i = tuple(words_list[b][:seq_len[b]])
-                embed = self.sent_embeds[words_i]
-                _embeds.append(embed)
-            max_sent_len = max(map(len, _embeds))
-            embeds = words.new_zeros(len(_embeds), max_sent_len, self.embed_size, dtype=torch.float,
-                                     device=words.device)
-            for i, embed in enumerate(_embeds):
-                embeds[i, :len(embed)] = torch.FloatTensor(embed).to(words.device)
+            embeds = self.sent_embeds.lookup(words, self._word_pad_index)
+            if embeds is None and not hasattr(self, 'model'):
+                raise KeyError("Some sentences are not in the sentence cache, and the model weights have been deleted.")
             return embeds
         return None
 
@@ -685,11 +834,11 @@ class BertEmbedding(ContextualEmbedding):
         words = self.drop_word(words)
         outputs = self._get_sent_reprs(words)
         if outputs is not None:
-            return self.dropout(words)
+            return self.dropout(outputs)
         outputs = self.model(words)
         outputs = torch.cat([*outputs], dim=-1)
 
-        return self.dropout(words)
+        return self.dropout(outputs)
 
     @property
     def requires_grad(self):
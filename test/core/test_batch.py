@@ -108,6 +108,90 @@ class TestCase1(unittest.TestCase):
             self.assertTrue(isinstance(y["y"], torch.Tensor))
             self.assertEqual(tuple(y["y"].shape), (4, 4))
     
+    def test_columnar(self):
+        ds = DataSet({"x": [[1], [1, 2], [1, 2, 3], [1, 2, 3, 4]] * 10,
+                      "y": [1, 2, 3, 4] * 10})
+        ds.set_input("x")
+        ds.set_target("y")
+        ds.set_columnar("x", "y")
+        iter = DataSetIter(ds, batch_size=4, sampler=SequentialSampler(), as_numpy=False)
+        for x, y in iter:
+            self.assertTrue(isinstance(x["x"], torch.Tensor))
+            self.assertListEqual(x["x"].tolist(), [[1, 0, 0, 0], [1, 2, 0, 0], [1, 2, 3, 0], [1, 2, 3, 4]])
+            self.assertListEqual(y["y"].tolist(), [1, 2, 3, 4])
+    
+    def test_batch_sampler(self):
+        from fastNLP import ConstTokenNumSampler
+        ds = DataSet({"x": [[1], [1, 2], [1, 2, 3], [1, 2, 3, 4]] * 10,
+                      "seq_len": [1, 2, 3, 4] * 10})
+        ds.set_input("x", "seq_len")
+        iter = DataSetIter(ds, batch_sampler=ConstTokenNumSampler("seq_len", max_token=8))
+        num_samples, num_batches = 0, 0
+        for x, y in iter:
+            self.assertLessEqual(x["x"].numel(), 8)
+            num_samples += x["x"].size(0)
+            num_batches += 1
+        self.assertEqual(num_samples, len(ds))
+        self.assertEqual(len(iter), num_batches)
+    
+    def test_online_data_iter(self):
+        from fastNLP import OnlineDataIter, Vocabulary
+        vocab = Vocabulary()
+        vocab.add_word_lst(["a", "b", "c", "d"])
+        
+        def gen():
+            for i in range(50):
+                yield {"words": ["a", "b", "c", "d"][:i % 4 + 1], "y": i}
+        
+        def add_seq_len(ins):
+            ins.add_field("seq_len", len(ins["words"]))
+            return ins if ins["y"] % 5 != 0 else None  # 丢弃一部分数据
+        
+        iter = OnlineDataIter(gen, batch_size=4, buffer_size=8, vocabs={"words": vocab}, transform=add_seq_len,
+                              input_fields=["words", "seq_len"], target_fields=["y"])
+        self.assertIsNone(iter.num_batches)
+        for _ in range(2):
+            ys = []
+            for x, y in iter:
+                self.assertEqual(x["words"].size(1), x["seq_len"].max().item())
+                mask = torch.arange(x["words"].size(1))[None] < x["seq_len"][:, None]
+                self.assertTrue(x["words"][mask].min().item() >= 2)  # 都被转为了index, 且没有unk
+                self.assertListEqual(y["y"].tolist(), iter.get_batch_indices())
+                ys.extend(y["y"].tolist())
+            self.assertListEqual(sorted(ys), [i for i in range(50) if i % 5 != 0])
+    
+    def test_prefetch_iter(self):
+        from fastNLP import PrefetchIter
+        ds = DataSet({"x": [[1, 2, 3, 4]] * 40, "y": [[5, 6]] * 40})
+        ds.set_input("x")
+        ds.set_target("y")
+        iter = PrefetchIter(DataSetIter(ds, batch_size=4, sampler=SequentialSampler()), num_prefetch=2)
+        self.assertEqual(iter.num_batches, 10)
+        for _ in range(2):
+            indices = []
+            for x, y in iter:
+                self.assertEqual(x["x"].size(), (4, 4))
+                indices.extend(iter.get_batch_indices())
+            self.assertListEqual(indices, list(range(40)))
+        # 提前退出之后可以重新迭代
+        for idx, _ in enumerate(iter):
+            if idx == 1:
+                break
+        self.assertEqual(len(list(iter)), 10)
+    
+    def test_prefetch_iter_exception(self):
+        from fastNLP import PrefetchIter, Padder
+        ds = DataSet({"x": [[1, 2, 3, 4]] * 40, "y": [[5, 6]] * 40})
+        ds.set_input("x")
+        
+        class BadPadder(Padder):
+            def __call__(self, contents, field_name, field_ele_dtype, dim):
+                raise RuntimeError("bad padder")
+        
+        ds.set_padder("x", BadPadder())
+        with self.assertRaises(RuntimeError):
+            list(PrefetchIter(DataSetIter(ds, batch_size=4), num_prefetch=2))
+    
     def test_numpy_to_tensor(self):
         ds = DataSet({"x": np.array([[1], [1, 2], [1, 2, 3], [1, 2, 3, 4]] * 10),
                       "y": np.array([[4, 3, 2, 1], [3, 2, 1], [2, 1], [1]] * 10)})
@@ -86,6 +86,56 @@ class TestCallback(unittest.TestCase):
                           callbacks=[TensorboardCallback("loss", "metric")], check_code_level=2)
         trainer.train()
     
+    def test_SaveModelCallback(self):
+        import os
+        import shutil
+        from fastNLP.core.callback import SaveModelCallback
+        data_set, model = prepare_env()
+        save_dir = 'test/save_model_test'
+        os.makedirs(save_dir, exist_ok=True)
+        try:
+            trainer = Trainer(data_set, model, optimizer=SGD(lr=0.1), loss=BCELoss(pred="predict", target="y"),
+                              batch_size=32, n_epochs=5, print_every=50, dev_data=data_set, validate_every=10,
+                              metrics=AccuracyMetric(pred="predict", target="y"), use_tqdm=False,
+                              callbacks=[SaveModelCallback(save_dir, top=2)], check_code_level=2)
+            trainer.train()
+            model_dir = os.path.join(save_dir, trainer.start_time)
+            names = os.listdir(model_dir)
+            self.assertTrue(0 < len(names) <= 2)
+            for name in names:
+                self.assertIsInstance(torch.load(os.path.join(model_dir, name), weights_only=False), NaiveClassifier)
+        finally:
+            shutil.rmtree(save_dir, ignore_errors=True)
+    
+    def test_ProfilerCallback(self):
+        import os
+        import json
+        import shutil
+        from fastNLP.core.callback import ProfilerCallback
+        data_set, model = prepare_env()
+        data_set.apply(lambda ins: len(ins['x']), new_field_name='seq_len', is_input=True)
+        save_dir = 'test/profiler_test'
+        os.makedirs(save_dir, exist_ok=True)
+        try:
+            callback = ProfilerCallback(log_path=os.path.join(save_dir, 'log.jsonl'),
+                                        trace_path=os.path.join(save_dir, 'trace.json'))
+            trainer = Trainer(data_set, model, optimizer=SGD(lr=0.1), loss=BCELoss(pred="predict", target="y"),
+                              batch_size=32, n_epochs=2, print_every=50, dev_data=data_set,
+                              metrics=AccuracyMetric(pred="predict", target="y"), use_tqdm=False,
+                              callbacks=[callback], check_code_level=-1)
+            trainer.train()
+            self.assertEqual(len(callback.records), trainer.n_steps)
+            self.assertEqual(callback.records[0]['batch_size'], 32)
+            self.assertEqual(callback.records[0]['tokens'], 64)
+            self.assertAlmostEqual(callback.summary['padding_efficiency'], 1)
+            self.assertGreater(callback.summary['valid_time'], 0)
+            with open(os.path.join(save_dir, 'log.jsonl')) as f:
+                self.assertEqual(len(f.readlines()), trainer.n_steps)
+            with open(os.path.join(save_dir, 'trace.json')) as f:
+                self.assertGreater(len(json.load(f)['traceEvents']), 0)
+        finally:
+            shutil.rmtree(save_dir, ignore_errors=True)
+    
     def test_readonly_property(self):
         from fastNLP.core.callback import Callback
         passed_epochs = []
@@ -1,6 +1,8 @@
 import os
 import unittest
 
+import numpy as np
+
 from fastNLP import DataSet
 from fastNLP import FieldArray
 from fastNLP import Instance
@@ -124,6 +126,18 @@ class TestDataSetMethods(unittest.TestCase):
         ds.apply(lambda ins: (len(ins["x"]), "hahaha"), new_field_name="k", ignore_type=True)
         # expect no exception raised
 
+    def test_apply_num_proc(self):
+        ds = DataSet({"x": [[1, 2, 3, 4][:i % 4 + 1] for i in range(43)], "y": list(range(43))})
+        res = ds.apply(lambda ins: ins["x"][::-1], new_field_name="rx", num_proc=3, is_input=True)
+        self.assertListEqual(res, [x[::-1] for x in ds.get_field("x").content])
+        self.assertTrue(ds.get_field("rx").is_input)
+        
+        res = ds.apply_field(lambda y: y * 2, field_name="y", new_field_name="y2", num_proc=2, chunk_size=5)
+        self.assertListEqual(res, [i * 2 for i in range(43)])
+        
+        with self.assertRaises(ZeroDivisionError):
+            ds.apply_field(lambda y: 1 / (y - 20), field_name="y", num_proc=2)
+    
     def test_drop(self):
         ds = DataSet({"x": [[1, 2, 3, 4]] * 40, "y": [[5, 6], [7, 8, 9, 0]] * 20})
         ds.drop(lambda ins: len(ins["y"]) < 3, inplace=True)
@@ -191,6 +205,44 @@ class TestDataSetMethods(unittest.TestCase):
         ds_1 = DataSet.load("./my_ds.pkl")
         os.remove("my_ds.pkl")
 
+    def test_save_load_binary(self):
+        import shutil
+        from fastNLP import EngChar2DPadder
+        ds = DataSet({"x": [[1, 2, 3, 4], [5, 6]] * 5, "y": [1, 0] * 5, "raw": ["a b c d", "e f"] * 5,
+                      "chars": [[[1, 2], [3]], [[4, 5, 6]]] * 5,
+                      "w": [np.array([0.5, 1.5], dtype=np.float32), np.array([2.5], dtype=np.float32)] * 5})
+        ds.set_input("x", "chars", "w")
+        ds.set_target("y")
+        ds.set_padder("chars", EngChar2DPadder(pad_val=-1))
+        try:
+            ds.save("./my_ds_bin", binary=True)
+            self.assertTrue(os.path.exists("./my_ds_bin/dataset.json"))
+            for mmap in (False, True):
+                ds_1 = DataSet.load("./my_ds_bin", mmap=mmap)
+                self.assertEqual(len(ds_1), len(ds))
+                self.assertEqual(ds_1.get_input_name(), ds.get_input_name())
+                self.assertEqual(ds_1.get_target_name(), ds.get_target_name())
+                self.assertEqual(ds_1.x.columnar, mmap)
+                self.assertFalse(ds_1.raw.columnar)
+                self.assertEqual(ds_1.raw.content, ds.raw.content)
+                for name in ("x", "y", "chars", "w"):
+                    self.assertEqual(ds_1[name].get([0, 1, 3]).tolist(), ds[name].get([0, 1, 3]).tolist())
+                # dtype在两种模式下都被保留
+                self.assertIs(ds_1.w.dtype, np.float32)
+                self.assertEqual(ds_1.w.get([0, 1]).dtype, np.float32)
+
+            # 以mmap方式读取的dataset可以保存回原来的文件夹
+            ds_1 = DataSet.load("./my_ds_bin", mmap=True)
+            ds_1.save("./my_ds_bin", binary=True)
+            self.assertFalse([name for name in os.listdir(".") if name.startswith("my_ds_bin.")])  # 没有残留临时文件夹
+            ds_2 = DataSet.load("./my_ds_bin", mmap=True)
+            for name in ("x", "y", "chars", "w"):
+                self.assertEqual(ds_2[name].get(list(range(len(ds)))).tolist(),
+                                 ds[name].get(list(range(len(ds)))).tolist())
+                self.assertEqual(ds_1[name].get([0, 1]).tolist(), ds[name].get([0, 1]).tolist())
+        finally:
+            shutil.rmtree("./my_ds_bin")
+
     def test_get_all_fields(self):
         ds = DataSet({"x": [[1, 2, 3, 4]] * 10, "y": [[5, 6]] * 10})
         ans = ds.get_all_fields()
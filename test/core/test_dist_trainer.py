@@ -0,0 +1,75 @@
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
+from fastNLP import DataSet
+from fastNLP import Instance
+from fastNLP import BCELoss
+from fastNLP import AccuracyMetric
+from fastNLP import SGD
+from fastNLP import DistTrainer
+from fastNLP import Tester
+from fastNLP.models.base_model import NaiveClassifier
+
+WORLD_SIZE = 2
+
+
+def prepare_fake_dataset(size=1000):
+    np.random.seed(0)
+    class_A = np.random.multivariate_normal(np.array([-3, -3]), np.eye(2), size=(size,))
+    class_B = np.random.multivariate_normal(np.array([3, 3]), np.eye(2), size=(size,))
+    data_set = DataSet([Instance(x=[float(item[0]), float(item[1])], y=[0.0]) for item in class_A] +
+                       [Instance(x=[float(item[0]), float(item[1])], y=[1.0]) for item in class_B])
+    data_set.set_input("x")
+    data_set.set_target("y")
+    return data_set
+
+
+def _run_dist_trainer(rank, init_file, save_path, output_dir):
+    dist.init_process_group('gloo', init_method='file://' + init_file, rank=rank, world_size=WORLD_SIZE)
+    torch.manual_seed(rank)  # 不同的初始化，DistributedDataParallel会以rank 0的参数为准
+    train_set, dev_set = prepare_fake_dataset().split(0.3)
+    model = NaiveClassifier(2, 1)
+    trainer = DistTrainer(train_set, model, optimizer=SGD(lr=0.1), loss=BCELoss(pred="predict", target="y"),
+                          batch_size_per_rank=32, n_epochs=2, print_every=10, update_every=2,
+                          dev_data=dev_set, metrics=AccuracyMetric(pred="predict", target="y"),
+                          save_path=save_path, use_tqdm=False)
+    results = trainer.train(load_best_model=False)
+    tester = Tester(dev_set, model, metrics=AccuracyMetric(pred="predict", target="y"), verbose=0, use_dist=True)
+    with open(os.path.join(output_dir, str(rank)), 'wb') as f:
+        pickle.dump({'n_steps': trainer.n_steps, 'step': trainer.step, 'best_eval': results.get('best_eval'),
+                     'eval': tester.test(), 'params': [p.detach().clone() for p in model.parameters()]}, f)
+    dist.destroy_process_group()
+
+
+class TestDistTrainer(unittest.TestCase):
+    def test_gloo(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            save_path = os.path.join(tmp_dir, 'save')
+            mp.spawn(_run_dist_trainer, args=(os.path.join(tmp_dir, 'init'), save_path, tmp_dir),
+                     nprocs=WORLD_SIZE)
+            outputs = []
+            for rank in range(WORLD_SIZE):
+                with open(os.path.join(tmp_dir, str(rank)), 'rb') as f:
+                    outputs.append(pickle.load(f))
+            # 每个进程只训练一半的数据
+            self.assertEqual(outputs[0]['n_steps'], 2 * ((1400 // WORLD_SIZE + 31) // 32))
+            for output in outputs:
+                self.assertEqual(output['step'], output['n_steps'])
+                self.assertEqual(output['best_eval'], outputs[0]['best_eval'])
+                self.assertEqual(output['eval'], outputs[0]['eval'])
+                for p1, p2 in zip(output['params'], outputs[0]['params']):
+                    self.assertTrue(torch.equal(p1, p2))
+            self.assertGreater(outputs[0]['eval']['AccuracyMetric']['acc'], 0.9)
+            # 只有rank 0保存模型
+            self.assertEqual(len(os.listdir(save_path)), 1)
+        finally:
+            shutil.rmtree(tmp_dir)
@@ -198,6 +198,55 @@ class TestFieldArray(unittest.TestCase):
         fa = FieldArray("y", [(1, "1"), (2, "2"), (3, "3"), (4, "4")], is_target=True, ignore_type=True)
 
 
+class TestColumnarFieldArray(unittest.TestCase):
+    def test_columnar_0d_1d_2d(self):
+        # 0维
+        fa = FieldArray("x", [1, 2, 3, 4], is_input=True)
+        fa.columnar = True
+        self.assertTrue(fa.columnar)
+        self.assertEqual(fa.dtype, int)
+        self.assertListEqual(fa.get([3, 0]).tolist(), [4, 1])
+
+        # 1维，长度不一
+        content = [[1, 2, 3], [4], [5, 6]]
+        fa = FieldArray("x", content, is_input=True)
+        fa.columnar = True
+        self.assertEqual(len(fa), 3)
+        self.assertListEqual(fa[0].tolist(), [1, 2, 3])
+        self.assertListEqual(fa[-1].tolist(), [5, 6])
+        self.assertListEqual(fa.get([2, 1]).tolist(), [[5, 6], [4, 0]])
+        self.assertListEqual(fa.get([0, 1, 2]).tolist(), FieldArray("y", content, is_input=True).get([0, 1, 2]).tolist())
+
+        # 2维(character)
+        content = [[[1, 2, 3], [4, 5], [7, 8, 9, 10]], [[1]]]
+        fa = FieldArray("x", content, is_input=True)
+        fa.columnar = True
+        padded_content = [[[1, 0, 0, 0], [0, 0, 0, 0], [0, 0, 0, 0]], [[1, 2, 3, 0], [4, 5, 0, 0], [7, 8, 9, 10]]]
+        self.assertListEqual(fa.get([1, 0]).tolist(), padded_content)
+
+        fa.columnar = False
+        self.assertListEqual(fa.content, content)
+
+    def test_columnar_read_only(self):
+        fa = FieldArray("x", [[1, 2], [3]], is_input=True)
+        fa.columnar = True
+        with self.assertRaises(RuntimeError):
+            fa.append([4])
+        with self.assertRaises(RuntimeError):
+            fa[0] = [4]
+
+        fa = FieldArray("x", ['a', 'b'], is_input=True)
+        with self.assertRaises(TypeError):
+            fa.columnar = True
+
+    def test_columnar_other_padder(self):
+        from fastNLP import EngChar2DPadder
+        content = [[[1, 2, 3], [4, 5], [7, 8, 9, 10]], [[1]]]
+        fa = FieldArray("x", content, is_input=True, padder=EngChar2DPadder())
+        expected = fa.get([0, 1]).tolist()
+        fa.columnar = True
+        self.assertListEqual(fa.get([0, 1]).tolist(), expected)
+
 class TestAutoPadder(unittest.TestCase):
     def test00(self):
         padder = AutoPadder()
@@ -276,6 +325,43 @@ class TestAutoPadder(unittest.TestCase):
 
 
 
+def _loop_pad(contents, pad_val, dtype, dim):
+    # 逐行赋值的padding方式，用于和AutoPadder进行对比
+    max_len = max(map(len, contents))
+    if dim == 1:
+        shape = (len(contents), max_len)
+    else:
+        shape = (len(contents), max_len, max([max([len(word) for word in sent]) for sent in contents]))
+    if isinstance(dtype, torch.dtype):
+        array = torch.full(shape, fill_value=pad_val, dtype=dtype)
+        to_row = torch.tensor
+    else:
+        array = np.full(shape, pad_val, dtype=dtype)
+        to_row = lambda row: row
+    for i, content_i in enumerate(contents):
+        if dim == 1:
+            array[i, :len(content_i)] = to_row(content_i)
+        else:
+            for j, content_ii in enumerate(content_i):
+                array[i, j, :len(content_ii)] = to_row(content_ii)
+    return array
+
+
+class TestAutoPadderEqualLoopPad(unittest.TestCase):
+    def test_equal_loop_pad(self):
+        rng = np.random.RandomState(0)
+        words = [rng.randint(1, 100, size=rng.randint(1, 10)).tolist() for _ in range(8)]
+        chars = [[rng.randint(1, 27, size=rng.randint(1, 5)).tolist() for _ in word] for word in words]
+        padder = AutoPadder(pad_val=-1)
+        for contents, dtype, dim in [(words, int, 1),
+                                     ([np.array(word) for word in words], np.int64, 1),
+                                     ([torch.tensor(word) for word in words], torch.int64, 1),
+                                     (chars, int, 2),
+                                     ([[torch.tensor(c) for c in word] for word in chars], torch.int64, 2)]:
+            padded = padder(contents, None, dtype, dim)
+            self.assertListEqual(padded.tolist(), _loop_pad(contents, -1, dtype, dim).tolist())
+
+
 class TestEngChar2DPadder(unittest.TestCase):
     def test01(self):
         """
@@ -4,7 +4,7 @@ import numpy as np
 import torch
 
 from fastNLP import AccuracyMetric
-from fastNLP.core.metrics import _pred_topk, _accuracy_topk
+from fastNLP.core.metrics import _pred_topk, _accuracy_topk, _merge_state, _state_to_cpu
 from fastNLP.core.vocabulary import Vocabulary
 from collections import Counter
 from fastNLP.core.metrics import SpanFPreRecMetric
@@ -183,6 +183,20 @@ class TestAccuracyMetric(unittest.TestCase):
         metric(pred_dict=pred, target_dict=target)
         self.assertDictEqual(metric.get_metric(), {'acc': 1.})
 
+    def test_accumulate_on_device(self):
+        # 统计量以tensor的形式累计，get_metric()之后重置为0
+        metric = AccuracyMetric()
+        pred = torch.tensor([[0, 1], [1, 1]])
+        target = torch.tensor([[0, 1], [1, 0]])
+        for _ in range(2):
+            metric(pred_dict={'pred': pred}, target_dict={'target': target, 'seq_len': torch.tensor([2, 1])})
+        self.assertIsInstance(metric.acc_count, torch.Tensor)
+        self.assertIsInstance(metric.total, torch.Tensor)
+        self.assertDictEqual(metric.get_metric(), {'acc': 1.})
+        self.assertEqual(metric.acc_count, 0)
+        metric(pred_dict={'pred': pred}, target_dict={'target': target})
+        self.assertDictEqual(metric.get_metric(), {'acc': 0.75})
+
 
 class SpanF1PreRecMetric(unittest.TestCase):
     def test_case1(self):
@@ -214,6 +228,52 @@ class SpanF1PreRecMetric(unittest.TestCase):
         self.assertSetEqual(expect_bmes_res, set(_bmes_tag_to_spans(bmes_lst)))
         self.assertSetEqual(expect_bio_res, set(_bio_tag_to_spans(bio_lst)))
 
+    def test_vectorized_span_extraction(self):
+        # 与逐个句子使用字符串tag解码的结果进行对比
+        from fastNLP.core.metrics import _bio_tag_to_spans, _bmes_tag_to_spans, _bmeso_tag_to_spans, \
+            _bioes_tag_to_spans
+        tag_to_span_funcs = {'bio': _bio_tag_to_spans, 'bmes': _bmes_tag_to_spans, 'bmeso': _bmeso_tag_to_spans,
+                             'bioes': _bioes_tag_to_spans}
+        for encoding_type, tag_to_span_func in tag_to_span_funcs.items():
+            vocab = Vocabulary()
+            vocab.add_word_lst(list(_generate_tags(encoding_type.upper(), 3)) + ['O', 'B'])
+            metric = SpanFPreRecMetric(tag_vocab=vocab, encoding_type=encoding_type, only_gross=False,
+                                       ignore_labels=['2'])
+            tp, fp, fn = Counter(), Counter(), Counter()
+            for _ in range(3):
+                pred = torch.randint(len(vocab), size=(8, 12))
+                target = torch.randint(len(vocab), size=(8, 12))
+                seq_len = torch.randint(1, 13, size=(8,))
+                metric({'pred': pred, 'seq_len': seq_len}, {'target': target})
+                for i in range(8):
+                    pred_spans = tag_to_span_func([vocab.to_word(tag) for tag in pred[i, :seq_len[i]].tolist()],
+                                                  ignore_labels=['2'])
+                    gold_spans = tag_to_span_func([vocab.to_word(tag) for tag in target[i, :seq_len[i]].tolist()],
+                                                  ignore_labels=['2'])
+                    for span in pred_spans:
+                        if span in gold_spans:
+                            tp[span[0]] += 1
+                        else:
+                            fp[span[0]] += 1
+                    for span in gold_spans:
+                        if span not in pred_spans:
+                            fn[span[0]] += 1
+            true_positives, false_negatives, false_positives = metric._get_span_counts()
+            self.assertDictEqual({k: v for k, v in true_positives.items() if v}, dict(tp))
+            self.assertDictEqual({k: v for k, v in false_positives.items() if v}, dict(fp))
+            self.assertDictEqual({k: v for k, v in false_negatives.items() if v}, dict(fn))
+            self.assertNotIn('2', true_positives)
+            metric.get_metric()
+
+    def test_match_keys(self):
+        pred_keys = torch.tensor([7, 3, 10, 1, 5])
+        gold_keys = torch.tensor([5, 2, 7, 8])
+        self.assertListEqual(SpanFPreRecMetric._match_keys(pred_keys, gold_keys).tolist(),
+                             [True, False, False, False, True])
+        empty = torch.zeros(0, dtype=torch.long)
+        self.assertListEqual(SpanFPreRecMetric._match_keys(empty, gold_keys).tolist(), [])
+        self.assertListEqual(SpanFPreRecMetric._match_keys(pred_keys, empty).tolist(), [False] * 5)
+
     def test_case3(self):
         number_labels = 4
         # bio tag
@@ -339,6 +399,37 @@ class SpanF1PreRecMetric(unittest.TestCase):
             self.assertAlmostEqual(value, metric_value[key], places=5)
 
 
+class TestExtractiveQAMetric(unittest.TestCase):
+    def test_evaluate(self):
+        from fastNLP import ExtractiveQAMetric
+        metric = ExtractiveQAMetric(print_predict_stat=True)
+        # 依次为: 正确的无答案, 错误地给出答案, 部分重叠(预测的start与end顺序颠倒), 完全正确, 错误地预测为无答案
+        pred1 = torch.tensor([0, 2, 8, 3, 0])
+        pred2 = torch.tensor([1, 4, 4, 5, 1])
+        target1 = torch.tensor([0, 0, 2, 3, 1])
+        target2 = torch.tensor([1, 1, 6, 5, 3])
+        metric({'pred1': pred1, 'pred2': pred2}, {'target1': target1, 'target2': target2})
+        res = metric.get_metric()
+        self.assertEqual(res['noAns-EM'], 50)
+        self.assertAlmostEqual(res['hasAns-EM'], 33.333)
+        self.assertAlmostEqual(res['hasAns-f_1'], 50)
+        self.assertAlmostEqual(res['f_1'], 50)
+        self.assertAlmostEqual(res['EM'], 41.667, places=2)
+        self.assertEqual((res['no2no'], res['no2yes'], res['yes2no'], res['yes2yes']), (1, 1, 1, 2))
+        self.assertEqual(metric.get_metric(), {})
+
+        # 左闭右闭区间，pred为每个位置的分数
+        metric = ExtractiveQAMetric(right_open=False)
+        scores = torch.zeros(2, 10)
+        pred1 = scores.index_fill(1, torch.tensor([2]), 1)
+        pred2 = scores.index_fill(1, torch.tensor([4]), 1)
+        pred1[1], pred2[1] = 0, 0  # 第二个样本预测为无答案
+        metric({'pred1': pred1, 'pred2': pred2}, {'target1': torch.tensor([2, 0]), 'target2': torch.tensor([5, 0])})
+        res = metric.get_metric()
+        self.assertAlmostEqual(res['hasAns-f_1'], 100 * 2 * 0.75 / 1.75, places=3)
+        self.assertEqual(res['noAns-EM'], 100)
+
+
 class TestUsefulFunctions(unittest.TestCase):
     # 测试metrics.py中一些看上去挺有用的函数
     def test_case_1(self):
@@ -347,3 +438,13 @@ class TestUsefulFunctions(unittest.TestCase):
         _ = _pred_topk(np.random.randint(0, 3, size=(10, 1)))
         
         # 跑通即可
+    
+    def test_merge_state(self):
+        from collections import defaultdict
+        self.assertEqual(_merge_state([1, 2, 3]), 6)
+        self.assertListEqual(_merge_state([[1], [2, 3]]), [1, 2, 3])
+        self.assertTrue(torch.equal(_merge_state([torch.ones(2), torch.ones(2)]), torch.full((2,), 2.)))
+        self.assertEqual(_merge_state([_state_to_cpu(torch.tensor(3)), 0]), 3)
+        merged = _merge_state([defaultdict(int, a=1), defaultdict(int, a=2, b=1)])
+        self.assertIsInstance(merged, defaultdict)
+        self.assertDictEqual(dict(merged), {'a': 3, 'b': 1})
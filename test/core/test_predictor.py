@@ -45,4 +45,39 @@ class TestPredictor(unittest.TestCase):
 
     def test_sequence(self):
         # test sequence input/output
-        pass
+        seq_lens = np.random.randint(1, 10, size=50).tolist()
+        data = DataSet({"x": [np.random.randn(seq_len, 2).tolist() for seq_len in seq_lens], "seq_len": seq_lens})
+        data.set_input("x", "seq_len")
+        model = LinearModel()
+        predictor = Predictor(model, batch_size=4, sort_batches=3)
+        ans = predictor.predict(data, seq_len_field_name="seq_len")
+        self.assertEqual(len(ans["predict"]), 50)
+        for idx, seq_len in enumerate(seq_lens):
+            expected = model(torch.tensor([data[idx]["x"]]))["predict"][0].detach().numpy()
+            self.assertEqual(ans["predict"][idx].shape, (seq_len, 1))
+            self.assertTrue(np.allclose(ans["predict"][idx], expected, atol=1e-6))
+
+    def test_sequence_without_seq_len(self):
+        # 默认逐个样本预测, 没有seq_len时序列输出也不会包含pad
+        data = DataSet({"x": [np.random.randn(seq_len, 2).tolist() for seq_len in (2, 5, 3)]})
+        data.set_input("x")
+        ans = Predictor(LinearModel()).predict(data)
+        self.assertEqual([value.shape for value in ans["predict"]], [(2, 1), (5, 1), (3, 1)])
+
+    def test_predict_to_file(self):
+        import json
+        import os
+        model = LinearModel()
+        data = prepare_fake_dataset()
+        data.set_input("x")
+        path = "test/predictor_test.jsonl"
+        try:
+            count = Predictor(model, batch_size=64).predict_to_file(data, path)
+            self.assertEqual(count, len(data))
+            ans = Predictor(model, batch_size=7).predict(data)
+            with open(path, encoding="utf-8") as f:
+                for line, expected in zip(f, ans["predict"]):
+                    self.assertTrue(np.allclose(json.loads(line)["predict"], expected, atol=1e-6))
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
@@ -4,7 +4,8 @@ import unittest
 import torch
 
 from fastNLP import DataSet
-from fastNLP import SequentialSampler, RandomSampler, BucketSampler
+from fastNLP import SequentialSampler, RandomSampler, BucketSampler, ConstTokenNumSampler, SortedSampler
+from fastNLP import DistributedSampler, DistributedBatchSampler
 from fastNLP.core.sampler import k_means_1d, k_means_bucketing, simple_sort_bucketing
 
 
@@ -44,3 +45,52 @@ class TestSampler(unittest.TestCase):
         indices = sampler(data_set)
         self.assertEqual(len(indices), 10)
         # 跑通即可，不验证效果
+
+    def test_ConstTokenNumSampler(self):
+        seq_lens = [random.randint(1, 20) for _ in range(100)]
+        data_set = DataSet({"x": [[0] * seq_len for seq_len in seq_lens], "seq_len": seq_lens})
+        for shuffle in (True, False):
+            sampler = ConstTokenNumSampler("seq_len", max_token=40, shuffle=shuffle)
+            batches = sampler(data_set)
+            self.assertEqual(len(batches), sampler.get_num_batches(data_set))
+            self.assertListEqual(sorted(sum(batches, [])), list(range(100)))
+            for batch in batches:
+                self.assertLessEqual(max(seq_lens[idx] for idx in batch) * len(batch), 40)
+
+        sampler = ConstTokenNumSampler("seq_len", max_token=40, max_sentence=3)
+        self.assertTrue(all(len(batch) <= 3 for batch in sampler(data_set)))
+
+    def test_SortedSampler(self):
+        seq_lens = [random.randint(1, 20) for _ in range(100)]
+        data_set = DataSet({"x": [[0] * seq_len for seq_len in seq_lens], "seq_len": seq_lens})
+        indices = SortedSampler("seq_len")(data_set)
+        self.assertListEqual([seq_lens[idx] for idx in indices], sorted(seq_lens, reverse=True))
+        indices = SortedSampler("seq_len", chunk_size=30)(data_set)
+        for start in range(0, 100, 30):
+            chunk = indices[start:start + 30]
+            self.assertListEqual(sorted(chunk), list(range(start, min(start + 30, 100))))
+            self.assertListEqual([seq_lens[idx] for idx in chunk], sorted(seq_lens[start:start + 30], reverse=True))
+
+    def test_DistributedSampler(self):
+        data_set = DataSet({"x": [[0]] * 11})
+        for pad in (True, False):
+            samplers = [DistributedSampler(RandomSampler(), num_replicas=3, rank=rank, pad=pad) for rank in range(3)]
+            for _ in range(2):
+                shards = [sampler(data_set) for sampler in samplers]
+                for sampler, shard in zip(samplers, shards):
+                    self.assertEqual(len(shard), sampler.get_num_samples(len(data_set)))
+                if pad:
+                    self.assertTrue(all(len(shard) == 4 for shard in shards))
+                    self.assertSetEqual(set(sum(shards, [])), set(range(11)))
+                else:
+                    self.assertListEqual(sorted(sum(shards, [])), list(range(11)))
+
+    def test_DistributedBatchSampler(self):
+        seq_lens = [random.randint(1, 20) for _ in range(100)]
+        data_set = DataSet({"x": [[0] * seq_len for seq_len in seq_lens], "seq_len": seq_lens})
+        batch_sampler = ConstTokenNumSampler("seq_len", max_token=40)
+        samplers = [DistributedBatchSampler(batch_sampler, num_replicas=2, rank=rank) for rank in range(2)]
+        shards = [sampler(data_set) for sampler in samplers]
+        self.assertEqual(len(shards[0]), len(shards[1]))
+        self.assertEqual(len(shards[0]), samplers[0].get_num_batches(data_set))
+        self.assertListEqual(sorted(set(sum(sum(shards, []), []))), list(range(100)))
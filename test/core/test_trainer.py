@@ -1,3 +1,5 @@
+import os
+import shutil
 import time
 import unittest
 
@@ -36,6 +38,14 @@ def prepare_fake_dataset2(*args, size=100):
     return DataSet(data=data)
 
 
+class NonLeafAttrClassifier(NaiveClassifier):
+    # 使用weight_norm并且含有非叶子节点tensor属性, 无法deepcopy
+    def __init__(self, in_feature_dim, out_feature_dim):
+        super(NonLeafAttrClassifier, self).__init__(in_feature_dim, out_feature_dim)
+        nn.utils.weight_norm(self.mlp.hiddens[0])
+        self.cache = self.mlp.hiddens[0].weight_v * 2
+
+
 class TrainerTestGround(unittest.TestCase):
     def test_case(self):
         data_set = prepare_fake_dataset()
@@ -205,6 +215,246 @@ class TrainerTestGround(unittest.TestCase):
             trainer = Trainer(train_data=dataset, model=model, loss=CrossEntropyLoss(), print_every=2, dev_data=dataset,
                               metrics=AccuracyMetric(), use_tqdm=False)
     
+    def test_const_token_num_sampler(self):
+        from fastNLP import ConstTokenNumSampler
+        data_set = prepare_fake_dataset()
+        data_set.apply(lambda ins: len(ins['x']) + np.random.randint(3), new_field_name='seq_len')
+        data_set.set_input("x", flag=True)
+        data_set.set_target("y", flag=True)
+        
+        model = NaiveClassifier(2, 1)
+        
+        trainer = Trainer(data_set, model, optimizer=SGD(lr=0.1), loss=BCELoss(pred="predict", target="y"),
+                          sampler=ConstTokenNumSampler('seq_len', max_token=128), n_epochs=2, print_every=50,
+                          use_tqdm=False)
+        self.assertEqual(trainer.n_steps, 2 * ConstTokenNumSampler('seq_len', max_token=128).get_num_batches(data_set))
+        trainer.train()
+        self.assertEqual(trainer.step, trainer.n_steps)
+    
+    def test_online_data_iter(self):
+        from fastNLP import OnlineDataIter
+        data_set = prepare_fake_dataset()
+        data_set.set_input("x")
+        data_set.set_target("y")
+        data_iter = OnlineDataIter(lambda: iter(data_set), batch_size=32, buffer_size=256,
+                                   input_fields=["x"], target_fields=["y"])
+        
+        model = NaiveClassifier(2, 1)
+        
+        trainer = Trainer(data_iter, model, optimizer=SGD(lr=0.1), loss=BCELoss(pred="predict", target="y"),
+                          n_epochs=2, print_every=50, dev_data=data_set,
+                          metrics=AccuracyMetric(pred="predict", target="y"),
+                          use_tqdm=False)
+        self.assertIsNone(trainer.n_steps)
+        trainer.train()
+        self.assertEqual(trainer.step, 2 * ((len(data_set) + 31) // 32))
+    
+    def test_num_prefetch(self):
+        data_set = prepare_fake_dataset()
+        data_set.set_input("x", flag=True)
+        data_set.set_target("y", flag=True)
+        
+        train_set, dev_set = data_set.split(0.3)
+        
+        model = NaiveClassifier(2, 1)
+        
+        trainer = Trainer(train_set, model, optimizer=SGD(lr=0.1), loss=BCELoss(pred="predict", target="y"),
+                          batch_size=32, n_epochs=2, print_every=50, dev_data=dev_set,
+                          metrics=AccuracyMetric(pred="predict", target="y"), num_prefetch=2, use_tqdm=False)
+        trainer.train()
+        self.assertEqual(trainer.step, trainer.n_steps)
+    
+    def test_checkpoint_resume(self):
+        import os
+        import random
+        import shutil
+        import torch
+        from fastNLP import Callback, EarlyStopCallback, Adam
+        
+        class StopCallback(Callback):
+            def on_batch_end(self):
+                if self.step == 50:
+                    raise RuntimeError("interrupted")
+        
+        data_set = prepare_fake_dataset()
+        data_set.set_input("x", flag=True)
+        data_set.set_target("y", flag=True)
+        train_set, dev_set = data_set.split(0.3)
+        init_states = NaiveClassifier(2, 1).state_dict()
+        save_dir = 'test/checkpoint_test'
+        
+        def train(checkpoint_every, callbacks=(), resume_from=None):
+            random.seed(0)
+            np.random.seed(0)
+            torch.manual_seed(0)
+            model = NaiveClassifier(2, 1)
+            model.load_state_dict(init_states)
+            trainer = Trainer(train_set, model, optimizer=Adam(lr=0.01), loss=BCELoss(pred="predict", target="y"),
+                              batch_size=32, n_epochs=3, print_every=50, dev_data=dev_set, validate_every=20,
+                              metrics=AccuracyMetric(pred="predict", target="y"), use_tqdm=False,
+                              callbacks=[EarlyStopCallback(10)] + list(callbacks),
+                              checkpoint_path=os.path.join(save_dir, 'checkpoint'), checkpoint_every=checkpoint_every)
+            trainer.train(load_best_model=False, resume_from=resume_from)
+            return trainer, model
+        
+        try:
+            _, expected = train(checkpoint_every=-1)
+            for checkpoint_every in (-1, 25):
+                # 在第50个step中断，从最近的checkpoint(第一个epoch结束，或第50个step)恢复
+                with self.assertRaises(RuntimeError):
+                    train(checkpoint_every=checkpoint_every, callbacks=[StopCallback()])
+                trainer, model = train(checkpoint_every=checkpoint_every, callbacks=[Callback()],
+                                       resume_from=os.path.join(save_dir, 'checkpoint'))
+                self.assertEqual(trainer.step, trainer.n_steps)
+                for p1, p2 in zip(model.parameters(), expected.parameters()):
+                    self.assertTrue(torch.equal(p1, p2))
+        finally:
+            shutil.rmtree(save_dir, ignore_errors=True)
+    
+    def test_load_best_model(self):
+        import os
+        import shutil
+        import torch
+        from fastNLP import Callback
+        
+        class RecordBestCallback(Callback):
+            def __init__(self):
+                super().__init__()
+                self.best_states = None
+            
+            def on_valid_end(self, eval_result, metric_key, optimizer, is_better_eval):
+                if is_better_eval:
+                    self.best_states = {name: param.detach().clone() for name, param in self.model.state_dict().items()}
+        
+        data_set = prepare_fake_dataset()
+        data_set.set_input("x", flag=True)
+        data_set.set_target("y", flag=True)
+        train_set, dev_set = data_set.split(0.3)
+        save_dir = 'test/best_model_test'
+        try:
+            for save_path in (None, save_dir):
+                model = NaiveClassifier(2, 1)
+                callback = RecordBestCallback()
+                trainer = Trainer(train_set, model, optimizer=SGD(lr=0.1), loss=BCELoss(pred="predict", target="y"),
+                                  batch_size=32, n_epochs=3, print_every=50, dev_data=dev_set, validate_every=10,
+                                  metrics=AccuracyMetric(pred="predict", target="y"), use_tqdm=False,
+                                  save_path=save_path, callbacks=[callback])
+                trainer.train(load_best_model=True)
+                for name, param in model.state_dict().items():
+                    self.assertTrue(torch.equal(param, callback.best_states[name]))
+                if save_path is not None:
+                    self.assertEqual(len(os.listdir(save_dir)), 1)
+        finally:
+            shutil.rmtree(save_dir, ignore_errors=True)
+    
+    def test_async_validation(self):
+        from fastNLP import Callback
+        
+        class CountValidCallback(Callback):
+            def __init__(self):
+                super().__init__()
+                self.begin_steps = []
+                self.end_steps = []
+            
+            def on_valid_begin(self):
+                self.begin_steps.append(self.step)
+            
+            def on_valid_end(self, eval_result, metric_key, optimizer, is_better_eval):
+                self.end_steps.append(self.step)
+        
+        data_set = prepare_fake_dataset()
+        data_set.set_input("x", flag=True)
+        data_set.set_target("y", flag=True)
+        train_set, dev_set = data_set.split(0.3)
+        callback = CountValidCallback()
+        trainer = Trainer(train_set, NaiveClassifier(2, 1), optimizer=SGD(lr=0.1),
+                          loss=BCELoss(pred="predict", target="y"), batch_size=32, n_epochs=3, print_every=50,
+                          dev_data=dev_set, validate_every=10, metrics=AccuracyMetric(pred="predict", target="y"),
+                          use_tqdm=False, async_validation=True, callbacks=[callback])
+        results = trainer.train()
+        self.assertEqual(len(callback.begin_steps), trainer.n_steps // 10)
+        self.assertEqual(len(callback.end_steps), len(callback.begin_steps))
+        for begin, end in zip(callback.begin_steps, callback.end_steps):
+            self.assertLessEqual(begin, end)
+        self.assertIn(results['best_step'], callback.begin_steps)
+
+        # 不能deepcopy的模型, 同时保存最好的模型
+        save_path = 'test/save_models'
+        try:
+            trainer = Trainer(train_set, NonLeafAttrClassifier(2, 1), optimizer=SGD(lr=0.1),
+                              loss=BCELoss(pred="predict", target="y"), batch_size=32, n_epochs=2, print_every=50,
+                              dev_data=dev_set, validate_every=10, metrics=AccuracyMetric(pred="predict", target="y"),
+                              use_tqdm=False, async_validation=True, save_path=save_path)
+            trainer.train(load_best_model=True)
+            self.assertEqual(len(os.listdir(save_path)), 1)
+        finally:
+            shutil.rmtree(save_path, ignore_errors=True)
+
+    def test_async_validation_save_model(self):
+        # 后台验证时SaveModelCallback保存的是得到验证结果的模型, 而不是继续训练了若干step之后的模型
+        import torch
+        from fastNLP import Callback
+        from fastNLP.core.callback import SaveModelCallback
+        from fastNLP.core.utils import _torch_load
+
+        class RecordWeightsCallback(Callback):
+            def __init__(self):
+                super().__init__()
+                self.weights = {}
+
+            def on_valid_begin(self):
+                self.weights[self.step] = {name: tensor.detach().clone()
+                                           for name, tensor in self.model.state_dict().items()}
+
+        data_set = prepare_fake_dataset()
+        data_set.set_input("x", flag=True)
+        data_set.set_target("y", flag=True)
+        train_set, dev_set = data_set.split(0.3)
+        save_dir = 'test/save_models'
+        os.makedirs(save_dir, exist_ok=True)
+        record = RecordWeightsCallback()
+        try:
+            trainer = Trainer(train_set, NaiveClassifier(2, 1), optimizer=SGD(lr=0.1),
+                              loss=BCELoss(pred="predict", target="y"), batch_size=32, n_epochs=2, print_every=50,
+                              dev_data=dev_set, validate_every=10, metrics=AccuracyMetric(pred="predict", target="y"),
+                              use_tqdm=False, async_validation=True,
+                              callbacks=[record, SaveModelCallback(save_dir, top=-1, only_param=True)])
+            trainer.train(load_best_model=False)
+            model_dir = os.path.join(save_dir, os.listdir(save_dir)[0])
+            names = os.listdir(model_dir)
+            self.assertEqual(len(names), len(record.weights))
+            for name in names:
+                step = int(name.split('_')[1][len('step:'):])
+                states = _torch_load(os.path.join(model_dir, name))
+                self.assertEqual(set(states.keys()), set(record.weights[step].keys()))
+                for key, tensor in states.items():
+                    self.assertTrue(torch.equal(tensor, record.weights[step][key]))
+        finally:
+            shutil.rmtree(save_dir, ignore_errors=True)
+
+    def test_precision(self):
+        from fastNLP import GradientClipCallback
+        data_set = prepare_fake_dataset()
+        data_set.set_input("x", flag=True)
+        data_set.set_target("y", flag=True)
+        
+        model = NaiveClassifier(2, 1)
+        
+        trainer = Trainer(data_set, model, optimizer=SGD(lr=0.1), loss=BCELoss(pred="predict", target="y"),
+                          batch_size=32, n_epochs=2, print_every=50, update_every=2, precision='bf16',
+                          callbacks=[GradientClipCallback(clip_value=5)], use_tqdm=False)
+        self.assertIsNone(trainer.grad_scaler)
+        trainer.train()
+        
+        # cpu上不支持fp16，回退到bf16
+        with self.assertWarns(UserWarning):
+            trainer = Trainer(data_set, model, optimizer=SGD(lr=0.1), loss=BCELoss(pred="predict", target="y"),
+                              n_epochs=1, precision='fp16', use_tqdm=False)
+        self.assertIsNone(trainer.grad_scaler)
+        with self.assertRaises(ValueError):
+            Trainer(data_set, model, optimizer=SGD(lr=0.1), loss=BCELoss(pred="predict", target="y"),
+                    precision='int8', use_tqdm=False)
+    
     """
     def test_trainer_multiprocess(self):
         dataset = prepare_fake_dataset2('x1', 'x2')
@@ -6,9 +6,11 @@ from fastNLP import DataSet
 from fastNLP import Instance
 import time
 import os
+import shutil
 import torch
 from torch import nn
 from fastNLP.core.utils import _move_model_to_device, _get_model_device
+from fastNLP.core.utils import _ModelSnapshot, _torch_load
 import numpy as np
 from fastNLP.core.utils import seq_len_to_mask
 
@@ -212,6 +214,24 @@ class TestCache(unittest.TestCase):
             os.remove('test/demo1/demo.pkl')
             os.rmdir('test/demo1')
 
+    
+    def test_cache_mmap(self):
+        @cache_results('test/demo_mmap.pkl', _mmap=True)
+        def cache():
+            ds = DataSet({'x': [[1, 2], [3]], 'raw': ['a b', 'c']})
+            ds.set_input('x')
+            return ds, 1
+        
+        try:
+            ds, num = cache()
+            _ds, _num = cache()
+            self.assertEqual(num, _num)
+            self.assertTrue(_ds.x.columnar)
+            self.assertEqual(_ds.x.get([0, 1]).tolist(), ds.x.get([0, 1]).tolist())
+            self.assertEqual(_ds.raw.content, ds.raw.content)
+        finally:
+            os.remove('test/demo_mmap.pkl')
+            shutil.rmtree('test/demo_mmap.pkl_datasets')
 
 class TestSeqLenToMask(unittest.TestCase):
 
@@ -258,4 +278,93 @@ class TestSeqLenToMask(unittest.TestCase):
         # 3. pad到指定长度
         seq_len = torch.randint(1, 10, size=(10, ))
         mask = seq_len_to_mask(seq_len, 100)
-        self.assertEqual(100, mask.size(1))
\ No newline at end of file
+        self.assertEqual(100, mask.size(1))
+
+class NonLeafAttrModel(nn.Module):
+    # 含有非叶子节点tensor属性的模型(以及使用weight_norm的模型)无法deepcopy
+    def __init__(self):
+        super().__init__()
+        self.linear = nn.utils.weight_norm(nn.Linear(3, 4))
+        self.cache = self.linear.weight_v * 2
+
+    def forward(self, x):
+        return self.linear(x)
+
+
+class TestModelSnapshot(unittest.TestCase):
+    def test_update_and_save(self):
+        model = nn.Sequential(nn.Linear(3, 4), nn.BatchNorm1d(4))
+        snapshot = _ModelSnapshot()
+        self.assertIsNone(snapshot.state_dict())
+        snapshot.update(model)
+        data_ptrs = {name: tensor.data_ptr() for name, tensor in snapshot.state_dict().items()}
+        for name, tensor in model.state_dict().items():
+            self.assertTrue(torch.equal(snapshot.state_dict()[name], tensor))
+            self.assertNotEqual(snapshot.state_dict()[name].data_ptr(), tensor.data_ptr())
+
+        with torch.no_grad():
+            model[0].weight.add_(1)
+        self.assertFalse(torch.equal(snapshot.state_dict()['0.weight'], model[0].weight))
+        snapshot.update(model)
+        for name, tensor in snapshot.state_dict().items():  # 不会重新分配
+            self.assertEqual(tensor.data_ptr(), data_ptrs[name])
+        self.assertTrue(torch.equal(snapshot.state_dict()['0.weight'], model[0].weight))
+
+        path = 'test/snapshot_test.pt'
+        try:
+            snapshot.save(path, only_param=True)
+            snapshot.wait()
+            states = torch.load(path)
+            for name, tensor in model.state_dict().items():
+                self.assertTrue(torch.equal(states[name], tensor))
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+    def test_model_not_deepcopyable(self):
+        model = NonLeafAttrModel()
+        snapshot = _ModelSnapshot()
+        snapshot.update(model)
+        expected = {name: tensor.clone() for name, tensor in model.state_dict().items()}
+        with torch.no_grad():
+            model.linear.weight_v.add_(1)
+
+        path = 'test/snapshot_test.pt'
+        try:
+            snapshot.save(path)
+            snapshot.wait()
+            saved_model = _torch_load(path)
+            self.assertIsInstance(saved_model, NonLeafAttrModel)
+            for name, tensor in saved_model.state_dict().items():
+                self.assertTrue(torch.equal(tensor, expected[name]))
+            # 保存时临时替换的参数已经换回
+            self.assertFalse(torch.equal(model.linear.weight_v, expected['linear.weight_v']))
+            self.assertIsInstance(model.linear.weight_v, nn.Parameter)
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+        cpu_model = snapshot.get_model()
+        self.assertIsNot(cpu_model, model)
+        for name, tensor in cpu_model.state_dict().items():
+            self.assertTrue(torch.equal(tensor, expected[name]))
+        snapshot.update(model)
+        self.assertIs(snapshot.get_model(), cpu_model)
+        self.assertTrue(torch.equal(cpu_model.linear.weight_v, model.linear.weight_v))
+
+
+class TestBuildArgs(unittest.TestCase):
+    def test_build_args(self):
+        from fastNLP.core.utils import _build_args, _get_func_signature
+
+        class Model(nn.Module):
+            def forward(self, words, seq_len=None):
+                pass
+
+        model = Model()
+        for _ in range(2):  # 第二次使用缓存的结果
+            self.assertEqual(_build_args(model.forward, words=1, target=2), {'words': 1, 'seq_len': None})
+            self.assertEqual(_build_args(model.forward, words=1, seq_len=3), {'words': 1, 'seq_len': 3})
+        self.assertEqual(_build_args(lambda **kwargs: None, a=1), {'a': 1})
+        self.assertEqual(_get_func_signature(model.forward), 'Model.forward(self, words, seq_len=None)')
@@ -70,6 +70,17 @@ class TestAdd(unittest.TestCase):
             self.assertEqual(vocab.to_index(chr(start_char + i)), i + 2)
         vocab.index_dataset(dataset, field_name='char')
 
+    def test_from_dataset_num_proc(self):
+        dataset = DataSet({"words": [[chr(65 + i % 26)] * (i % 5 + 1) for i in range(100)]})
+        vocab = Vocabulary().from_dataset(dataset, field_name="words")
+        vocab_mp = Vocabulary().from_dataset(dataset, field_name="words", num_proc=3)
+        self.assertEqual(vocab.word_count, vocab_mp.word_count)
+        self.assertDictEqual(dict(vocab), dict(vocab_mp))
+        
+        vocab.index_dataset(dataset, field_name="words", new_field_name="words1")
+        vocab.index_dataset(dataset, field_name="words", new_field_name="words2", num_proc=3, chunk_size=7)
+        self.assertListEqual(dataset.get_field("words1").content, dataset.get_field("words2").content)
+    
     def test_from_dataset_no_entry(self):
         # 测试能否正确将no_create_entry正确设置
         dataset = DataSet()
@@ -88,6 +99,32 @@ class TestAdd(unittest.TestCase):
         for i in range(num_samples):
             self.assertEqual(True, vocab._is_word_no_create_entry(chr(start_char + i)+chr(start_char + i)))
 
+    def test_update_counter(self):
+        # 与逐个词调用add_word的结果相同
+        train = [["a", "b", "b"], ["c"]]
+        test = [["b", "d", "d"], ["e", "a"]]
+        vocab = Vocabulary()
+        for words in train:
+            for w in words:
+                vocab.add_word(w)
+        for words in test:
+            for w in words:
+                vocab.add_word(w, no_create_entry=True)
+        
+        vocab2 = Vocabulary().from_dataset(DataSet({"words": train}), field_name="words",
+                                           no_create_entry_dataset=DataSet({"words": test}), num_proc=2)
+        self.assertEqual(vocab.word_count, vocab2.word_count)
+        self.assertEqual(vocab._no_create_word, vocab2._no_create_word)
+        self.assertDictEqual(dict(vocab), dict(vocab2))
+        
+        # 增量更新时已有词的index不变
+        old_indices = dict(vocab2)
+        vocab2.update_counter(Counter(["f", "f", "d"]))
+        self.assertFalse(vocab2._is_word_no_create_entry("d"))
+        for word, idx in old_indices.items():
+            self.assertEqual(vocab2.to_index(word), idx)
+        self.assertEqual(vocab2.to_index("f"), len(old_indices))
+    
     def test_no_entry(self):
         # 先建立vocabulary，然后变化no_create_entry, 测试能否正确识别
         text = ["FastNLP", "works", "well", "in", "most", "cases", "and", "scales", "well", "in",
@@ -164,6 +201,32 @@ class TestIndexing(unittest.TestCase):
         for i in range(13):
             self.assertEqual(int(i)+2, vocab.to_index(str(i)))
 
+    def test_index_dataset(self):
+        vocab = Vocabulary()
+        vocab.add_word_lst(text)
+        dataset = DataSet({"words": [text[:i] + ["unseen"] for i in range(len(text))],
+                           "chars": [[list(w) for w in text[:i + 1]] for i in range(len(text))],
+                           "label": [text[i] for i in range(len(text))]})
+        dataset.set_input("words")
+        vocab.index_dataset(dataset, field_name="words", new_field_name="words_idx")
+        vocab.index_dataset(dataset, field_name="label")
+        vocab.index_dataset(dataset, field_name="chars")
+        for ins in dataset:
+            self.assertListEqual(ins["words_idx"], [vocab.to_index(w) for w in ins["words"]])
+            self.assertEqual(ins["words_idx"][-1], vocab.unknown_idx)
+        self.assertListEqual(dataset.get_field("label").content, [vocab.to_index(w) for w in text])
+        self.assertListEqual(dataset.get_field("chars")[1], [[vocab.unknown_idx] * len(w) for w in text[:2]])
+        
+        vocab.index_dataset(dataset, field_name="words", columnar=True)
+        self.assertTrue(dataset.get_field("words").columnar)
+        self.assertTrue(dataset.get_field("words").is_input)
+        self.assertListEqual(dataset.get_field("words").content.tolist(), dataset.get_field("words_idx").content)
+        
+        vocab = Vocabulary(unknown=None)
+        vocab.add_word_lst(text)
+        with self.assertRaises(ValueError):
+            vocab.index_dataset(DataSet({"words": [text, ["unseen"]]}), field_name="words")
+
 class TestOther(unittest.TestCase):
     def test_additional_update(self):
         vocab = Vocabulary()
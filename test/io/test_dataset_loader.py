@@ -22,6 +22,12 @@ class TestDatasetLoader(unittest.TestCase):
             .load('test/data_for_tests/tutorial_sample_dataset.csv')
         assert len(ds) > 0
     
+    def test_load_iter(self):
+        loader = CSVLoader(sep='\t', headers=['words', 'label'])
+        path = 'test/data_for_tests/tutorial_sample_dataset.csv'
+        instances = list(loader.load_iter(path))
+        self.assertEqual(len(instances), len(loader.load(path)))
+    
     def test_SNLILoader(self):
         ds = SNLILoader().load('test/data_for_tests/sample_snli.jsonl')
         assert len(ds) == 3
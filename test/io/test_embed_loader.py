@@ -1,3 +1,5 @@
+import os
+import shutil
 import unittest
 import numpy as np
 
@@ -38,6 +40,62 @@ class TestEmbedLoader(unittest.TestCase):
         for word in words:
             self.assertIn(word, vocab)
     
+    def test_load_with_vocab_cache(self):
+        vocab = Vocabulary()
+        vocab.add_word_lst(['the', 'of', 'none', 'in'])
+        cache_dir = 'test/embed_cache'
+        try:
+            for path in ["test/data_for_tests/glove.6B.50d_test.txt", "test/data_for_tests/word2vec_test.txt"]:
+                m = EmbedLoader.load_with_vocab(path, vocab, normalize=False)
+                for _ in range(2):  # 第一次转换, 第二次直接读取缓存
+                    c_m = EmbedLoader.load_with_vocab(path, vocab, normalize=False, cache_dir=cache_dir)
+                    self.assertEqual(c_m.shape, m.shape)
+                    for word in ['the', 'of', 'in']:
+                        idx = vocab.to_index(word)
+                        self.assertTrue(np.allclose(c_m[idx], m[idx]))
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+            words, vectors = EmbedLoader.build_cache("test/data_for_tests/glove.6B.50d_test.txt", cache_dir)
+            self.assertIsInstance(vectors, np.memmap)
+            self.assertEqual(vectors.shape, (len(words), 50))
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+    
+    def test_load_without_vocab_num_proc(self):
+        from fastNLP.io import embed_loader
+        path = 'test/embed_parallel_test.txt'
+        with open("test/data_for_tests/glove.6B.50d_test.txt", 'r', encoding='utf-8') as f:
+            lines = f.read().strip().split('\n')
+        chunk_size = embed_loader._EMBED_CHUNK_SIZE
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                # 包含一行维度不对的数据和一行无法转换为数字的数据
+                f.write('\n'.join(lines + ['bad 0.1 0.2', 'bad2 ' + ' '.join(['x'] * 50)] + lines[::-1]))
+            embed_loader._EMBED_CHUNK_SIZE = 1000
+            results = []
+            for num_proc in (0, 2):
+                np.random.seed(1)
+                results.append(EmbedLoader.load_without_vocab(path, normalize=False, num_proc=num_proc))
+            (m1, vocab1), (m2, vocab2) = results
+            self.assertDictEqual(dict(vocab1), dict(vocab2))
+            self.assertNotIn('bad', vocab1)
+            self.assertNotIn('bad2', vocab1)
+            self.assertTrue(np.allclose(m1, m2))
+            g_m, g_vocab = EmbedLoader.load_without_vocab("test/data_for_tests/glove.6B.50d_test.txt",
+                                                          normalize=False)
+            for word, idx in g_vocab:
+                if word not in ('<pad>', '<unk>'):
+                    self.assertTrue(np.allclose(m1[vocab1.to_index(word)], g_m[idx]))
+            with self.assertRaises(ValueError):
+                EmbedLoader.load_without_vocab(path, error='strict')
+            # error='ignore'时建立的缓存不会在error='strict'时被使用
+            EmbedLoader.build_cache(path, 'test/embed_cache')
+            with self.assertRaises(ValueError):
+                EmbedLoader.build_cache(path, 'test/embed_cache', error='strict')
+        finally:
+            shutil.rmtree('test/embed_cache', ignore_errors=True)
+            embed_loader._EMBED_CHUNK_SIZE = chunk_size
+            os.remove(path)
+    
     def test_read_all_glove(self):
         pass
         # TODO
@@ -1,6 +1,9 @@
 import unittest
 
-from fastNLP.models.biaffine_parser import BiaffineParser, ParserLoss, ParserMetric
+import numpy as np
+import torch
+
+from fastNLP.models.biaffine_parser import BiaffineParser, GraphParser, ParserLoss, ParserMetric, _mst, _find_cycle
 from .model_runner import *
 
 
@@ -45,3 +48,96 @@ class TestBiaffineParser(unittest.TestCase):
                                num_label=NUM_CLS, encoder='transformer')
         ds = prepare_parser_data()
         RUNNER.run_model(model, ds, loss=ParserLoss(), metrics=ParserMetric())
+
+    def test_train_eisner(self):
+        model = BiaffineParser(init_embed=(VOCAB_SIZE, 10),
+                               pos_vocab_size=VOCAB_SIZE, pos_emb_dim=10,
+                               rnn_hidden_size=10,
+                               arc_mlp_size=10,
+                               label_mlp_size=10,
+                               num_label=NUM_CLS, encoder='lstm', decoder='eisner')
+        ds = prepare_parser_data()
+        RUNNER.run_model(model, ds, loss=ParserLoss(), metrics=ParserMetric())
+
+    def test_train_mst_parallel(self):
+        model = BiaffineParser(init_embed=(VOCAB_SIZE, 10),
+                               pos_vocab_size=VOCAB_SIZE, pos_emb_dim=10,
+                               rnn_hidden_size=10,
+                               arc_mlp_size=10,
+                               label_mlp_size=10,
+                               num_label=NUM_CLS, encoder='lstm', decoder='mst_parallel', num_workers=2)
+        self.assertEqual(model.num_workers, 2)
+        ds = prepare_parser_data()
+        RUNNER.run_model(model, ds, loss=ParserLoss(), metrics=ParserMetric())
+
+
+def _is_tree(heads):
+    if sum(1 for head in heads[1:] if head == 0) != 1:
+        return False
+    for dep in range(1, len(heads)):
+        visited = set()
+        while dep != 0:
+            if dep in visited:
+                return False
+            visited.add(dep)
+            dep = heads[dep]
+    return True
+
+
+def _is_projective(heads):
+    for dep in range(1, len(heads)):
+        left, right = sorted((dep, heads[dep]))
+        for node in range(left + 1, right):
+            while node != 0 and node != heads[dep]:
+                node = heads[node]
+            if node != heads[dep]:
+                return False
+    return True
+
+
+class TestDecoder(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(1)
+        self.seq_len = torch.LongTensor([8, 5, 2, 7])
+        self.mask = (torch.arange(8)[None, :] < self.seq_len[:, None]).long()
+
+    def test_eisner(self):
+        scores = torch.randn(4, 8, 8)
+        heads = GraphParser.eisner_decoder(scores, self.mask)
+        self.assertEqual(heads.shape, (4, 8))
+        for i, length in enumerate(self.seq_len.tolist()):
+            self.assertTrue(_is_tree(heads[i, :length].tolist()))
+            self.assertTrue(_is_projective(heads[i, :length].tolist()))
+            self.assertEqual(heads[i, length:].sum().item(), 0)
+
+    def test_eisner_equal_mst(self):
+        # 分数集中在一棵projective的树上时两种解码结果相同
+        gold = torch.LongTensor([[0, 2, 0, 2, 5, 3, 5, 5],
+                                 [0, 0, 1, 2, 2, 0, 0, 0],
+                                 [0, 0, 0, 0, 0, 0, 0, 0],
+                                 [0, 3, 1, 0, 3, 6, 4, 0]])
+        scores = torch.randn(4, 8, 8) + 10 * torch.zeros(4, 8, 8).scatter_(2, gold.unsqueeze(2), 1)
+        eisner_heads = GraphParser.eisner_decoder(scores, self.mask)
+        mst_heads = GraphParser.mst_decoder(scores, self.mask)
+        self.assertEqual(eisner_heads.tolist(), (gold * self.mask).tolist())
+        self.assertEqual(mst_heads.tolist(), eisner_heads.tolist())
+
+    def test_mst_parallel(self):
+        scores = torch.randn(4, 8, 8)
+        heads = GraphParser.mst_decoder(scores, self.mask)
+        self.assertEqual(GraphParser.mst_decoder(scores, self.mask, num_workers=2).tolist(), heads.tolist())
+        for i, length in enumerate(self.seq_len.tolist()):
+            self.assertTrue(_is_tree(heads[i, :length].tolist()))
+
+    def test_find_cycle(self):
+        # 2->3->2 与 5->6->7->5 两个环, 4挂在环上
+        cycles = _find_cycle(np.array([0, 0, 3, 2, 3, 7, 5, 6]))
+        self.assertEqual([cycle.tolist() for cycle in cycles], [[2, 3], [5, 6, 7]])
+        self.assertEqual(_find_cycle(np.array([0, 0, 1, 1, 3])), [])
+
+    def test_mst_break_cycles(self):
+        # 正的随机分数下贪心的head选择大多含有环
+        rng = np.random.RandomState(0)
+        for _ in range(50):
+            heads = _mst(rng.rand(20, 20))
+            self.assertTrue(_is_tree(heads.tolist()))
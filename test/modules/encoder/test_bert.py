@@ -20,3 +20,179 @@ class TestBert(unittest.TestCase):
         for layer in all_encoder_layers:
             self.assertEqual(tuple(layer.shape), (2, 3, 768))
         self.assertEqual(tuple(pooled_output.shape), (2, 768))
+
+
+def _prepare_bert_dir():
+    # 在临时文件夹中生成一个很小的bert模型
+    import os
+    import tempfile
+    from fastNLP.modules.encoder._bert import BertConfig, BertModel as _BertModel, CONFIG_FILE
+
+    model_dir = tempfile.mkdtemp()
+    word_pieces = ['[PAD]', '[UNK]', '[CLS]', '[SEP]', 'the', 'play', '##ing', '##ed', 'un', '##able', '##s']
+    with open(os.path.join(model_dir, 'vocab.txt'), 'w', encoding='utf-8') as f:
+        f.write('\n'.join(word_pieces) + '\n')
+    config = BertConfig(len(word_pieces), hidden_size=16, num_hidden_layers=2, num_attention_heads=2,
+                        intermediate_size=32)
+    with open(os.path.join(model_dir, CONFIG_FILE), 'w', encoding='utf-8') as f:
+        f.write(config.to_json_string())
+    torch.save(_BertModel(config).state_dict(), os.path.join(model_dir, 'model.bin'))
+    return model_dir
+
+
+class TestWordBertModel(unittest.TestCase):
+    def setUp(self):
+        from fastNLP import Vocabulary
+
+        torch.manual_seed(0)
+        self.model_dir = _prepare_bert_dir()
+        self.vocab = Vocabulary()
+        self.vocab.add_word_lst(['the', 'playing', 'played', 'unable', 'plays', 'xyz'])
+        self.sentences = [['the', 'playing', 'unable', 'xyz'], ['played'], ['plays', 'the', 'unplayed']]
+        words = [[self.vocab.to_index(word) for word in sentence] for sentence in self.sentences]
+        max_len = max(map(len, words))
+        self.words = torch.LongTensor([word + [self.vocab.padding_idx] * (max_len - len(word)) for word in words])
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.model_dir)
+
+    def _reference(self, model, sentence):
+        # 逐句、不pad地计算每个word的表示
+        tokenizer = model.tokenzier
+        word_pieces = []
+        for word in sentence:
+            word = word if word in self.vocab else '[UNK]'
+            word_pieces.append(tokenizer.convert_tokens_to_ids(tokenizer.wordpiece_tokenizer.tokenize(word)))
+        ids = [model._cls_index] + [piece for pieces in word_pieces for piece in pieces] + [model._sep_index]
+        bert_outputs, _ = model.encoder(torch.LongTensor([ids]), output_all_encoded_layers=True)
+        outputs = []
+        for l in model.layers:
+            hidden = bert_outputs[l][0]
+            output, start = [], 1
+            for pieces in word_pieces:
+                piece_hidden = hidden[start:start + len(pieces)]
+                start += len(pieces)
+                output.append({'first': piece_hidden[0], 'last': piece_hidden[-1],
+                               'max': piece_hidden.max(dim=0)[0], 'avg': piece_hidden.mean(dim=0)}[model.pool_method])
+            if model.include_cls_sep:
+                output = [hidden[0]] + output + [hidden[-1]]
+            outputs.append(torch.stack(output))
+        return torch.stack(outputs)
+
+    def test_pool_method(self):
+        from fastNLP.modules.encoder._bert import _WordBertModel
+
+        for pool_method in ('first', 'last', 'max', 'avg'):
+            for include_cls_sep in (False, True):
+                model = _WordBertModel(self.model_dir, self.vocab, layers='0,-1', pool_method=pool_method,
+                                       include_cls_sep=include_cls_sep)
+                model.eval()
+                with torch.no_grad():
+                    outputs = model(self.words)
+                    shift = 2 if include_cls_sep else 0
+                    self.assertEqual(tuple(outputs.shape), (2, 3, self.words.size(1) + shift, 16))
+                    for i, sentence in enumerate(self.sentences):
+                        length = len(sentence) + shift
+                        reference = self._reference(model, sentence)
+                        self.assertTrue(torch.allclose(outputs[:, i, :length], reference, atol=1e-5))
+                        self.assertEqual(outputs[:, i, length:].abs().sum().item(), 0)
+
+    def test_word_to_wordpieces_buffer(self):
+        from fastNLP.modules.encoder._bert import _WordBertModel
+
+        model = _WordBertModel(self.model_dir, self.vocab)
+        self.assertNotIn('word_to_wordpieces', dict(model.named_parameters()))
+        self.assertIn('word_to_wordpieces', model.state_dict())
+        # 没有word_to_wordpieces的旧state_dict也可以strict地载入
+        table = model.word_to_wordpieces.clone()
+        state_dict = model.state_dict()
+        state_dict.pop('word_to_wordpieces')
+        new_model = _WordBertModel(self.model_dir, self.vocab)
+        new_model.load_state_dict(state_dict)
+        self.assertTrue(torch.equal(new_model.word_to_wordpieces, table))
+
+
+class TestSentenceCache(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        from fastNLP import DataSet, Vocabulary
+
+        torch.manual_seed(0)
+        self.model_dir = _prepare_bert_dir()
+        self.cache_dir = tempfile.mkdtemp()
+        self.vocab = Vocabulary()
+        self.vocab.add_word_lst(['the', 'playing', 'played', 'unable', 'plays'])
+        sentences = [['the', 'playing', 'unable'], ['played'], ['plays', 'the', 'played', 'the'], ['unable', 'the']]
+        self.data_set = DataSet({'words': [[self.vocab.to_index(word) for word in sentence]
+                                           for sentence in sentences]})
+        self.data_set.set_input('words')
+        max_len = max(map(len, self.data_set['words']))
+        self.words = torch.LongTensor([words + [self.vocab.padding_idx] * (max_len - len(words))
+                                       for words in self.data_set['words']])
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.model_dir)
+        shutil.rmtree(self.cache_dir)
+
+    def _get_embed(self, include_cls_sep=False):
+        from fastNLP.modules.encoder.embedding import BertEmbedding
+        embed = BertEmbedding(self.vocab, model_dir_or_name=self.model_dir, layers='0,-1',
+                              include_cls_sep=include_cls_sep)
+        embed.eval()
+        return embed
+
+    def test_cache_copies_embed(self):
+        # 缓存的表示不能与整个batch的输出共享内存
+        import numpy as np
+        from fastNLP.modules.encoder.embedding import _SentenceCache
+        word_embeds = np.random.rand(2, 5, 4).astype(np.float32)
+        cache = _SentenceCache(4, cache_size=2)
+        key = cache.key([1, 2, 3])
+        cache.add(key, word_embeds[0, :3])
+        stored = cache.get(key)
+        self.assertFalse(np.shares_memory(stored.numpy(), word_embeds))
+        self.assertTrue(np.array_equal(stored.numpy(), word_embeds[0, :3]))
+
+    def test_memory_cache(self):
+        for include_cls_sep in (False, True):
+            embed = self._get_embed(include_cls_sep)
+            with torch.no_grad():
+                expected = embed(self.words)
+            embed.add_sentence_cache(self.data_set, batch_size=3, delete_weights=True)
+            self.assertFalse(hasattr(embed, 'model'))
+            self.assertTrue(torch.allclose(embed(self.words), expected, atol=1e-6))
+            self.assertTrue(torch.allclose(embed(self.words[2:]), expected[2:], atol=1e-6))
+            with self.assertRaises(KeyError):
+                embed(self.words[:, :1])
+
+    def test_bounded_cache(self):
+        embed = self._get_embed()
+        with torch.no_grad():
+            expected = embed(self.words)
+        with self.assertRaises(ValueError):
+            embed.add_sentence_cache(self.data_set, cache_size=2)
+        embed.add_sentence_cache(self.data_set, batch_size=3, delete_weights=False, cache_size=2)
+        self.assertEqual(len(embed.sent_embeds), 2)
+        # 不在缓存中的句子由模型重新计算
+        with torch.no_grad():
+            self.assertTrue(torch.allclose(embed(self.words), expected, atol=1e-6))
+
+    def test_disk_cache(self):
+        embed = self._get_embed()
+        with torch.no_grad():
+            expected = embed(self.words)
+        embed.add_sentence_cache(self.data_set, batch_size=3, cache_size=1, cache_dir=self.cache_dir)
+        self.assertEqual(len(embed.sent_embeds), 4)
+        self.assertTrue(torch.allclose(embed(self.words), expected, atol=1e-6))
+
+        # 新的embedding直接复用硬盘上的缓存, 不会再调用模型
+        embed = self._get_embed()
+
+        def forward(*args, **kwargs):
+            raise RuntimeError("Should not be called.")
+
+        embed.model.forward = forward
+        embed.add_sentence_cache(self.data_set, batch_size=3, cache_size=1, cache_dir=self.cache_dir)
+        self.assertTrue(torch.allclose(embed(self.words), expected, atol=1e-6))